@@ -1,8 +1,47 @@
 from django.contrib import admin
-from .models import Car
+from django.contrib.auth.models import User
+from django.db import transaction
+from .bulk import delete_cars
+from .cache import invalidate_user_data
+from .changes import start_car_write
+from .models import Car, ImportJob
+from .summary import record_changes
 
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
+    """
+    Zapis i usuwanie tą samą drogą co API (perform_create / perform_update, delete_cars):
+    updated_at i ślady usunięć dla feedu zmian, podsumowanie statystyk i wersja danych.
+    """
     list_display = ('mark', 'model', 'year', 'fuel', 'price')
     list_filter = ('mark', 'fuel', 'year')
-    search_fields = ('mark', 'model', 'city', 'province')
\ No newline at end of file
+    search_fields = ('mark__name', 'model__name', 'city__name', 'province__name')
+
+    def get_readonly_fields(self, request, obj=None):
+        # Przeniesienie samochodu do innego użytkownika wymagałoby śladu usunięcia i zmiany dwóch podsumowań
+        return ('user',) if obj is not None else ()
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            now = start_car_write()
+            if change:
+                previous = Car.objects.get(pk=obj.pk)
+                obj.updated_at = now
+                obj.save()
+                record_changes(obj.user_id, added=[obj], removed=[previous])
+            else:
+                obj.save()
+                record_changes(obj.user_id, added=[obj])
+        invalidate_user_data(obj.user_id)
+
+    def delete_model(self, request, obj):
+        delete_cars(obj.user, Car.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        for user in User.objects.filter(pk__in=queryset.values('user_id')):
+            delete_cars(user, queryset)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'user', 'status', 'mode', 'rows_processed', 'rows_rejected', 'created_at')
+    list_filter = ('status',)
@@ -2,4 +2,10 @@ from django.apps import AppConfig
 
 class CarAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'car_app'
\ No newline at end of file
+    name = 'car_app'
+
+    def ready(self):
+        # Sygnały unieważniające pamięć tokenów (zmiana hasła, usunięcie konta, nowy token)
+        from . import authentication  # noqa: F401
+        # Pomiar czasu zapytań SQL na każdym nowym połączeniu z bazą
+        from . import instrumentation  # noqa: F401
\ No newline at end of file
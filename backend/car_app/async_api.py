@@ -0,0 +1,48 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from .renderers import ORJSONRenderer
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    """
+    Odpowiedź JSON dla widoków async - ten sam renderer co w DRF, więc treść
+    jest identyczna jak w widokach synchronicznych. ``data`` jak w Response DRF
+    (korzysta z niego cache_per_user).
+    """
+    response = HttpResponse(ORJSONRenderer().render(data), content_type='application/json', status=status)
+    response.data = data
+    return response
+
+
+def _error_response(request, exc):
+    response = json_response({'detail': exc.detail}, status=exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = request.authenticators[0].authenticate_header(request)
+    return response
+
+
+def async_api_view(view):
+    """
+    Odpowiednik ``@api_view(['GET'])`` z ``IsAuthenticated`` dla widoków async
+    (DRF obsługuje tylko widoki synchroniczne). Użytkownik jest uwierzytelniany
+    tymi samymi klasami co w DRF, a widok dostaje Request DRF (``user``, ``query_params``).
+    """
+    @require_GET
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        try:
+            # Token i sesja są odczytywane synchronicznie (cache, baza)
+            user = await sync_to_async(lambda: request.user)()
+        except APIException as e:
+            return _error_response(request, e)
+        if not user.is_authenticated:
+            return _error_response(request, NotAuthenticated())
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,109 @@
+"""
+Wersje async endpointów, które głównie czekają na bazę lub na klienta (eksporty,
+statystyki, unikalne wartości, ostatnie samochody). Podłączane w urls.py, gdy
+aplikacja działa pod ASGI (SERVE_ASGI) - wolny eksport nie zajmuje wtedy wątku
+na cały czas pobierania pliku. Odpowiedzi są identyczne jak w views.py.
+"""
+import logging
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from rest_framework import status
+from .async_api import async_api_view, json_response
+from .cache import cache_per_user, etag_per_user
+from .dimensions import dimension_model, dimension_names
+from .exports import astream_csv, astream_json, astream_ndjson, astream_parquet, export_filename
+from .models import Car
+from .serializers import car_values, represent_cars
+from .statistics import asummary_statistics
+from .views import filter_cars
+
+logger = logging.getLogger(__name__)
+
+
+def _error(view_name, e):
+    logger.exception('Error in %s', view_name)
+    return json_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _attachment(response, filename):
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+@async_api_view
+@etag_per_user('export-csv')
+async def export_csv(request):
+    """Eksport CSV (jak views.export_csv) strumieniowany asynchronicznie."""
+    try:
+        # Filtry po nazwach odpytują słowniki - budowa zapytania w wątku
+        queryset = await sync_to_async(filter_cars)(request)
+        response = StreamingHttpResponse(astream_csv(queryset), content_type='text/csv; charset=utf-8')
+        return _attachment(response, export_filename('csv'))
+    except Exception as e:
+        return _error('export_csv', e)
+
+
+@async_api_view
+@etag_per_user('export-json')
+async def export_json(request):
+    """Eksport JSON lub NDJSON (?layout=ndjson) strumieniowany asynchronicznie."""
+    try:
+        queryset = await sync_to_async(filter_cars)(request)
+        if request.query_params.get('layout') == 'ndjson':
+            response = StreamingHttpResponse(astream_ndjson(queryset), content_type='application/x-ndjson; charset=utf-8')
+            return _attachment(response, export_filename('ndjson'))
+        response = StreamingHttpResponse(astream_json(queryset), content_type='application/json; charset=utf-8')
+        return _attachment(response, export_filename('json'))
+    except Exception as e:
+        return _error('export_json', e)
+
+
+@async_api_view
+@etag_per_user('export-parquet')
+async def export_parquet(request):
+    """Eksport Parquet strumieniowany grupami wierszy - zapis każdej grupy w wątku (pyarrow)."""
+    try:
+        queryset = await sync_to_async(filter_cars)(request)
+        response = StreamingHttpResponse(astream_parquet(queryset), content_type='application/vnd.apache.parquet')
+        return _attachment(response, export_filename('parquet'))
+    except Exception as e:
+        return _error('export_parquet', e)
+
+
+@async_api_view
+@etag_per_user('statistics')
+@cache_per_user('statistics')
+async def get_statistics(request):
+    return json_response(await asummary_statistics(request.user))
+
+
+@async_api_view
+@etag_per_user('distinct')
+@cache_per_user('distinct')
+async def get_distinct_values(request):
+    """Unikalne marki i rodzaje paliwa samochodów użytkownika."""
+    user_cars = Car.objects.filter(user=request.user)
+    try:
+        distinct = {}
+        for field, key in (('mark', 'marks'), ('fuel', 'fuels')):
+            ids = [pk async for pk in user_cars.order_by().values_list(field, flat=True).distinct()]
+            names = await sync_to_async(dimension_names)(dimension_model(field), ids)
+            distinct[key] = sorted(name for name in names.values() if name)
+        return json_response(distinct)
+    except Exception as e:
+        return json_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@async_api_view
+@etag_per_user('recent-cars')
+@cache_per_user('recent-cars')
+async def get_recent_cars(request):
+    """Ostatnie 5 dodanych samochodów."""
+    try:
+        recent_cars = [row async for row in car_values(Car.objects.filter(user=request.user).order_by('-id')[:5])]
+        # Nazwy słownikowe mogą wymagać zapytania - w wątku
+        data = await sync_to_async(represent_cars)(recent_cars)
+        return json_response(data)
+    except Exception as e:
+        return json_response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,142 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from prometheus_client import Counter
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+DEFAULT_TOKEN_CACHE_TIMEOUT = 300
+
+token_cache_requests = Counter(
+    'car_auth_token_cache_requests_total',
+    'Uwierzytelnienia tokenem obsłużone z pamięci procesu (hit) lub z bazy (miss).',
+    ['result'],
+)
+
+
+def _timeout():
+    return getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', DEFAULT_TOKEN_CACHE_TIMEOUT)
+
+
+def _version_key(key):
+    # Skrót zamiast samego tokenu - klucz współdzielonego cache nie ujawnia tokenu
+    return f'car-auth-version:{hashlib.sha1(key.encode()).hexdigest()}'
+
+
+def _current_version(key):
+    """
+    Wersja tokenu, a gdy jej jeszcze nie ma - nowa (znacznik czasu) zapisana przez add().
+    Wpis nie może pamiętać wersji None: gdyby cache usunął później podbitą wersję
+    (wygaśnięcie, culling), odczyt znów dałby None i unieważniony token by pasował.
+    Gdy wersji nie da się zapisać, wynik z bazy nie jest zapamiętywany.
+    """
+    version_key = _version_key(key)
+    version = cache.get(version_key)
+    if version is None:
+        # Wersja musi przeżyć wpis (TTL) - jak przy podbiciu
+        cache.add(version_key, time.time_ns(), _timeout() * 2)
+        version = cache.get(version_key)
+    return version
+
+
+class TokenCache:
+    """
+    Pamięć procesu token -> (użytkownik, token) z limitem wpisów (LRU) i czasem życia.
+
+    Wpis pamięta wersję tokenu ze współdzielonego cache Django odczytaną przed
+    zapytaniem do bazy. Podbicie wersji (zmiana hasła, usunięcie konta, nowy token)
+    unieważnia wpis od razu we wszystkich procesach, nie dopiero po upływie TTL.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, token, version, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        if cache.get(_version_key(key)) != version:
+            self.discard(key)
+            return None
+        return user, token
+
+    def set(self, key, user, token, version):
+        size = getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', DEFAULT_TOKEN_CACHE_SIZE)
+        with self._lock:
+            self._entries[key] = (user, token, version, time.monotonic() + _timeout())
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+token_cache = TokenCache()
+
+
+def invalidate_token(key):
+    """
+    Usuwa token z pamięci procesu, a po zatwierdzeniu transakcji podbija jego wersję -
+    wpis odczytany z bazy przed zatwierdzeniem nie przetrwa w żadnym procesie.
+    """
+    token_cache.discard(key)
+
+    def bump():
+        # Wersja musi przeżyć najdłuższy wpis (TTL), później może wygasnąć
+        cache.set(_version_key(key), time.time_ns(), _timeout() * 2)
+        token_cache.discard(key)
+    transaction.on_commit(bump)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication bez zapytania Token + User przy każdym żądaniu - wynik
+    jest trzymany w pamięci procesu (TokenCache). Nieprawidłowe tokeny nie są
+    zapamiętywane, więc błędy uwierzytelnienia zawsze pochodzą z bazy.
+    """
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            token_cache_requests.labels(result='hit').inc()
+            user, token = cached
+        else:
+            token_cache_requests.labels(result='miss').inc()
+            version = _current_version(key)
+            user, token = super().authenticate_credentials(key)
+            if version is not None:
+                token_cache.set(key, user, token, version)
+        # Widok może zmieniać request.user (np. set_password) - każde żądanie dostaje własną kopię
+        return copy.copy(user), token
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Zmiana hasła, dezaktywacja konta lub danych profilu (request.user z pamięci byłby nieaktualny)
+    for key in Token.objects.filter(user_id=instance.pk).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    # Usunięcie tokenu (także kaskadowe przy usuwaniu konta) i jego wymiana
+    invalidate_token(instance.key)
@@ -0,0 +1,241 @@
+import copy
+from django.core.exceptions import EmptyResultSet
+from django.db import IntegrityError, connection, transaction
+from .cache import invalidate_user_data
+from .changes import start_car_write
+from .models import Car, CarDeletion
+from .serializers import EXTERNAL_ID_TAKEN_MESSAGE, CarSerializer, is_external_id_conflict, resolve_dimensions
+from .summary import record_changes
+
+BULK_BATCH_SIZE = 1000
+
+NOT_FOUND_MESSAGE = 'Nie znaleziono pojazdu.'
+FORBIDDEN_MESSAGE = 'Brak uprawnień do edycji tego pojazdu.'
+DUPLICATE_MESSAGE = 'Identyfikator powtarza się w żądaniu.'
+DUPLICATE_EXTERNAL_ID_MESSAGE = 'external_id powtarza się w żądaniu.'
+MISSING_ID_MESSAGE = 'Brak identyfikatora pojazdu.'
+
+
+def parse_id(value):
+    """Identyfikator samochodu z danych żądania (liczba lub tekst z liczbą); None gdy niepoprawny."""
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def taken_external_ids(user, items):
+    """
+    external_id -> id samochodu użytkownika dla external_id występujących w elementach -
+    jedno zapytanie zamiast osobnego w walidacji każdego elementu (kontekst CarSerializer).
+    """
+    values = {parse_id(item.get('external_id')) for item in items if isinstance(item, dict)} - {None}
+    return dict(Car.objects.filter(user=user, external_id__in=values).values_list('external_id', 'id'))
+
+
+def duplicate_external_id(validated_data, seen):
+    """Czy external_id elementu powtarza się we wcześniejszym elemencie tego samego żądania."""
+    external_id = validated_data.get('external_id')
+    if external_id is None:
+        return False
+    if external_id in seen:
+        return True
+    seen.add(external_id)
+    return False
+
+
+def _create(user, valid):
+    with transaction.atomic():
+        start_car_write()
+        values = resolve_dimensions([data for _, data in valid])
+        cars = [(index, Car(user=user, **data)) for (index, _), data in zip(valid, values)]
+        Car.objects.bulk_create([car for _, car in cars], batch_size=BULK_BATCH_SIZE)
+        record_changes(user.pk, added=[car for _, car in cars])
+    return cars
+
+
+def bulk_create_cars(user, items):
+    """
+    Waliduje każdy element osobno i zapisuje poprawne jednym bulk_create.
+    Zwraca listę wyników w kolejności elementów: utworzony samochód albo błędy.
+    """
+    results = [None] * len(items)
+    context = {'external_ids': taken_external_ids(user, items)}
+    valid = []
+    seen = set()
+    for index, item in enumerate(items):
+        serializer = CarSerializer(data=item, context=context)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'errors': serializer.errors}
+        elif duplicate_external_id(serializer.validated_data, seen):
+            results[index] = {'index': index, 'errors': {'external_id': [DUPLICATE_EXTERNAL_ID_MESSAGE]}}
+        else:
+            valid.append((index, serializer.validated_data))
+
+    cars = []
+    if valid:
+        try:
+            cars = _create(user, valid)
+        except IntegrityError as error:
+            if not is_external_id_conflict(error):
+                raise
+            # Równoległy zapis zajął external_id po walidacji - zapis po jednym,
+            # konflikty jako błędy elementów zamiast odrzucenia całej partii
+            for index, data in valid:
+                try:
+                    cars += _create(user, [(index, data)])
+                except IntegrityError as error:
+                    if not is_external_id_conflict(error):
+                        raise
+                    results[index] = {'index': index, 'errors': {'external_id': [EXTERNAL_ID_TAKEN_MESSAGE]}}
+        if cars:
+            invalidate_user_data(user.pk)
+
+    for index, car in cars:
+        results[index] = {'index': index, 'status': 'created', 'car': CarSerializer(car).data}
+    return results
+
+
+def _update(user, changes, fields):
+    """Zapisuje zmiany (indeks, samochód sprzed zmiany, validated_data); zwraca (indeks, samochód, poprzedni)."""
+    with transaction.atomic():
+        now = start_car_write()
+        updated = []
+        for (index, previous, _), values in zip(changes, resolve_dimensions([data for _, _, data in changes])):
+            car = copy.copy(previous)
+            for attr, value in values.items():
+                setattr(car, attr, value)
+            car.updated_at = now
+            updated.append((index, car, previous))
+        Car.objects.filter(user=user).bulk_update([car for _, car, _ in updated], sorted(fields) + ['updated_at'], batch_size=BULK_BATCH_SIZE)
+        record_changes(
+            user.pk,
+            added=[car for _, car, _ in updated],
+            removed=[previous for _, _, previous in updated],
+        )
+    return updated
+
+
+def bulk_update_cars(user, items, partial=False):
+    """
+    Aktualizuje samochody wskazane polem ``id`` - jedno zapytanie po wiersze,
+    jedno bulk_update. Tak jak w CarViewSet.update można zmieniać tylko własne samochody.
+    """
+    results = [None] * len(items)
+    ids = [parse_id(item.get('id')) if isinstance(item, dict) else None for item in items]
+    # Bez filtra po użytkowniku - cudzy samochód ma dostać błąd uprawnień, a nie "nie znaleziono"
+    existing = Car.objects.in_bulk([pk for pk in ids if pk is not None])
+    context = {'external_ids': taken_external_ids(user, items)}
+
+    seen = set()
+    seen_external_ids = set()
+    changes = []
+    fields = set()
+    for index, (item, pk) in enumerate(zip(items, ids)):
+        car = existing.get(pk)
+        if pk is None:
+            results[index] = {'index': index, 'errors': {'id': [MISSING_ID_MESSAGE]}}
+        elif pk in seen:
+            results[index] = {'index': index, 'id': pk, 'errors': {'id': [DUPLICATE_MESSAGE]}}
+        elif car is None:
+            results[index] = {'index': index, 'id': pk, 'errors': {'id': [NOT_FOUND_MESSAGE]}}
+        elif car.user_id != user.pk:
+            results[index] = {'index': index, 'id': pk, 'errors': {'id': [FORBIDDEN_MESSAGE]}}
+        else:
+            seen.add(pk)
+            serializer = CarSerializer(car, data=item, partial=partial, context=context)
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'id': pk, 'errors': serializer.errors}
+                continue
+            if duplicate_external_id(serializer.validated_data, seen_external_ids):
+                results[index] = {'index': index, 'id': pk, 'errors': {'external_id': [DUPLICATE_EXTERNAL_ID_MESSAGE]}}
+                continue
+            fields.update(serializer.validated_data)
+            changes.append((index, car, serializer.validated_data))
+
+    # Bez zmienionych pól (pusty PATCH) samochody zostają bez zapisu
+    updated = changes
+    if changes and fields:
+        try:
+            updated = _update(user, changes, fields)
+        except IntegrityError as error:
+            if not is_external_id_conflict(error):
+                raise
+            # Jak przy tworzeniu - po jednym, konflikt external_id jako błąd elementu
+            saved = []
+            for change in changes:
+                try:
+                    saved += _update(user, [change], fields)
+                except IntegrityError as error:
+                    if not is_external_id_conflict(error):
+                        raise
+                    index, car, _ = change
+                    results[index] = {'index': index, 'id': car.pk, 'errors': {'external_id': [EXTERNAL_ID_TAKEN_MESSAGE]}}
+            updated = saved
+        if updated:
+            invalidate_user_data(user.pk)
+
+    for index, car, _ in updated:
+        results[index] = {'index': index, 'id': car.pk, 'status': 'updated', 'car': CarSerializer(car).data}
+    return results
+
+
+# Kolumny potrzebne do pomniejszenia podsumowania statystyk o usunięte wiersze
+DELETED_FIELDS = ['id', 'year', 'mileage', 'price', 'mark', 'fuel', 'province']
+
+
+def delete_cars(user, queryset):
+    """
+    Usuwa samochody jednym poleceniem DELETE ... RETURNING - zwrócone wiersze
+    pomniejszają podsumowanie bez wcześniejszego ich odczytu, a w tym samym
+    poleceniu powstają ślady usunięć dla feedu zmian. Zwraca usunięte id.
+    """
+    # Warunek na user_id także w zewnętrznym DELETE - zawęża je do partycji użytkownika
+    try:
+        sql, params = queryset.filter(user=user).order_by().values('id').query.sql_with_params()
+    except EmptyResultSet:
+        return []
+
+    quote = connection.ops.quote_name
+    columns = [Car._meta.get_field(name) for name in DELETED_FIELDS]
+    returned = ', '.join(quote(field.column) for field in columns)
+    with transaction.atomic():
+        start_car_write()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'''
+                WITH deleted AS (
+                    DELETE FROM {quote(Car._meta.db_table)} WHERE {quote("user_id")} = %s AND {quote("id")} IN ({sql})
+                    RETURNING {quote("user_id")}, {quote("external_id")}, {returned}
+                ), tombstones AS (
+                    INSERT INTO {quote(CarDeletion._meta.db_table)} ({quote("user_id")}, {quote("car_id")}, {quote("external_id")})
+                    SELECT {quote("user_id")}, {quote("id")}, {quote("external_id")} FROM deleted
+                )
+                SELECT {returned} FROM deleted
+                ''',
+                [user.pk, *params],
+            )
+            rows = cursor.fetchall()
+        removed = [Car(user=user, **{field.attname: value for field, value in zip(columns, row)}) for row in rows]
+        record_changes(user.pk, removed=removed)
+    if removed:
+        invalidate_user_data(user.pk)
+    return [car.pk for car in removed]
+
+
+def bulk_delete_cars(user, ids):
+    """Usuwa samochody z listy id; dla każdego id zwraca wynik albo błąd (nie znaleziono / brak uprawnień)."""
+    owners = dict(Car.objects.filter(id__in=ids).values_list('id', 'user_id'))
+    deleted = set(delete_cars(user, Car.objects.filter(id__in=[pk for pk in ids if owners.get(pk) == user.pk])))
+
+    results = []
+    for pk in ids:
+        if pk in deleted:
+            results.append({'id': pk, 'status': 'deleted'})
+        elif pk in owners and owners[pk] != user.pk:
+            results.append({'id': pk, 'errors': {'id': [FORBIDDEN_MESSAGE]}})
+        else:
+            results.append({'id': pk, 'errors': {'id': [NOT_FOUND_MESSAGE]}})
+    return results
@@ -0,0 +1,153 @@
+import hashlib
+import time
+from functools import wraps
+from inspect import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from prometheus_client import Counter
+from rest_framework.response import Response
+from .async_api import json_response
+
+
+def _version_key(user_id):
+    return f'car-data-version:{user_id}'
+
+
+def get_data_version(user_id):
+    """
+    Zwraca wersję danych użytkownika. Wersja jest częścią kluczy cache,
+    więc jej zmiana unieważnia od razu wszystkie wpisy danego użytkownika.
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Znacznik czasu zamiast licznika - po utracie klucza nie wrócimy do starej wersji
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_data_version(user_id):
+    """Asynchroniczna wersja ``get_data_version``."""
+    key = _version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_data_version(user_id):
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_user_data(user_id):
+    """Unieważnia cache użytkownika po zatwierdzeniu bieżącej transakcji."""
+    transaction.on_commit(lambda: bump_data_version(user_id))
+
+
+response_cache_requests = Counter(
+    'car_response_cache_requests_total',
+    'Odpowiedzi API obsłużone z cache (hit) lub policzone od nowa (miss).',
+    ['endpoint', 'result'],
+)
+
+
+def _response_key(endpoint, request, version):
+    query = hashlib.sha1(request.META.get('QUERY_STRING', '').encode()).hexdigest()
+    return f'car-response:{endpoint}:{request.user.pk}:{version}:{query}'
+
+
+def cache_per_user(endpoint):
+    """
+    Dekorator widoków GET przechowujący ``response.data`` w cache pod kluczem
+    (użytkownik, wersja danych, parametry zapytania). Zapis danych użytkownika
+    podbija wersję, więc nieaktualne odpowiedzi nigdy nie są zwracane.
+    Widoki async (async_views) współdzielą z synchronicznymi te same wpisy.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key = _response_key(endpoint, request, await aget_data_version(request.user.pk))
+
+                cached = await cache.aget(key)
+                if cached is not None:
+                    response_cache_requests.labels(endpoint=endpoint, result='hit').inc()
+                    return json_response(cached['data'])
+
+                response_cache_requests.labels(endpoint=endpoint, result='miss').inc()
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    await cache.aset(key, {'data': response.data}, settings.RESPONSE_CACHE_TIMEOUT)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = _response_key(endpoint, request, get_data_version(request.user.pk))
+
+            cached = cache.get(key)
+            if cached is not None:
+                response_cache_requests.labels(endpoint=endpoint, result='hit').inc()
+                return Response(cached['data'])
+
+            response_cache_requests.labels(endpoint=endpoint, result='miss').inc()
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, {'data': response.data}, settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(endpoint, request, version):
+    # Okres RESPONSE_CACHE_TIMEOUT w ETagu - znacznik nie jest ważny dłużej niż odpowiedź w cache
+    # (statystyki zależą też od bieżącego roku, liczności od oszacowań planera)
+    period = int(time.time() // settings.RESPONSE_CACHE_TIMEOUT) if settings.RESPONSE_CACHE_TIMEOUT else 0
+    signature = '|'.join([
+        endpoint, str(request.user.pk), str(version), str(period),
+        request.META.get('QUERY_STRING', ''), request.META.get('HTTP_ACCEPT', ''),
+    ])
+    # Słaby ETag - ta sama wersja danych, ale bajty zależą np. od kompresji
+    return 'W/"%s"' % hashlib.sha1(signature.encode()).hexdigest()
+
+
+def _tag(response, etag):
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        # Przeglądarka pyta za każdym razem (If-None-Match), treść pobiera tylko po zmianie danych
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie'))
+    return response
+
+
+def etag_per_user(endpoint):
+    """
+    Dekorator widoków GET dodający ETag z wersji danych użytkownika. Gdy klient
+    odsyła aktualny ETag w If-None-Match, odpowiedź 304 powstaje bez wykonania
+    widoku - bez zapytań do bazy, tylko odczyt wersji z cache. Zmiana danych
+    podbija wersję, więc ETag przestaje pasować. Obsługuje widoki async.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag = _etag(endpoint, request, await aget_data_version(request.user.pk))
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _tag(response, etag)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag = _etag(endpoint, request, get_data_version(request.user.pk))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _tag(response, etag)
+        return wrapper
+    return decorator
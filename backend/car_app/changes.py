@@ -0,0 +1,145 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from .models import Car, CarDeletion
+from .serializers import CarDeletionSerializer, car_values, represent_cars
+
+DEFAULT_CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+
+# Klucz blokady doradczej, którą trzyma każda transakcja zapisująca samochody lub ślady usunięć
+CAR_WRITE_LOCK_KEY = 0x63617273
+
+
+def start_car_write():
+    """
+    Zgłasza bieżącą transakcję jako zapis samochodów (współdzielona blokada doradcza
+    do końca transakcji) i zwraca czas bazy po jej uzyskaniu - znacznik updated_at.
+    Wywoływać w transaction.atomic() przed pierwszym zapisem samochodów: wiersze
+    z COPY/upsertu i ślady usunięć dostają czas późniejszych poleceń (statement_timestamp()).
+    """
+    if connection.vendor != 'postgresql':
+        return timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [CAR_WRITE_LOCK_KEY])
+        cursor.execute('SELECT clock_timestamp()')
+        return cursor.fetchone()[0]
+
+
+def changes_boundary():
+    """
+    Górna granica feedu: start najstarszej trwającej transakcji zapisu samochodów
+    (z blokadą start_car_write), a bez takich - bieżąca chwila. Wiersz zapisany
+    w transakcji w toku ma znacznik >= tej granicy, więc nie zostanie pominięty,
+    gdy zatwierdzi się po odczycie; transakcja, która zacznie zapis później, nada
+    znaczniki późniejsze od odczytu. Pozostałe transakcje (także długie lub
+    bezczynne sesje innych narzędzi) nie wstrzymują feedu. Własna transakcja jest
+    pomijana - jej zapisy są widoczne. Widoczność xact_start innych sesji wymaga
+    tej samej roli lub pg_read_all_stats.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        # Chwila odczytana przed listą blokad - zapis zgłoszony później ma znacznik od niej późniejszy
+        cursor.execute('SELECT clock_timestamp()')
+        now = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT min(activity.xact_start) FROM pg_locks lock "
+            "JOIN pg_stat_activity activity ON activity.pid = lock.pid "
+            "WHERE lock.locktype = 'advisory' AND lock.granted AND lock.pid <> pg_backend_pid() "
+            "AND lock.database = (SELECT oid FROM pg_database WHERE datname = current_database()) "
+            # Klucz bigint: górna połowa w classid, dolna w objid, objsubid = 1
+            "AND lock.classid = %s AND lock.objid = %s AND lock.objsubid = 1",
+            [CAR_WRITE_LOCK_KEY >> 32, CAR_WRITE_LOCK_KEY & 0xFFFFFFFF],
+        )
+        oldest = cursor.fetchone()[0]
+    return min(now, oldest) if oldest else now
+
+
+def encode_cursor(position):
+    payload = json.dumps({
+        't': position['t'].isoformat() if position['t'] else None,
+        'c': position['c'],
+        'd': position['d'],
+    })
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(encoded):
+    """
+    Pozycja w feedzie: czas t oraz ostatnie id samochodu (c) i śladu usunięcia (d)
+    odczytane z tym czasem. Brak kursora = od początku. ValueError gdy niepoprawny.
+    """
+    if not encoded:
+        return {'t': None, 'c': 0, 'd': 0}
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        moment = datetime.fromisoformat(cursor['t']) if cursor['t'] else None
+        if moment is not None and moment.tzinfo is None:
+            raise ValueError
+        return {'t': moment, 'c': int(cursor['c']), 'd': int(cursor['d'])}
+    except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+        raise ValueError('Nieprawidłowy kursor.')
+
+
+def cursor_expired(position):
+    """Ślady usunięć starsze niż okres przechowywania są kasowane - taki kursor mógłby je pominąć."""
+    if position['t'] is None:
+        return False
+    return position['t'] < timezone.now() - timedelta(days=settings.CAR_DELETION_RETENTION_DAYS)
+
+
+def _after(queryset, field, position, tiebreaker):
+    if position['t'] is None:
+        return queryset
+    # Porównanie wierszy (czas, id) > (t, id) jest warunkiem indeksu (user, czas, id) - przy
+    # wielu wierszach z tym samym czasem (np. po imporcie) nie są one skanowane od początku
+    quote = connection.ops.quote_name
+    column = quote(queryset.model._meta.get_field(field).column)
+    return queryset.filter(RawSQL(
+        f'({column}, {quote("id")}) > (%s, %s)', [position['t'], position[tiebreaker]], output_field=BooleanField()
+    ))
+
+
+def get_changes(user, position, limit=DEFAULT_CHANGES_LIMIT):
+    """
+    Samochody zmienione i usunięte po pozycji kursora, razem najwyżej ``limit``
+    w kolejności czasu. Oba strumienie czytane indeksami (user, czas, id).
+    """
+    boundary = changes_boundary()
+    cars = _after(Car.objects.filter(user=user), 'updated_at', position, 'c')
+    deletions = _after(CarDeletion.objects.filter(user=user), 'deleted_at', position, 'd')
+    if boundary is not None:
+        cars = cars.filter(updated_at__lt=boundary)
+        deletions = deletions.filter(deleted_at__lt=boundary)
+
+    # limit + 1 z każdego strumienia wystarcza do wyznaczenia pierwszych limit + 1 wspólnie
+    events = [(car['updated_at'], 0, car['id'], car) for car in car_values(cars.order_by('updated_at', 'id')[:limit + 1])]
+    events += [
+        (deletion.deleted_at, 1, deletion.pk, deletion)
+        for deletion in deletions.order_by('deleted_at', 'id')[:limit + 1]
+    ]
+    events.sort(key=lambda event: event[:3])
+    has_more = len(events) > limit
+    events = events[:limit]
+
+    position = dict(position)
+    for moment, kind, pk, _ in events:
+        if moment != position['t']:
+            position = {'t': moment, 'c': 0, 'd': 0}
+        position['cd'[kind]] = pk
+
+    changed = [item for _, kind, _, item in events if kind == 0]
+    deleted = [item for _, kind, _, item in events if kind == 1]
+    return {
+        'changes': represent_cars(changed),
+        'deleted': CarDeletionSerializer(deleted, many=True).data,
+        'next': encode_cursor(position),
+        'has_more': has_more,
+    }
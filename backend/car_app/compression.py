@@ -0,0 +1,152 @@
+import gzip
+import zlib
+import brotli
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.regex_helper import _lazy_re_compile
+
+DEFAULT_BROTLI_QUALITY = 5
+DEFAULT_GZIP_LEVEL = 6
+
+# Krótszych odpowiedzi nie opłaca się kompresować (jak w GZipMiddleware)
+MIN_COMPRESS_LENGTH = 200
+
+# JSON, NDJSON i CSV; Parquet jest już skompresowany (zstd)
+COMPRESSIBLE_CONTENT_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+re_accepts_brotli = _lazy_re_compile(r'\bbr\b')
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+
+
+class GzipEncoder:
+    encoding = 'gzip'
+
+    def __init__(self):
+        self.level = getattr(settings, 'RESPONSE_GZIP_LEVEL', DEFAULT_GZIP_LEVEL)
+        self.compressor = None
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def compress_chunk(self, data):
+        if self.compressor is None:
+            # wbits 16 + MAX_WBITS - strumień z nagłówkiem gzip
+            self.compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        # Z_SYNC_FLUSH - każdy kawałek eksportu trafia do klienta od razu, a nie po zapełnieniu bufora zlib
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.compressor is None:
+            return self.compress(b'')
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    encoding = 'br'
+
+    def __init__(self):
+        self.quality = getattr(settings, 'RESPONSE_BROTLI_QUALITY', DEFAULT_BROTLI_QUALITY)
+        self.compressor = None
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def compress_chunk(self, data):
+        if self.compressor is None:
+            self.compressor = brotli.Compressor(quality=self.quality)
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self):
+        if self.compressor is None:
+            return self.compress(b'')
+        return self.compressor.finish()
+
+
+def choose_encoder(accept_encoding):
+    """Brotli, gdy klient go przyjmuje (mniejszy wynik przy podobnym czasie), w przeciwnym razie gzip."""
+    if re_accepts_brotli.search(accept_encoding):
+        return BrotliEncoder()
+    if re_accepts_gzip.search(accept_encoding):
+        return GzipEncoder()
+    return None
+
+
+def compress_stream(content, encoder):
+    for chunk in content:
+        if chunk:
+            yield encoder.compress_chunk(chunk)
+    yield encoder.finish()
+
+
+async def acompress_stream(content, encoder):
+    async for chunk in content:
+        if chunk:
+            yield encoder.compress_chunk(chunk)
+    yield encoder.finish()
+
+
+@sync_and_async_middleware
+class CompressionMiddleware:
+    """
+    Kompresja brotli lub gzip odpowiedzi GET (Accept-Encoding) - JSON API i eksporty.
+
+    W odróżnieniu od GZipMiddleware odpowiedź strumieniowa, także asynchroniczna
+    (eksporty pod ASGI), jest jednym strumieniem kompresji, opróżnianym po każdym
+    kawałku - pierwszy bajt trafia do klienta od razu, a stopień kompresji jest jak
+    dla całego pliku. Tylko GET: odpowiedzi POST (logowanie, rejestracja) zawierają
+    token obok danych z żądania, więc ich nie kompresujemy (BREACH). Pod ASGI
+    działa asynchronicznie - bez przejścia do wątku przy każdym żądaniu.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if request.method != 'GET' or not self.compressible(response):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoder = choose_encoder(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoder is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoder)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoder)
+            # Rozmiaru po kompresji nie znamy przed wysłaniem całości
+            del response.headers['Content-Length']
+        else:
+            compressed = encoder.compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # Silny ETag dotyczy konkretnych bajtów - po kompresji tylko słaby (RFC 9110 8.8.1)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoder.encoding
+        return response
+
+    def compressible(self, response):
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return False
+        if not response.get('Content-Type', '').startswith(COMPRESSIBLE_CONTENT_TYPES):
+            return False
+        return response.streaming or len(response.content) >= MIN_COMPRESS_LENGTH
@@ -0,0 +1,58 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from .cache import get_data_version
+
+COUNT_CACHE_TIMEOUT = 60 * 60
+DEFAULT_ESTIMATE_THRESHOLD = 1000000
+
+
+def _signature(queryset):
+    """Sygnatura filtrów - SQL zapytania bez sortowania wraz z parametrami."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    return hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+
+
+def estimate_count(queryset):
+    """Szacunkowa liczba wierszy z planu zapytania PostgreSQL (bez skanowania tabeli)."""
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_count(queryset, user_id):
+    """
+    Zwraca (liczba, czy_przybliżona) dla zapytania użytkownika.
+
+    Wyniki są trzymane w cache pod kluczem (użytkownik, wersja danych, sygnatura
+    filtrów). Gdy planer szacuje zbiór powyżej CAR_COUNT_ESTIMATE_THRESHOLD,
+    zwracamy oszacowanie zamiast dokładnego COUNT(*).
+    """
+    try:
+        signature = _signature(queryset)
+    except EmptyResultSet:
+        # Filtr z pustą listą kluczy (np. nieznana marka) - wynik znany bez zapytania
+        return 0, False
+    key = f'car-count:{user_id}:{get_data_version(user_id)}:{signature}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    threshold = getattr(settings, 'CAR_COUNT_ESTIMATE_THRESHOLD', DEFAULT_ESTIMATE_THRESHOLD)
+    estimate = estimate_count(queryset) if threshold else None
+    if estimate is not None and estimate >= threshold:
+        result = (estimate, True)
+    else:
+        result = (queryset.count(), False)
+
+    cache.set(key, result, COUNT_CACHE_TIMEOUT)
+    return result
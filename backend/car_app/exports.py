@@ -0,0 +1,252 @@
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import chain
+import pyarrow as pa
+import pyarrow.parquet as pq
+from asgiref.sync import sync_to_async
+from .dimensions import DIMENSION_FIELDS, dimension_model, dimension_names, sort_lookup
+from .pagination import keyset_filter
+from .serializers import datetime_representation
+
+# Kolumny eksportu CSV w kolejności nagłówka
+CSV_EXPORT_FIELDS = ['mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price']
+
+# Liczba wierszy pobieranych jednym zapytaniem i wysyłanych w jednym kawałku odpowiedzi
+EXPORT_CHUNK_SIZE = 2000
+
+
+def export_ordering(queryset):
+    """
+    Pole sortowania zapytania (pierwsze z order_by, domyślnie Meta.ordering) i kierunek.
+    Sortowanie wg adnotacji (trafność wyszukiwania) wymagałoby jej przeliczenia dla
+    wszystkich trafień przy każdej partii - eksport idzie wtedy wg Meta.ordering.
+    """
+    field = (queryset.query.order_by or queryset.model._meta.ordering)[0]
+    if field.lstrip('-') in queryset.query.annotations:
+        field = queryset.model._meta.ordering[0]
+    return sort_lookup(field.lstrip('-')), field.startswith('-')
+
+
+def _dimension_columns(fields):
+    # Klucze słowników zamiast nazw - bez złączeń, nazwy doczytywane z pamięci procesu
+    return [f'{field}_id' if field in DIMENSION_FIELDS else field for field in fields]
+
+
+def _with_names(rows, fields):
+    """Zamienia klucze słownikowe w wierszach partii na nazwy (jedno wywołanie na słownik)."""
+    rows = [list(row) for row in rows]
+    for index, field in enumerate(fields):
+        if field in DIMENSION_FIELDS:
+            names = dimension_names(dimension_model(field), {row[index] for row in rows})
+            for row in rows:
+                row[index] = names.get(row[index])
+    return [tuple(row) for row in rows]
+
+
+def iter_row_chunks(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Wiersze zapytania jako krotki w listach po ``chunk_size`` - jedna lista to jeden
+    kawałek odpowiedzi. Pola słownikowe (marka, model...) są zwracane jako nazwy.
+
+    Każda partia to osobne krótkie zapytanie WHERE (pole, id) > (ostatnia pozycja)
+    LIMIT ``chunk_size`` po indeksie (user, pole, id) - bez OFFSET i bez kursora
+    serwerowego. ``iterator()`` poza transakcją otwiera kursor WITH HOLD, dla którego
+    PostgreSQL wylicza cały wynik przed wysłaniem pierwszego wiersza. Kolejność jest
+    ta sama co w zapytaniu, z ``id`` rozstrzygającym remisy.
+    """
+    sort, descending = export_ordering(queryset)
+    prefix = '-' if descending else ''
+    # Pozycja ostatniego wiersza partii - pobierana w tym samym zapytaniu za kolumnami eksportu
+    keys = [sort, 'id'] if sort != 'id' else ['id']
+    width = len(fields)
+    rows_queryset = queryset.order_by(*[prefix + key for key in keys]).values_list(*_dimension_columns(fields), *keys)
+    batch = rows_queryset
+    while rows := list(batch[:chunk_size]):
+        yield _with_names([row[:width] for row in rows], fields)
+        if len(rows) < chunk_size:
+            break
+        last = rows[-1]
+        batch = rows_queryset.filter(keyset_filter(sort, last[width], last[-1], descending))
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """Iteruje po wierszach zapytania jako krotkach (partiami, jak ``iter_row_chunks``)."""
+    return chain.from_iterable(iter_row_chunks(queryset, fields, chunk_size))
+
+
+async def aiter_row_chunks(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Asynchroniczny odpowiednik ``iter_row_chunks`` - kolejne partie pobierane w wątku.
+    Między partiami wątek nie jest zajęty, więc czekanie na wolnego klienta nie blokuje
+    obsługi innych żądań. (``aiterator()`` nie nadaje się: dla ``values_list()`` wykonuje
+    zapytanie w kontekście async i zgłasza SynchronousOnlyOperation.)
+    """
+    chunks = iter_row_chunks(queryset, fields, chunk_size)
+    next_chunk = sync_to_async(lambda: next(chunks, None))
+    while (chunk := await next_chunk()) is not None:
+        yield chunk
+
+
+def export_filename(extension):
+    return f'car_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+
+
+def csv_header():
+    # BOM - Excel rozpoznaje kodowanie UTF-8
+    return '\ufeff' + csv_rows([CSV_EXPORT_FIELDS])
+
+
+def csv_rows(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([value or '' for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator kolejnych fragmentów pliku CSV (BOM + nagłówek + wiersze)."""
+    yield csv_header()
+    for rows in iter_row_chunks(queryset, CSV_EXPORT_FIELDS, chunk_size):
+        yield csv_rows(rows)
+
+
+async def astream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Asynchroniczna wersja ``stream_csv`` dla widoków pod ASGI."""
+    yield csv_header()
+    async for rows in aiter_row_chunks(queryset, CSV_EXPORT_FIELDS, chunk_size):
+        yield csv_rows(rows)
+
+
+# Pola w kolejności zgodnej z CarSerializer - ze znacznikami czasu, którymi klient
+# feedu zmian (/api/cars/changes/) może zasilić lokalną kopię z eksportu
+JSON_EXPORT_FIELDS = ['id', 'external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price',
+                      'created_at', 'updated_at']
+
+
+def row_to_dict(row, datetime_text):
+    """Zamienia krotkę z ``values_list`` na słownik w formacie CarSerializer (cena i daty jako tekst)."""
+    car = dict(zip(JSON_EXPORT_FIELDS, row))
+    if car['price'] is not None:
+        car['price'] = '{:f}'.format(car['price'])
+    car['created_at'] = datetime_text(car['created_at'])
+    car['updated_at'] = datetime_text(car['updated_at'])
+    return car
+
+
+# Jeden enkoder dla wszystkich wierszy - json.dumps z parametrami tworzy nowy przy każdym wywołaniu.
+# Zapis (separatory ', ' i ': ') bez zmian, dlatego bez orjson, który pisze tylko kompaktowo.
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+
+
+def json_objects(rows, separator):
+    datetime_text = datetime_representation()
+    return separator.join(_json_encoder.encode(row_to_dict(row, datetime_text)) for row in rows)
+
+
+def stream_json(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator tablicy JSON budowanej wiersz po wierszu."""
+    yield '['
+    separator = ''
+    for rows in iter_row_chunks(queryset, JSON_EXPORT_FIELDS, chunk_size):
+        yield separator + json_objects(rows, ',')
+        separator = ','
+    yield ']'
+
+
+async def astream_json(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Asynchroniczna wersja ``stream_json``."""
+    yield '['
+    separator = ''
+    async for rows in aiter_row_chunks(queryset, JSON_EXPORT_FIELDS, chunk_size):
+        yield separator + json_objects(rows, ',')
+        separator = ','
+    yield ']'
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator formatu NDJSON - jeden obiekt JSON na linię."""
+    for rows in iter_row_chunks(queryset, JSON_EXPORT_FIELDS, chunk_size):
+        yield json_objects(rows, '\n') + '\n'
+
+
+async def astream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Asynchroniczna wersja ``stream_ndjson``."""
+    async for rows in aiter_row_chunks(queryset, JSON_EXPORT_FIELDS, chunk_size):
+        yield json_objects(rows, '\n') + '\n'
+
+
+# Typowany schemat eksportu kolumnowego (cena jako decimal zamiast tekstu, znaczniki czasu w UTC)
+PARQUET_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('external_id', pa.int32()),
+    ('mark', pa.string()),
+    ('model', pa.string()),
+    ('generation_name', pa.string()),
+    ('year', pa.int32()),
+    ('mileage', pa.int32()),
+    ('vol_engine', pa.float64()),
+    ('fuel', pa.string()),
+    ('city', pa.string()),
+    ('province', pa.string()),
+    ('price', pa.decimal128(10, 2)),
+    ('created_at', pa.timestamp('us', tz='UTC')),
+    ('updated_at', pa.timestamp('us', tz='UTC')),
+])
+
+# Liczba wierszy w jednej grupie wierszy (row group) pliku Parquet - jeden kawałek odpowiedzi
+PARQUET_BATCH_SIZE = 50000
+
+
+def _record_batch(rows):
+    columns = zip(*rows)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(columns, PARQUET_SCHEMA)],
+        schema=PARQUET_SCHEMA,
+    )
+
+
+class _ParquetSink(io.RawIOBase):
+    """Wyjście ParquetWriter - zapisane bajty czekają w pamięci do odebrania przez ``drain``."""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def stream_parquet(queryset, batch_size=PARQUET_BATCH_SIZE):
+    """
+    Generator kolejnych fragmentów pliku Parquet (kompresja zstd). Plik jest zapisywany
+    po kolei - nagłówek, grupy wierszy, stopka ze schematem - więc każda grupa trafia
+    do klienta zaraz po zapisie, bez pliku tymczasowego. W pamięci jest najwyżej jedna grupa.
+    """
+    sink = _ParquetSink()
+    with pq.ParquetWriter(sink, PARQUET_SCHEMA, compression='zstd') as writer:
+        for rows in iter_row_chunks(queryset, PARQUET_SCHEMA.names, batch_size):
+            writer.write_batch(_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+async def astream_parquet(queryset, batch_size=PARQUET_BATCH_SIZE):
+    """
+    Asynchroniczna wersja ``stream_parquet`` - partie pobierane i kompresowane w wątku,
+    jak w ``aiter_row_chunks``.
+    """
+    parts = stream_parquet(queryset, batch_size)
+    next_part = sync_to_async(lambda: next(parts, None))
+    while (part := await next_part()) is not None:
+        yield part
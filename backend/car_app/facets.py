@@ -0,0 +1,102 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import BooleanField, ExpressionWrapper
+from .dimensions import dimension_model, dimension_names
+
+FACET_FIELDS = ['mark', 'fuel', 'province']
+
+# Szerokość przedziału lat oraz granice przedziałów cen
+YEAR_BUCKET_SIZE = 5
+PRICE_BUCKET_EDGES = [10000, 20000, 30000, 50000, 75000, 100000, 150000, 200000, 300000, 500000]
+
+
+def _price_bucket_range(bucket):
+    """Zamienia numer z width_bucket() na przedział cen [od, do)."""
+    edges = [0] + PRICE_BUCKET_EDGES
+    return edges[bucket], PRICE_BUCKET_EDGES[bucket] if bucket < len(PRICE_BUCKET_EDGES) else None
+
+
+GROUP_COLUMNS = FACET_FIELDS + ['year_bucket', 'price_bucket']
+
+# Fasety w kolejności GROUP_COLUMNS - klucze warunków filtrów przekazywanych do compute_facets
+FACETS = FACET_FIELDS + ['year', 'price']
+
+
+def _match_column(facet):
+    return f'matches_{facet}'
+
+
+def _facet_rows(queryset, conditions):
+    # Spełnienie warunku każdej fasety jako kolumna - liczność fasety pomija własny warunek
+    matches = {
+        _match_column(facet): ExpressionWrapper(condition, output_field=BooleanField())
+        for facet, condition in conditions.items()
+    }
+    try:
+        sql, params = (
+            queryset.order_by().annotate(**matches).values(*FACET_FIELDS, 'year', 'price', *matches).query.sql_with_params()
+        )
+    except EmptyResultSet:
+        # Filtr z pustą listą kluczy słownika - brak wierszy bez pytania bazy
+        return []
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in GROUP_COLUMNS)
+    sets = ', '.join(f'({quote(column)})' for column in GROUP_COLUMNS)
+    counts = []
+    for facet in FACETS:
+        # CAST - warunek z pustą listą kluczy Django zapisuje jako liczbę 0
+        others = [f'CAST({quote(_match_column(other))} AS boolean)' for other in conditions if other != facet]
+        counts.append(f'COUNT(*) FILTER (WHERE {" AND ".join(others)})' if others else 'COUNT(*)')
+    facet_sql = f'''
+        SELECT {columns}, GROUPING({columns}), {', '.join(counts)}
+        FROM (
+            SELECT {', '.join(quote(field) for field in FACET_FIELDS)},
+                   {''.join(f'{quote(column)}, ' for column in matches)}
+                   ({quote('year')} / %s) * %s AS {quote('year_bucket')},
+                   width_bucket({quote('price')}, %s::numeric[]) AS {quote('price_bucket')}
+            FROM ({sql}) filtered
+        ) bucketed
+        GROUP BY GROUPING SETS ({sets})
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(facet_sql, [YEAR_BUCKET_SIZE, YEAR_BUCKET_SIZE, PRICE_BUCKET_EDGES, *params])
+        return cursor.fetchall()
+
+
+def compute_facets(queryset, conditions=None):
+    """
+    Liczności po marce, paliwie, województwie oraz przedziałach lat i cen - jedno
+    zapytanie GROUPING SETS nad zapytaniem filtrów. ``conditions`` to warunki (Q)
+    filtrów odpowiadających fasetom (klucze z FACETS): każda faseta jest liczona
+    z warunkami pozostałych, ale bez własnego, a ``queryset`` zawiera resztę filtrów.
+    """
+    group_columns = GROUP_COLUMNS
+    rows = _facet_rows(queryset, conditions or {})
+
+    facets = {column: [] for column in group_columns}
+    width = len(group_columns)
+    for row in rows:
+        keys, grouping_id, counts = row[:width], row[width], row[width + 1:]
+        # Dokładnie jeden bit GROUPING() jest zgaszony - kolumna bieżącego zbioru
+        position = next(i for i in range(width) if not grouping_id & (1 << (width - 1 - i)))
+        # Wartość występująca tylko w wierszach odrzuconych przez inne filtry
+        if counts[position]:
+            facets[group_columns[position]].append((keys[position], counts[position]))
+
+    result = {}
+    for field in FACET_FIELDS:
+        # Grupowanie po kluczach słownika - nazwy doczytywane na końcu
+        names = dimension_names(dimension_model(field), [value for value, _ in facets[field]])
+        result[field] = sorted(
+            ({'value': names[value], 'count': count} for value, count in facets[field]),
+            key=lambda item: (-item['count'], item['value'])
+        )
+    result['year'] = [
+        {'from': value, 'to': value + YEAR_BUCKET_SIZE - 1, 'count': count}
+        for value, count in sorted(facets['year_bucket'])
+    ]
+    result['price'] = [
+        {'from': start, 'to': end, 'count': count}
+        for (start, end), count in ((_price_bucket_range(bucket), count) for bucket, count in sorted(facets['price_bucket']))
+    ]
+    return result
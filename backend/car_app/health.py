@@ -0,0 +1,59 @@
+import logging
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Migracje sprawdzane do pierwszego pozytywnego wyniku - później nie znikają w trakcie życia procesu
+_migrations_applied = False
+
+
+def _check_database():
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _check_cache():
+    cache.set('car-readiness', 1, 10)
+    if cache.get('car-readiness') != 1:
+        raise RuntimeError('Cache nie zwrócił zapisanej wartości.')
+
+
+def _check_migrations():
+    global _migrations_applied
+    if _migrations_applied:
+        return
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    if plan:
+        raise RuntimeError(f'Niezastosowane migracje: {len(plan)}')
+    _migrations_applied = True
+
+
+READINESS_CHECKS = {
+    'database': _check_database,
+    'cache': _check_cache,
+    'migrations': _check_migrations,
+}
+
+
+def healthz(request):
+    """Liveness - proces odpowiada; bez zależności, żeby awaria bazy nie restartowała procesów."""
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    """Readiness - baza, cache i migracje gotowe; 503 wyłącza instancję z ruchu."""
+    checks = {}
+    for name, check in READINESS_CHECKS.items():
+        try:
+            check()
+            checks[name] = 'ok'
+        except Exception as e:
+            logger.warning('Readiness check %s failed: %s', name, e)
+            checks[name] = str(e)
+
+    ready = all(result == 'ok' for result in checks.values())
+    return JsonResponse({'status': 'ok' if ready else 'error', 'checks': checks}, status=200 if ready else 503)
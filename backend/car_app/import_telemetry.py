@@ -0,0 +1,127 @@
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from prometheus_client import Counter, Histogram
+
+# Etapy porcji importu: odczyt CSV, walidacja typów, klucze słowników, zapis do bazy;
+# finalize - usunięcie samochodów nieobecnych w pliku (tryb sync)
+IMPORT_PHASES = ['read', 'validate', 'transform', 'write', 'finalize']
+
+# Powody odrzucenia wiersza w kolejności sprawdzania - wiersz liczony jest przy pierwszym
+REJECT_MISSING_VALUE = 'missing_value'
+REJECT_INVALID_NUMBER = 'invalid_number'
+REJECT_PRICE_OUT_OF_RANGE = 'price_out_of_range'
+REJECT_TEXT_TOO_LONG = 'text_too_long'
+REJECT_DUPLICATE_EXTERNAL_ID = 'duplicate_external_id'
+
+import_phase_seconds = Histogram(
+    'car_import_phase_seconds',
+    'Czas etapu importu CSV dla jednej porcji (finalize - raz na import).',
+    ['phase'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60),
+)
+import_rows = Counter(
+    'car_import_rows_total',
+    'Wiersze plików CSV zapisane (accepted) i odrzucone (rejected).',
+    ['result'],
+)
+import_rejected_rows = Counter(
+    'car_import_rejected_rows_total',
+    'Wiersze odrzucone podczas importu CSV według powodu.',
+    ['reason'],
+)
+import_bytes = Counter(
+    'car_import_bytes_total',
+    'Bajty plików CSV przetworzone przez import.',
+)
+import_chunk_rows_per_second = Histogram(
+    'car_import_chunk_rows_per_second',
+    'Przepustowość jednej porcji importu [zapisane wiersze/s] według rozmiaru porcji (CSV_IMPORT_CHUNK_SIZE).',
+    ['chunk_size'],
+    buckets=(1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000),
+)
+import_rows_per_second = Histogram(
+    'car_import_rows_per_second',
+    'Przepustowość całego importu CSV [zapisane wiersze/s].',
+    buckets=(1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000),
+)
+import_bytes_per_second = Histogram(
+    'car_import_bytes_per_second',
+    'Przepustowość całego importu CSV [bajty/s].',
+    buckets=(2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28),
+)
+
+
+class ImportTelemetry:
+    """
+    Pomiary jednego importu: czasy etapów (łącznie i dla bieżącej porcji), odrzucenia
+    według powodu i przepustowość. Metryki Prometheus są aktualizowane na bieżąco,
+    a ``summary()`` trafia do ImportJob.result.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(IMPORT_PHASES, 0.0)
+        self.chunk_phases = {}
+        self.rejected = Tally()
+        self.bytes = 0
+        self.failed_phase = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            # Błąd importu wskazuje etap, w którym wystąpił (zapisywany przy zadaniu)
+            self.failed_phase = name
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] += elapsed
+            self.chunk_phases[name] = self.chunk_phases.get(name, 0.0) + elapsed
+            import_phase_seconds.labels(phase=name).observe(elapsed)
+
+    def start_chunk(self):
+        self.chunk_phases = {}
+
+    def finish_chunk(self, rows, rejected, bytes_read):
+        """Zamyka porcję; zwraca czasy jej etapów i przepustowość do listy porcji w wyniku."""
+        seconds = sum(self.chunk_phases.values())
+        self.bytes += bytes_read
+        self.rejected.update(rejected)
+        import_rows.labels(result='accepted').inc(rows)
+        import_bytes.inc(bytes_read)
+        for reason, count in rejected.items():
+            import_rows.labels(result='rejected').inc(count)
+            import_rejected_rows.labels(reason=reason).inc(count)
+        rows_per_second = rows / seconds if seconds > 0 else 0
+        import_chunk_rows_per_second.labels(chunk_size=self.chunk_size).observe(rows_per_second)
+        return {
+            'seconds': round(seconds, 4),
+            'bytes': bytes_read,
+            'phases': {name: round(value, 4) for name, value in self.chunk_phases.items()},
+            'rows_per_second': round(rows_per_second, 1),
+        }
+
+    def summary(self, total_rows):
+        """Czasy etapów, odrzucenia i przepustowość całego importu (także przerwanego)."""
+        elapsed = time.perf_counter() - self.started
+        rows_per_second = total_rows / elapsed if elapsed > 0 else 0
+        bytes_per_second = self.bytes / elapsed if elapsed > 0 else 0
+        if self.failed_phase is None:
+            import_rows_per_second.observe(rows_per_second)
+            import_bytes_per_second.observe(bytes_per_second)
+        summary = {
+            'chunk_size': self.chunk_size,
+            'elapsed_seconds': round(elapsed, 4),
+            'rows_per_second': round(rows_per_second, 1),
+            'bytes_processed': self.bytes,
+            'bytes_per_second': round(bytes_per_second, 1),
+            'phases': {name: round(value, 4) for name, value in self.phases.items()},
+            'rejected_by_reason': dict(self.rejected),
+        }
+        if self.failed_phase is not None:
+            summary['failed_phase'] = self.failed_phase
+        return summary
@@ -0,0 +1,358 @@
+import io
+import itertools
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from .bulk import delete_cars
+from .cache import invalidate_user_data
+from .changes import start_car_write
+from .dimensions import DIMENSION_FIELDS, dimension_model, dimension_names, resolve_ids
+from .import_telemetry import REJECT_DUPLICATE_EXTERNAL_ID, REJECT_INVALID_NUMBER, REJECT_MISSING_VALUE, REJECT_PRICE_OUT_OF_RANGE, REJECT_TEXT_TOO_LONG, ImportTelemetry
+from .models import Car, ImportJob
+from .summary import StatsDelta, apply_delta
+
+# Kolejność kolumn w plikach z eksportu (pierwsza kolumna to identyfikator zewnętrzny)
+CSV_COLUMNS = ['external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price']
+REQUIRED_COLUMNS = ['mark', 'model', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price']
+TEXT_COLUMNS = ['mark', 'model', 'generation_name', 'fuel', 'city', 'province']
+INTEGER_COLUMNS = ['year', 'mileage']
+
+INT_MAX = 2 ** 31 - 1
+DEFAULT_CHUNK_SIZE = 50000
+
+
+# Tabele tymczasowe: porcja przed scaleniem oraz external_id całego pliku (tryb sync)
+STAGE_TABLE = 'car_import_stage'
+FEED_TABLE = 'car_import_feed'
+
+# Kolumny potrzebne do aktualizacji podsumowania statystyk (klucze słowników jako id)
+STATS_FIELDS = ['year', 'mileage', 'price', 'mark', 'fuel', 'province']
+
+
+def _column(name):
+    return connection.ops.quote_name(Car._meta.get_field(name).column)
+
+
+def _stats_frame(rows):
+    """Wiersze (STATS_FIELDS) z bazy jako DataFrame dla StatsDelta.add_frame - z nazwami zamiast kluczy."""
+    frame = pd.DataFrame(rows, columns=STATS_FIELDS)
+    if frame.empty:
+        return frame
+    frame['price'] = pd.to_numeric(frame['price'])
+    for field in STATS_FIELDS:
+        if field in DIMENSION_FIELDS:
+            names = dimension_names(dimension_model(field), [int(pk) for pk in frame[field].unique()])
+            frame[field] = frame[field].map(names)
+    return frame
+
+
+def _max_length(column):
+    field = Car._meta.get_field(column)
+    if field.is_relation:
+        field = field.related_model._meta.get_field('name')
+    return field.max_length
+
+
+class CarCsvImporter:
+    """
+    Importuje samochody z pliku CSV porcjami o stałym rozmiarze.
+
+    Każda porcja jest walidowana wektorowo (pandas), ładowana poleceniem COPY
+    do tabeli tymczasowej i scalana z danymi użytkownika jednym INSERT ...
+    ON CONFLICT (user, external_id) DO UPDATE - zapisywane są tylko wiersze
+    nowe lub zmienione, a zużycie pamięci nie zależy od rozmiaru pliku.
+    """
+
+    def __init__(self, user, chunk_size=None, on_chunk=None, mode=ImportJob.MODE_UPSERT):
+        self.user = user
+        self.on_chunk = on_chunk
+        self.mode = mode
+        self.chunk_size = chunk_size or getattr(settings, 'CSV_IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        # Pomiary są dostępne także po przerwaniu importu wyjątkiem (zadanie zapisuje je przy błędzie)
+        self.telemetry = ImportTelemetry(self.chunk_size)
+        self.total_rows = 0
+
+    def run(self, source):
+        telemetry = self.telemetry
+        rejected_rows = 0
+        unparsed_rows = 0
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        chunks = []
+
+        sync = self.mode == ImportJob.MODE_SYNC
+        if sync:
+            self.start_feed()
+
+        with telemetry.phase('read'):
+            reader = pd.read_csv(source, chunksize=self.chunk_size, dtype=str, skipinitialspace=True)
+        position = 0
+        for index in itertools.count():
+            telemetry.start_chunk()
+            with telemetry.phase('read'):
+                frame = next(reader, None)
+            if frame is None:
+                break
+            with telemetry.phase('validate'):
+                frame, rejected = self.prepare_chunk(frame)
+                frame, duplicates = self.drop_duplicate_ids(frame)
+                if duplicates:
+                    rejected[REJECT_DUPLICATE_EXTERNAL_ID] = duplicates
+            with telemetry.phase('transform'):
+                keys = self.transform_chunk(frame)
+            with telemetry.phase('write'), transaction.atomic():
+                start_car_write()
+                written, delta = self.write_chunk(frame, keys)
+                apply_delta(self.user.pk, delta)
+                invalidate_user_data(self.user.pk)
+
+            # Pozycja w pliku pozwala oszacować postęp bez wcześniejszego liczenia wierszy
+            read_position = source.tell() if hasattr(source, 'tell') else 0
+            self.total_rows += len(frame)
+            rejected_rows += sum(rejected.values())
+            unparsed_rows += sum(count for reason, count in rejected.items() if reason != REJECT_DUPLICATE_EXTERNAL_ID)
+            for key in counts:
+                counts[key] += written[key]
+            chunks.append({
+                'chunk': index,
+                'rows': len(frame),
+                'rejected': sum(rejected.values()),
+                'rejected_by_reason': rejected,
+                **written,
+                **telemetry.finish_chunk(len(frame), rejected, read_position - position),
+            })
+            position = read_position
+            if self.on_chunk:
+                self.on_chunk(self.total_rows, rejected_rows, position)
+
+        deleted = 0
+        if sync:
+            with telemetry.phase('finalize'):
+                # Odrzucony błędny wiersz mógł nieść external_id istniejącego samochodu - wtedy nie
+                # usuwamy nic. Pominięty duplikat nie przeszkadza: jego external_id niesie ostatni wiersz
+                deleted = self.finish_feed(delete_missing=not unparsed_rows)
+
+        return {
+            'mode': self.mode,
+            'total_rows': self.total_rows,
+            'rejected_rows': rejected_rows,
+            **counts,
+            'deleted_from_feed': deleted,
+            **telemetry.summary(self.total_rows),
+            'chunks': chunks,
+        }
+
+    def prepare_chunk(self, frame):
+        """
+        Ujednolica kolumny i typy porcji; zwraca (poprawne wiersze, {powód: liczba odrzuconych}).
+        Wiersz z kilkoma błędami jest liczony przy pierwszym z nich (kolejność w ``invalid``).
+        """
+        frame.columns = frame.columns.str.strip()
+        if frame.shape[1] == len(CSV_COLUMNS):
+            frame.columns = CSV_COLUMNS
+
+        missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+        if missing:
+            raise ValueError(f'Brak wymaganych kolumn: {", ".join(missing)}')
+
+        data = pd.DataFrame(index=frame.index)
+        invalid = {
+            reason: pd.Series(False, index=frame.index)
+            for reason in (REJECT_MISSING_VALUE, REJECT_INVALID_NUMBER, REJECT_PRICE_OUT_OF_RANGE, REJECT_TEXT_TOO_LONG)
+        }
+
+        if 'external_id' in frame.columns:
+            external_id = pd.to_numeric(frame['external_id'], errors='coerce')
+            external_id = external_id.where((external_id % 1 == 0) & (external_id.abs() <= INT_MAX))
+            data['external_id'] = external_id.astype('Int64')
+        else:
+            data['external_id'] = pd.Series(pd.NA, index=frame.index, dtype='Int64')
+
+        for column in TEXT_COLUMNS:
+            if column not in frame.columns:
+                data[column] = pd.Series(None, index=frame.index, dtype=object)
+                continue
+            values = frame[column]
+            if column in DIMENSION_FIELDS:
+                # Kanonizacja nazw słownikowych: ' Alfa  Romeo ' -> 'Alfa Romeo'
+                values = values.str.split().str.join(' ')
+                values = values.where(values != '')
+            invalid[REJECT_TEXT_TOO_LONG] |= values.str.len() > _max_length(column)
+            data[column] = values
+
+        for column in INTEGER_COLUMNS:
+            values = pd.to_numeric(frame[column], errors='coerce')
+            invalid[REJECT_INVALID_NUMBER] |= ~((values % 1 == 0) & (values.abs() <= INT_MAX))
+            data[column] = values
+
+        vol_engine = pd.to_numeric(frame['vol_engine'], errors='coerce')
+        data['vol_engine'] = vol_engine
+
+        price_field = Car._meta.get_field('price')
+        price = pd.to_numeric(frame['price'], errors='coerce').round(price_field.decimal_places)
+        invalid[REJECT_PRICE_OUT_OF_RANGE] |= price.abs() >= 10 ** (price_field.max_digits - price_field.decimal_places)
+        data['price'] = price
+
+        for column in REQUIRED_COLUMNS:
+            if column in TEXT_COLUMNS:
+                invalid[REJECT_MISSING_VALUE] |= data[column].isna()
+            else:
+                # Pusta komórka to brak wartości, a tekst niebędący liczbą - błędna liczba
+                blank = frame[column].isna() | (frame[column].str.strip() == '')
+                invalid[REJECT_MISSING_VALUE] |= blank
+                invalid[REJECT_INVALID_NUMBER] |= data[column].isna() & ~blank
+
+        valid = pd.Series(True, index=frame.index)
+        rejected = {}
+        for reason, rows in invalid.items():
+            count = int((rows & valid).sum())
+            if count:
+                rejected[reason] = count
+            valid &= ~rows
+
+        data = data[valid].astype({column: 'int64' for column in INTEGER_COLUMNS})
+        return data[CSV_COLUMNS], rejected
+
+    def drop_duplicate_ids(self, frame):
+        """Przy powtórzonym external_id w porcji obowiązuje ostatni wiersz; zwraca (wiersze, liczba pominiętych)."""
+        duplicated = frame['external_id'].notna() & frame.duplicated('external_id', keep='last')
+        return frame[~duplicated], int(duplicated.sum())
+
+    def transform_chunk(self, frame):
+        """Nazwy słownikowe zamieniane na klucze - jedno zapytanie na słownik i porcję."""
+        if frame.empty:
+            return frame
+        return frame.assign(**{
+            field: frame[field].map(resolve_ids(dimension_model(field), frame[field].unique()))
+            for field in DIMENSION_FIELDS
+        })
+
+    def write_chunk(self, frame, keys):
+        """
+        Zapisuje porcję (``keys`` - wynik ``transform_chunk``); zwraca
+        (liczniki inserted/updated/unchanged, zmiana podsumowania statystyk).
+        """
+        if frame.empty:
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0}, StatsDelta()
+        if connection.vendor != 'postgresql':
+            self._bulk_create(keys)
+            return {'inserted': len(frame), 'updated': 0, 'unchanged': 0}, StatsDelta.from_frame(frame)
+        return self._upsert(keys.assign(user_id=self.user.pk))
+
+    def _copy(self, cursor, table, frame):
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        columns = ', '.join(_column(name) for name in frame.columns)
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    def _upsert(self, frame):
+        quote = connection.ops.quote_name
+        table = quote(Car._meta.db_table)
+        stage = quote(STAGE_TABLE)
+        columns = [_column(name) for name in frame.columns]
+        updated_columns = [column for column in columns if column not in (_column('user_id'), _column('external_id'))]
+        stats_columns = [_column(name) for name in STATS_FIELDS]
+        external_id, user_id, content_hash = _column('external_id'), _column('user_id'), _column('content_hash')
+
+        # old - poprzednie wartości nadpisywanych wierszy z migawki sprzed INSERT (bez FOR UPDATE,
+        # które pominęłoby wiersze zmienione już przez to samo polecenie), potrzebne do korekty
+        # podsumowania; WHERE ... IS DISTINCT FROM pomija zapis wierszy bez zmian.
+        # Wiersz bez external_id nie trafia na ON CONFLICT (NULL jest zawsze unikalny) - jest
+        # rozpoznawany po treści: identyczny samochód bez external_id oznacza wiersz bez zmian.
+        # Równość content_hash pozwala na złączenie haszujące (koszt liniowy), a porównanie
+        # kolumn odrzuca tylko kolizje skrótu
+        sql = f'''
+            WITH old AS (
+                SELECT car.{external_id}, {', '.join(f'car.{column}' for column in stats_columns)}
+                FROM {table} car JOIN {stage} stage ON stage.{external_id} = car.{external_id}
+                WHERE car.{user_id} = %s
+            ), upserted AS (
+                INSERT INTO {table} ({', '.join(columns)})
+                SELECT {', '.join(columns)} FROM {stage}
+                WHERE {stage}.{external_id} IS NOT NULL OR NOT EXISTS (
+                    SELECT 1 FROM {table} car
+                    WHERE car.{user_id} = %s AND car.{external_id} IS NULL
+                        AND car.{content_hash} = {stage}.{content_hash}
+                        AND ({', '.join(f'car.{column}' for column in updated_columns)})
+                            IS NOT DISTINCT FROM ({', '.join(f'{stage}.{column}' for column in updated_columns)})
+                )
+                ON CONFLICT ({user_id}, {external_id}) DO UPDATE
+                SET {', '.join(f'{column} = EXCLUDED.{column}' for column in updated_columns)},
+                    {_column('updated_at')} = statement_timestamp()
+                WHERE ({', '.join(f'{table}.{column}' for column in updated_columns)})
+                    IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in updated_columns)})
+                RETURNING {external_id}, {', '.join(stats_columns)}
+            )
+            SELECT {', '.join(f'upserted.{column}' for column in stats_columns)},
+                   {', '.join(f'old.{column}' for column in stats_columns)}
+            FROM upserted LEFT JOIN old ON old.{external_id} = upserted.{external_id}
+        '''
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {stage}')
+            cursor.execute(f'CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {", ".join(columns)} FROM {table} WITH NO DATA')
+            # Skrót wyliczany przy COPY tym samym wyrażeniem co kolumna generowana tabeli samochodów
+            hash_sql, hash_params = Car._meta.get_field('content_hash').generated_sql(connection)
+            cursor.execute(
+                f'ALTER TABLE {stage} ADD COLUMN {content_hash} varchar(32) GENERATED ALWAYS AS ({hash_sql}) STORED',
+                hash_params,
+            )
+            self._copy(cursor, stage, frame)
+            if self.mode == ImportJob.MODE_SYNC:
+                cursor.execute(f'INSERT INTO {quote(FEED_TABLE)} SELECT {external_id} FROM {stage} WHERE {external_id} IS NOT NULL')
+            cursor.execute(sql, [self.user.pk, self.user.pk])
+            rows = cursor.fetchall()
+
+        width = len(STATS_FIELDS)
+        written = [row[:width] for row in rows]
+        replaced = [row[width:] for row in rows if row[width] is not None]
+        delta = StatsDelta()
+        delta.add_frame(_stats_frame(written))
+        delta.add_frame(_stats_frame(replaced), sign=-1)
+        counts = {
+            'inserted': len(written) - len(replaced),
+            'updated': len(replaced),
+            'unchanged': len(frame) - len(written),
+        }
+        return counts, delta
+
+    def start_feed(self):
+        """Tabela tymczasowa (na czas sesji) z external_id wszystkich porcji trybu sync."""
+        if connection.vendor != 'postgresql':
+            raise ValueError('Tryb synchronizacji wymaga bazy PostgreSQL.')
+        feed = connection.ops.quote_name(FEED_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {feed}')
+            cursor.execute(f'CREATE TEMP TABLE {feed} ({_column("external_id")} integer)')
+
+    def finish_feed(self, delete_missing=True):
+        """Usuwa samochody z external_id nieobecnym w pliku; zwraca liczbę usuniętych."""
+        feed = connection.ops.quote_name(FEED_TABLE)
+        table = connection.ops.quote_name(Car._meta.db_table)
+        external_id = _column('external_id')
+        try:
+            if not delete_missing:
+                return 0
+            with connection.cursor() as cursor:
+                # Tabela tymczasowa nie ma statystyk (autovacuum jej nie widzi) - bez nich planer
+                # nie zna jej rozmiaru
+                cursor.execute(f'ANALYZE {feed}')
+            # NOT EXISTS zamiast NOT IN - złączenie anty (haszujące), a nie przeszukiwanie
+            # całego pliku dla każdego samochodu
+            missing = Car.objects.filter(user=self.user, external_id__isnull=False).filter(RawSQL(
+                f'NOT EXISTS (SELECT 1 FROM {feed} WHERE {feed}.{external_id} = {table}.{external_id})',
+                [],
+                output_field=BooleanField(),
+            ))
+            return len(delete_cars(self.user, missing))
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {feed}')
+
+    def _bulk_create(self, frame):
+        records = frame.astype(object).where(frame.notna(), None).to_dict('records')
+        Car.objects.bulk_create(
+            [Car(user=self.user, **{Car._meta.get_field(name).attname: value for name, value in record.items()}) for record in records],
+            batch_size=1000,
+        )
@@ -0,0 +1,225 @@
+import logging
+import re
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOW_QUERY_MS = 200
+DEFAULT_REQUEST_QUERY_WARNING = 50
+
+request_queries = Histogram(
+    'car_db_request_queries',
+    'Liczba zapytań SQL wykonanych podczas obsługi jednego żądania.',
+    ['view', 'method'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 233, 377),
+)
+request_query_seconds = Histogram(
+    'car_db_request_query_seconds',
+    'Łączny czas zapytań SQL jednego żądania.',
+    ['view', 'method'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+request_max_query_seconds = Histogram(
+    'car_db_request_max_query_seconds',
+    'Czas najdłuższego zapytania SQL jednego żądania.',
+    ['view', 'method'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+slow_queries = Counter(
+    'car_db_slow_queries_total',
+    'Zapytania SQL dłuższe niż SLOW_QUERY_MS.',
+    ['view'],
+)
+
+
+class QueryStats:
+    """Zapytania jednego żądania - liczba, łączny i najdłuższy czas."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @property
+    def view(self):
+        # Widok jest znany po rozwiązaniu adresu - bez process_view, który pod ASGI
+        # wymagałby przejścia do wątku przy każdym żądaniu
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else None
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+
+# Statystyki bieżącego żądania. Zmienna kontekstu (nie wątku) - pod ASGI zapytania
+# widoku async wykonują się w wątkach sync_to_async, które dziedziczą kontekst.
+_current = ContextVar('car_query_stats', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+def normalize_sql(sql):
+    """
+    Postać zapytania bez wartości - zapytania różniące się tylko parametrami
+    (także długością listy IN) dają ten sam tekst, np. do grupowania w logach.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = _VALUE_LIST.sub('(?, ...)', sql)
+    return ' '.join(sql.split())
+
+
+def explain(connection, sql, params):
+    """
+    Plan zapytania (EXPLAIN bez ANALYZE - zapytanie nie jest wykonywane ponownie).
+    Kursor sterownika omija execute_wrappers, a punkt zapisu chroni transakcję
+    wywołującego przed błędem EXPLAIN.
+    """
+    in_transaction = connection.in_atomic_block
+    with connection.connection.cursor() as cursor:
+        try:
+            if in_transaction:
+                cursor.execute('SAVEPOINT car_explain')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+            if in_transaction:
+                cursor.execute('RELEASE SAVEPOINT car_explain')
+            return plan
+        except connection.Database.Error as e:
+            if in_transaction:
+                cursor.execute('ROLLBACK TO SAVEPOINT car_explain')
+            return f'EXPLAIN nie powiódł się: {e}'
+
+
+# EXPLAIN bez ANALYZE nie wykonuje zapytania, więc także zapisy można bezpiecznie objaśnić
+EXPLAINABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def _explainable(connection, sql):
+    words = sql.split(None, 1)
+    return connection.vendor == 'postgresql' and bool(words) and words[0].upper() in EXPLAINABLE_STATEMENTS
+
+
+def record_query(execute, sql, params, many, context):
+    """Execute wrapper liczący czas każdego zapytania i zgłaszający zapytania wolne."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        stats = _current.get()
+        if stats is not None:
+            stats.add(duration)
+        if duration * 1000 >= getattr(settings, 'SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS):
+            _report_slow_query(context['connection'], stats, sql, params, many, duration)
+
+
+def _report_slow_query(connection, stats, sql, params, many, duration):
+    # Zapytania spoza żądań HTTP - zadania importu, polecenia manage.py
+    view = (stats.view if stats else None) or 'background'
+    slow_queries.labels(view=view).inc()
+    message = f'Wolne zapytanie ({duration * 1000:.1f} ms) w {view}: {normalize_sql(sql)}'
+    if getattr(settings, 'SLOW_QUERY_EXPLAIN', False) and not many and _explainable(connection, sql):
+        message += '\n' + explain(connection, sql, params)
+    logger.warning(message)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Sygnał przy każdym połączeniu - ten sam obiekt połączenia może łączyć się wielokrotnie
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@sync_and_async_middleware
+class QueryInstrumentationMiddleware:
+    """
+    Liczba zapytań SQL oraz łączny i najdłuższy czas zapytań dla każdego widoku
+    (histogramy Prometheus obok metryk django_prometheus). Przy DEBUG odpowiedź
+    dostaje nagłówki Server-Timing i X-DB-Queries; dla odpowiedzi strumieniowych
+    obejmują one tylko zapytania sprzed wysłania nagłówków, a metryki - całość.
+    Pod ASGI działa asynchronicznie - żądanie nie zajmuje wątku na czas widoku.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = QueryStats(request)
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    async def __acall__(self, request):
+        # Zapytania widoków i kodu synchronicznego (sync_to_async) wykonują się w kontekście
+        # skopiowanym z tej korutyny, więc trafiają do tych samych statystyk
+        stats = QueryStats(request)
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats)
+
+    def _finish(self, request, response, stats):
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"'
+            response['X-DB-Queries'] = stats.count
+
+        if response.streaming:
+            # Eksporty odpytują bazę dopiero przy wysyłaniu treści
+            response.streaming_content = self._streaming(response, stats, request)
+        else:
+            self._observe(request, stats)
+        return response
+
+    def _streaming(self, response, stats, request):
+        content = response.streaming_content
+        if response.is_async:
+            async def observed():
+                _current.set(stats)
+                try:
+                    async for part in content:
+                        yield part
+                finally:
+                    _current.set(None)
+                    self._observe(request, stats)
+        else:
+            def observed():
+                _current.set(stats)
+                try:
+                    yield from content
+                finally:
+                    _current.set(None)
+                    self._observe(request, stats)
+        return observed()
+
+    def _observe(self, request, stats):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        labels = {'view': view, 'method': request.method}
+        request_queries.labels(**labels).observe(stats.count)
+        request_query_seconds.labels(**labels).observe(stats.total)
+        request_max_query_seconds.labels(**labels).observe(stats.max)
+        if stats.count > getattr(settings, 'REQUEST_QUERY_WARNING', DEFAULT_REQUEST_QUERY_WARNING):
+            logger.warning('%s %s (%s): %d zapytań SQL, %.1f ms', request.method, request.path, view, stats.count, stats.total * 1000)
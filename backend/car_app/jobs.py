@@ -0,0 +1,172 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .importer import CarCsvImporter
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMPORT_JOB_STALE_SECONDS = 900
+
+STALE_JOB_ERROR = (
+    'Import został przerwany (restart lub awaria serwera) po {rows} wierszach. '
+    'Wgraj plik ponownie - samochody z external_id zostaną zaktualizowane, a nie zdublowane.'
+)
+
+_executor = None
+
+
+def get_executor():
+    """Zwraca lokalną pulę wątków wykonującą importy poza cyklem żądania HTTP."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMPORT_JOB_WORKERS', 2),
+            thread_name_prefix='import-job',
+        )
+    return _executor
+
+
+def enqueue_import_job(job):
+    # Zadanie trafia do puli dopiero po zatwierdzeniu transakcji, w której je utworzono
+    transaction.on_commit(lambda: get_executor().submit(run_import_job, job.pk))
+
+
+def run_import_job(job_id):
+    """
+    Wykonuje zadanie importu. Każda porcja jest zatwierdzana osobno,
+    więc postęp zapisany w ImportJob jest widoczny dla odpytującego klienta.
+    """
+    close_old_connections()
+    try:
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(pk=job_id, status=ImportJob.STATUS_PENDING).update(
+            status=ImportJob.STATUS_RUNNING,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if not claimed:
+            return
+
+        job = ImportJob.objects.select_related('user').get(pk=job_id)
+
+        def report_progress(rows_processed, rows_rejected, bytes_processed):
+            ImportJob.objects.filter(pk=job_id).update(
+                rows_processed=rows_processed,
+                rows_rejected=rows_rejected,
+                bytes_processed=bytes_processed,
+                heartbeat_at=timezone.now(),
+            )
+
+        importer = CarCsvImporter(job.user, on_chunk=report_progress, mode=job.mode)
+        try:
+            with job.file.open('rb') as source:
+                result = importer.run(source)
+        except Exception as e:
+            logger.exception('Import job %s failed', job_id)
+            ImportJob.objects.filter(pk=job_id).update(
+                status=ImportJob.STATUS_FAILED,
+                error=str(e),
+                # Pomiary do chwili błędu, z etapem, w którym wystąpił (failed_phase)
+                result=importer.telemetry.summary(importer.total_rows),
+                finished_at=timezone.now(),
+            )
+        else:
+            ImportJob.objects.filter(pk=job_id).update(
+                status=ImportJob.STATUS_DONE,
+                rows_processed=result['total_rows'],
+                rows_rejected=result['rejected_rows'],
+                bytes_processed=job.bytes_total,
+                result=result,
+                finished_at=timezone.now(),
+            )
+        finally:
+            job.file.delete(save=False)
+            ImportJob.objects.filter(pk=job_id).update(file='')
+    finally:
+        close_old_connections()
+
+
+def _stale_cutoff():
+    seconds = getattr(settings, 'IMPORT_JOB_STALE_SECONDS', DEFAULT_IMPORT_JOB_STALE_SECONDS)
+    return timezone.now() - timedelta(seconds=seconds)
+
+
+def stale_jobs():
+    """Zadania w stanie running bez sygnału życia dłużej niż IMPORT_JOB_STALE_SECONDS."""
+    cutoff = _stale_cutoff()
+    # Zadania rozpoczęte przed dodaniem heartbeat_at - wg czasu startu
+    return ImportJob.objects.filter(status=ImportJob.STATUS_RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+
+
+def recover_stale_jobs(jobs=None):
+    """
+    Przywraca zadania porzucone w stanie running. Zadanie bez zatwierdzonej porcji
+    wraca do kolejki (pending) - ponowne uruchomienie niczego nie dubluje. Po
+    zatwierdzonych porcjach nie wznawiamy: wiersze bez external_id zostałyby
+    wstawione drugi raz, więc zadanie kończy się błędem z liczbą wierszy.
+    Zwraca identyfikatory zadań przywróconych do kolejki.
+    """
+    jobs = stale_jobs() if jobs is None else jobs & stale_jobs()
+    requeued = []
+    for job in jobs:
+        # Warunek na heartbeat_at - zadanie mogło właśnie dać znak życia lub zostać przywrócone gdzie indziej
+        current = ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_RUNNING, heartbeat_at=job.heartbeat_at)
+        if not job.rows_processed and not job.rows_rejected:
+            if current.update(status=ImportJob.STATUS_PENDING, started_at=None, heartbeat_at=timezone.now(), bytes_processed=0):
+                logger.warning('Import job %s abandoned before its first chunk, requeued', job.pk)
+                requeued.append(job.pk)
+        elif current.update(
+            status=ImportJob.STATUS_FAILED,
+            error=STALE_JOB_ERROR.format(rows=job.rows_processed),
+            finished_at=timezone.now(),
+            file='',
+        ):
+            logger.warning('Import job %s abandoned after %s rows, marked failed', job.pk, job.rows_processed)
+            job.file.delete(save=False)
+    return requeued
+
+
+def resubmit_if_stale(job):
+    """
+    Zadanie pending, którego żadna pula nie rozpoczęła przez IMPORT_JOB_STALE_SECONDS
+    od utworzenia lub ostatniego przekazania - czekało w kolejce procesu, który
+    zakończył się (restart workera, wdrożenie). Trafia do puli tej instancji; podwójne
+    wykonanie wyklucza przejęcie zadania w run_import_job. Zwraca, czy przekazano.
+    """
+    last_signal = job.heartbeat_at or job.created_at
+    if job.status != ImportJob.STATUS_PENDING or last_signal >= _stale_cutoff():
+        return False
+    # Warunek na heartbeat_at - przy równoległym odpytywaniu zadanie jest przekazywane raz
+    if not ImportJob.objects.filter(pk=job.pk, status=ImportJob.STATUS_PENDING, heartbeat_at=job.heartbeat_at).update(
+        heartbeat_at=timezone.now()
+    ):
+        return False
+    logger.warning('Import job %s never started, resubmitted', job.pk)
+    enqueue_import_job(job)
+    return True
+
+
+def recover_if_stale(job):
+    """
+    Sprawdza odpytywane zadanie - porzucone lub nigdy nierozpoczęte wraca do kolejki
+    tej instancji albo kończy się błędem, więc klient nie czeka w nieskończoność.
+    Zwraca aktualny stan zadania.
+    """
+    if job.status == ImportJob.STATUS_PENDING:
+        if resubmit_if_stale(job):
+            job.refresh_from_db()
+        return job
+    last_signal = job.heartbeat_at or job.started_at
+    if job.status != ImportJob.STATUS_RUNNING or last_signal is None or last_signal >= _stale_cutoff():
+        return job
+    if recover_stale_jobs(ImportJob.objects.filter(pk=job.pk)):
+        enqueue_import_job(job)
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,74 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from car_app.models import Car
+from car_app.renderers import ORJSONRenderer
+from car_app.serializers import CarSerializer, car_values, represent_cars
+
+
+def serializer_path(queryset):
+    """Dotychczasowa ścieżka: obiekty modelu, CarSerializer, JSONRenderer DRF."""
+    return JSONRenderer().render(CarSerializer(list(queryset), many=True).data)
+
+
+def values_path(queryset):
+    """Szybka ścieżka: wiersze values(), represent_cars, ORJSONRenderer."""
+    return ORJSONRenderer().render(represent_cars(car_values(queryset)))
+
+
+PATHS = [('CarSerializer', serializer_path), ('values + orjson', values_path)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Porównuje czas serializacji strony samochodów przez CarSerializer z JSONRenderer '
+        'oraz przez values() z represent_cars i ORJSONRenderer (z zapytaniem i bez), '
+        'sprawdzając, że obie ścieżki dają identyczne bajty.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Nazwa użytkownika, którego samochody są serializowane')
+        parser.add_argument('--page-sizes', nargs='+', type=int, default=[25, 250, 5000])
+        parser.add_argument('--repeat', type=int, default=20, help='Liczba powtórzeń dla każdego rozmiaru')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Nie znaleziono użytkownika {options["user"]}')
+
+        for page_size in options['page_sizes']:
+            queryset = Car.objects.filter(user=user).order_by('-id')[:page_size]
+            # all() - nowa kopia zapytania, bez wyników zapamiętanych w poprzednim przebiegu
+            outputs = {name: path(queryset.all()) for name, path in PATHS}
+            if len(set(outputs.values())) != 1:
+                raise CommandError(f'Różne wyniki serializacji dla {page_size} wierszy')
+
+            # Wiersze i obiekty pobrane raz - sam koszt serializacji i renderowania
+            cars, rows = list(queryset), list(car_values(queryset))
+            timings = {
+                'CarSerializer': self.measure(lambda: JSONRenderer().render(CarSerializer(cars, many=True).data), options['repeat']),
+                'values + orjson': self.measure(lambda: ORJSONRenderer().render(represent_cars(rows)), options['repeat']),
+            }
+            with_query = {name: self.measure(lambda: path(queryset.all()), options['repeat']) for name, path in PATHS}
+
+            self.stdout.write(f'{page_size} wierszy ({len(outputs["CarSerializer"]) / 1024:.0f} KiB):')
+            for name, _ in PATHS:
+                self.stdout.write(
+                    f'  {name:<16} serializacja {timings[name]:8.2f} ms   z zapytaniem {with_query[name]:8.2f} ms'
+                )
+            self.stdout.write(
+                f'  przyspieszenie serializacji x{timings["CarSerializer"] / timings["values + orjson"]:.1f}, '
+                f'całości x{with_query["CarSerializer"] / with_query["values + orjson"]:.1f}'
+            )
+
+    def measure(self, function, repeat):
+        """Mediana czasu wywołania [ms]."""
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
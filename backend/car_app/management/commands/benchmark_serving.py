@@ -0,0 +1,198 @@
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+DEFAULT_PATHS = [
+    '/api/cars/?page_size=25',
+    '/api/cars/?page_size=25&ordering=-price',
+    '/api/statistics/',
+    '/api/recent-cars/',
+    '/api/users/me/',
+]
+
+
+def server_command(mode, address):
+    """Polecenie i zmienne środowiska trybu serwera."""
+    if mode == 'runserver':
+        # Dotychczasowa konfiguracja: serwer deweloperski, nowe połączenie z bazą przy każdym żądaniu
+        return [sys.executable, 'manage.py', 'runserver', '--noreload', address], {'DB_CONN_MAX_AGE': '0', 'SERVE_ASGI': 'False'}
+    if mode in ('wsgi', 'asgi'):
+        # Aplikacja i klasa workerów z gunicorn.conf.py według SERVE_ASGI
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', address], {
+            'SERVE_ASGI': str(mode == 'asgi'),
+        }
+    raise CommandError(f'Nieznany tryb serwera: {mode}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Uruchamia API w kolejnych trybach (runserver, gunicorn WSGI, gunicorn ASGI) i mierzy żądania/s '
+        'oraz opóźnienie p50/p99 przy zadanej współbieżności dla typowych endpointów. Z --exports '
+        'w tle działają wolni klienci pobierający eksport - pokazuje, czy długie eksporty '
+        'blokują pozostały ruch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Nazwa użytkownika, w imieniu którego wysyłane są żądania')
+        parser.add_argument('--modes', nargs='+', default=['runserver', 'wsgi', 'asgi'])
+        parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=2000, help='Liczba żądań na tryb')
+        parser.add_argument('--warmup', type=int, default=50)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--timeout', type=float, default=60, help='Limit czasu jednego żądania [s] - dłuższe liczone jako błąd')
+        parser.add_argument('--exports', type=int, default=0, help='Liczba równoczesnych wolnych pobrań eksportu')
+        parser.add_argument('--export-path', default='/api/export-csv/')
+        parser.add_argument('--export-rate', type=int, default=256, help='Tempo odbioru eksportu przez klienta [KiB/s]')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'Nie znaleziono użytkownika {options["user"]}')
+        token, _ = Token.objects.get_or_create(user=user)
+
+        address = f'127.0.0.1:{options["port"]}'
+        results = {}
+        for mode in options['modes']:
+            command, env = server_command(mode, address)
+            server = subprocess.Popen(
+                command, cwd=settings.BASE_DIR, env={**os.environ, **env},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                self.wait_ready(f'http://{address}')
+                with SlowExports(f'http://{address}', token.key, options) as exports:
+                    results[mode] = self.run_load(f'http://{address}', token.key, options)
+                results[mode]['exports'] = exports.throughput()
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            self.stdout.write(f'{mode}: {self.format_result(results[mode])}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{options["requests"]} żądań, współbieżność {options["concurrency"]}, '
+            f'wolne eksporty w tle: {options["exports"]} x {options["export_rate"]} KiB/s'
+        ))
+        self.stdout.write(f'{"tryb":<12}{"żądania/s":>12}{"p50 [ms]":>12}{"p99 [ms]":>12}{"błędy":>8}{"eksport MiB/s":>15}')
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<12}{result["rps"]:>12.1f}{result["p50"]:>12.1f}{result["p99"]:>12.1f}'
+                f'{result["errors"]:>8}{result["exports"]:>15.2f}'
+            )
+
+    def wait_ready(self, base_url, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(f'{base_url}/readyz/', timeout=2) as response:
+                    if response.status == 200:
+                        return
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'Serwer {base_url} nie jest gotowy po {timeout} s')
+
+    def run_load(self, base_url, token, options):
+        paths = options['paths']
+
+        def fetch(index):
+            request = urllib.request.Request(
+                f'{base_url}{paths[index % len(paths)]}', headers={'Authorization': f'Token {token}'}
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                ok = False
+            return time.perf_counter() - started, ok
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(fetch, range(options['warmup'])))
+            started = time.perf_counter()
+            samples = list(pool.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for latency, _ in samples)
+        return {
+            'rps': len(samples) / elapsed,
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'errors': sum(1 for _, ok in samples if not ok),
+        }
+
+    def format_result(self, result):
+        return (
+            f'{result["rps"]:.1f} żądań/s, p50 {result["p50"]:.1f} ms, p99 {result["p99"]:.1f} ms, '
+            f'błędy {result["errors"]}, eksporty w tle {result["exports"]:.2f} MiB/s'
+        )
+
+
+class SlowExports:
+    """
+    Wątki pobierające w kółko eksport w ograniczonym tempie (wolne łącze klienta)
+    przez cały czas pomiaru. ``throughput()`` - łączne tempo pobierania [MiB/s]; przy
+    obsłużonych wszystkich klientach bliskie ``exports * export_rate``.
+    """
+
+    def __init__(self, base_url, token, options):
+        self.url = f'{base_url}{options["export_path"]}'
+        self.token = token
+        self.count = options['exports']
+        self.block = 16 * 1024
+        self.delay = self.block / (options['export_rate'] * 1024)
+        self.received = 0
+        self.started = self.finished = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def __enter__(self):
+        self.threads = [threading.Thread(target=self.download, daemon=True) for _ in range(self.count)]
+        for thread in self.threads:
+            thread.start()
+        # Eksporty zdążą zająć serwer przed pomiarem
+        if self.threads:
+            time.sleep(1)
+        with self.lock:
+            self.received = 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.finished = time.perf_counter()
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def throughput(self):
+        if not self.threads:
+            return 0.0
+        return self.received / (self.finished - self.started) / 2 ** 20
+
+    def download(self):
+        request = urllib.request.Request(self.url, headers={'Authorization': f'Token {self.token}'})
+        while not self.stopping.is_set():
+            try:
+                with urllib.request.urlopen(request, timeout=300) as response:
+                    while block := response.read(self.block):
+                        if self.stopping.is_set():
+                            return
+                        with self.lock:
+                            self.received += len(block)
+                        time.sleep(self.delay)
+            except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError):
+                time.sleep(0.5)
@@ -0,0 +1,171 @@
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from car_app.dimensions import DIMENSION_FIELDS, dimension_model, resolve_ids
+from car_app.models import Car
+from .explain_car_queries import Command as ExplainCommand
+
+TENANT_PREFIX = 'bench-tenant-'
+# Wiersze generowane jednym INSERT ... SELECT (jedna transakcja)
+LOAD_BATCH_ROWS = 1_000_000
+
+DIMENSION_VALUES = {
+    'mark': ['Audi', 'BMW', 'Ford', 'Opel', 'Skoda', 'Toyota', 'Volkswagen', 'Renault'],
+    'model': [f'Model {number}' for number in range(1, 41)],
+    'fuel': ['Gasoline', 'Diesel', 'LPG', 'Hybrid', 'Electric'],
+    'city': [f'Miasto {number}' for number in range(1, 101)],
+    'province': [f'Województwo {number}' for number in range(1, 17)],
+}
+
+# Wartości wyliczane z numeru wiersza g - deterministyczne, bez random() na każdy wiersz
+INSERT_SQL = '''
+    INSERT INTO car_app_car (user_id, external_id, mark_id, model_id, generation_name, year, mileage,
+                             vol_engine, fuel_id, city_id, province_id, price)
+    SELECT %(user)s, g,
+           (%(mark)s::int[])[1 + mod(g, %(mark_count)s)],
+           (%(model)s::int[])[1 + mod(g * 7, %(model_count)s)],
+           'gen ' || mod(g, 7),
+           1990 + mod(g * 13, 34),
+           mod(g::bigint * 7919, 400000),
+           1.0 + mod(g, 30) / 10.0,
+           (%(fuel)s::int[])[1 + mod(g * 3, %(fuel_count)s)],
+           (%(city)s::int[])[1 + mod(g * 11, %(city_count)s)],
+           (%(province)s::int[])[1 + mod(g * 5, %(province_count)s)],
+           5000 + mod(g::bigint * 104729, 200000)
+    FROM generate_series(%(start)s, %(stop)s) AS g
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Generuje konta o nierównych rozmiarach (rozkład Zipfa) i mierzy opóźnienie typowych zapytań '
+        'dla najmniejszego, środkowego i największego konta oraz koszt usunięcia konta '
+        '(kaskada z UserMeView.delete). Uruchom przed i po migracji 0010 (--keep / --skip-load), '
+        'aby porównać tabelę zwykłą i partycjonowaną.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50_000_000, help='Łączna liczba samochodów')
+        parser.add_argument('--tenants', type=int, default=1000, help='Liczba kont')
+        parser.add_argument('--skew', type=float, default=1.0, help='Wykładnik rozkładu Zipfa rozmiarów kont')
+        parser.add_argument('--repeat', type=int, default=20, help='Powtórzenia każdego zapytania')
+        parser.add_argument('--skip-load', action='store_true', help='Użyj kont z poprzedniego uruchomienia (--keep)')
+        parser.add_argument('--keep', action='store_true', help='Nie usuwaj wygenerowanych kont na końcu')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Polecenie wymaga bazy PostgreSQL.')
+
+        if not options['skip_load']:
+            self.cleanup()
+            self.load(self.tenant_sizes(options['rows'], options['tenants'], options['skew']))
+
+        tenants = self.tenants()
+        if not tenants:
+            raise CommandError('Brak kont testowych - uruchom bez --skip-load.')
+        self.describe_table()
+        # Najmniejsze, środkowe i największe konto
+        selected = {
+            'small': tenants[0],
+            'median': tenants[len(tenants) // 2],
+            'large': tenants[-1],
+        }
+        self.measure_queries(selected, options['repeat'])
+        self.measure_delete(selected)
+
+        if not options['keep']:
+            self.cleanup()
+
+    def tenant_sizes(self, rows, tenants, skew):
+        weights = [1 / (rank + 1) ** skew for rank in range(tenants)]
+        total = sum(weights)
+        return [max(1, round(rows * weight / total)) for weight in weights]
+
+    def load(self, sizes):
+        arrays = {}
+        for field in DIMENSION_FIELDS:
+            ids = resolve_ids(dimension_model(field), DIMENSION_VALUES[field])
+            arrays[field] = [ids[name] for name in DIMENSION_VALUES[field]]
+            arrays[f'{field}_count'] = len(arrays[field])
+
+        started = time.perf_counter()
+        loaded = 0
+        for index, size in enumerate(sizes):
+            user = User.objects.create(username=f'{TENANT_PREFIX}{index:05d}')
+            for start in range(1, size + 1, LOAD_BATCH_ROWS):
+                stop = min(size, start + LOAD_BATCH_ROWS - 1)
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(INSERT_SQL, {**arrays, 'user': user.pk, 'start': start, 'stop': stop})
+                loaded += stop - start + 1
+            if index % 100 == 0 or index == len(sizes) - 1:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{index + 1}/{len(sizes)} kont, {loaded} wierszy, {loaded / elapsed:,.0f} wierszy/s')
+
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM ANALYZE car_app_car')
+
+    def tenants(self):
+        """Konta testowe z liczbą samochodów, od najmniejszego."""
+        counts = (
+            Car.objects.filter(user__username__startswith=TENANT_PREFIX)
+            .values('user').annotate(count=Count('id')).order_by('count', 'user')
+        )
+        users = User.objects.in_bulk([row['user'] for row in counts])
+        return [(users[row['user']], row['count']) for row in counts]
+
+    def describe_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT c.relkind, count(i.inhrelid), pg_size_pretty(pg_total_relation_size(c.oid) + "
+                "coalesce(sum(pg_total_relation_size(i.inhrelid)), 0)) "
+                "FROM pg_class c LEFT JOIN pg_inherits i ON i.inhparent = c.oid "
+                "WHERE c.oid = 'car_app_car'::regclass GROUP BY c.relkind, c.oid"
+            )
+            kind, partitions, size = cursor.fetchone()
+        layout = f'partycjonowana ({partitions} partycji)' if kind == 'p' else 'zwykła'
+        self.stdout.write(self.style.MIGRATE_HEADING(f'Tabela car_app_car: {layout}, {size}'))
+
+    def measure_queries(self, selected, repeat):
+        header = f'{"zapytanie":<26}' + ''.join(
+            f'{f"{label} ({count:,} wierszy)":>30}' for label, (_, count) in selected.items()
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING('Mediana / p95 [ms]'))
+        self.stdout.write(header)
+
+        queries = {label: ExplainCommand().get_queries(user) for label, (user, _) in selected.items()}
+        for name in queries['small']:
+            cells = []
+            for label in selected:
+                sql, params = queries[label][name]
+                timings = []
+                with connection.cursor() as cursor:
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        cursor.execute(sql, params)
+                        cursor.fetchall()
+                        timings.append((time.perf_counter() - started) * 1000)
+                p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+                cells.append(f'{statistics.median(timings):.2f} / {p95:.2f}')
+            self.stdout.write(f'{name:<26}' + ''.join(f'{cell:>30}' for cell in cells))
+
+    def measure_delete(self, selected):
+        """Usunięcie konta jak w UserMeView.delete; transakcja jest wycofywana, więc dane zostają."""
+        self.stdout.write(self.style.MIGRATE_HEADING('Usunięcie konta (kaskada)'))
+        for label, (user, count) in selected.items():
+            with transaction.atomic():
+                started = time.perf_counter()
+                User.objects.get(pk=user.pk).delete()
+                # Klucze obce są DEFERRABLE - sprawdzane dopiero przy zatwierdzeniu
+                with connection.cursor() as cursor:
+                    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+                elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            self.stdout.write(f'{label:<8} {count:>12,} wierszy: {elapsed:.3f} s ({count / elapsed:,.0f} wierszy/s)')
+
+    def cleanup(self):
+        deleted, _ = User.objects.filter(username__startswith=TENANT_PREFIX).delete()
+        if deleted:
+            self.stdout.write(f'Usunięto konta testowe ({deleted} obiektów)')
@@ -0,0 +1,74 @@
+import re
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Avg, Count
+from car_app.dimensions import sort_lookup
+from car_app.models import Car
+from car_app.pagination import keyset_order
+
+LIST_FIELDS = ('id', 'mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price')
+
+
+class Command(BaseCommand):
+    help = (
+        'Wyświetla plany (EXPLAIN ANALYZE) typowych zapytań listy, eksportów i statystyk '
+        'dla wskazanego użytkownika. Uruchom przed i po migracji indeksów, aby porównać plany.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Nazwa lub id użytkownika')
+        parser.add_argument('--no-analyze', action='store_true', help='Tylko plan, bez wykonywania zapytań')
+        parser.add_argument('--summary', action='store_true', help='Wypisz tylko czasy wykonania')
+
+    def get_user(self, value):
+        lookup = {'pk': int(value)} if value.isdigit() else {'username': value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'Nie znaleziono użytkownika {value}')
+
+    def list_page(self, listing, ordering):
+        """Pierwsza strona listy jak w widoku (paginacja kursorowa): pola słownikowe wg nazwy, id rozstrzyga remisy."""
+        return keyset_order(listing, sort_lookup(ordering.lstrip('-')), ordering.startswith('-'))[:25]
+
+    def get_queries(self, user):
+        cars = Car.objects.filter(user=user)
+        listing = cars.only(*LIST_FIELDS)
+        current_year = datetime.now().year
+        queries = {
+            'list -id (page 1)': listing.order_by('-id')[:25],
+            'list -id (offset 10000)': listing.order_by('-id')[10000:10025],
+            'list price': self.list_page(listing, 'price'),
+            'list -mileage': self.list_page(listing, '-mileage'),
+            'list mark': self.list_page(listing, 'mark'),
+            'list year/price range': listing.filter(
+                year__gte=2010, year__lte=2020, price__gte=20000, price__lte=80000
+            ).order_by('-id')[:25],
+            'price trends': cars.filter(year__gte=current_year - 11, year__lte=current_year)
+                .values('year').annotate(avg_price=Avg('price')).order_by('year'),
+            'cars by fuel': cars.values('fuel').annotate(count=Count('id')).order_by('-count'),
+            'cars by mark': cars.values('mark').annotate(count=Count('id')).order_by('-count')[:10],
+        }
+        queries = {name: queryset.query.sql_with_params() for name, queryset in queries.items()}
+        sql, params = cars.values('id').order_by().query.sql_with_params()
+        queries['count'] = (f'SELECT COUNT(*) FROM ({sql}) subquery', params)
+        return queries
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Polecenie wymaga bazy PostgreSQL.')
+        user = self.get_user(options['user'])
+        explain = 'EXPLAIN' if options['no_analyze'] else 'EXPLAIN (ANALYZE, BUFFERS)'
+
+        for name, (sql, params) in self.get_queries(user).items():
+            with connection.cursor() as cursor:
+                cursor.execute(f'{explain} {sql}', params)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            timing = re.search(r'Execution Time: ([\d.]+) ms', plan)
+            timing = f'{timing.group(1)} ms' if timing else '-'
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {timing}'))
+            if not options['summary']:
+                self.stdout.write(plan)
+                self.stdout.write('')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from car_app.jobs import recover_stale_jobs, run_import_job
+from car_app.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Wykonuje oczekujące zadania importu CSV (np. po restarcie serwera lub jako osobny proces roboczy). '
+        'Zadania porzucone w stanie running wracają najpierw do kolejki albo kończą się błędem.'
+    )
+
+    def handle(self, *args, **options):
+        for job_id in recover_stale_jobs():
+            self.stdout.write(f'Import job {job_id} abandoned, requeued')
+        pending = ImportJob.objects.filter(status=ImportJob.STATUS_PENDING).order_by('id').values_list('id', flat=True)
+        for job_id in list(pending):
+            self.stdout.write(f'Import job {job_id}...')
+            run_import_job(job_id)
+            job = ImportJob.objects.get(pk=job_id)
+            self.stdout.write(f'  {job.status}: {job.rows_processed} rows, {job.rows_rejected} rejected')
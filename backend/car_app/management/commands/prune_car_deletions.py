@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from car_app.models import CarDeletion
+
+
+class Command(BaseCommand):
+    help = 'Usuwa ślady usuniętych samochodów starsze niż CAR_DELETION_RETENTION_DAYS (feed zmian).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CAR_DELETION_RETENTION_DAYS,
+                            help='Okres przechowywania w dniach')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = CarDeletion.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Usunięto {deleted} śladów starszych niż {cutoff:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from car_app.summary import check_summary, rebuild_summary
+
+
+class Command(BaseCommand):
+    help = 'Przebudowuje od zera podsumowania statystyk samochodów lub (--check) porównuje je z agregacją na żywo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('users', nargs='*', help='Nazwy użytkowników (domyślnie wszyscy)')
+        parser.add_argument('--check', action='store_true', help='Tylko sprawdź zgodność, bez przebudowy')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        inconsistent = 0
+        for user in users.iterator():
+            if not options['check']:
+                rebuild_summary(user.pk)
+                self.stdout.write(f'{user.username}: przebudowano')
+                continue
+
+            differences = check_summary(user.pk)
+            if differences:
+                inconsistent += 1
+                self.stdout.write(self.style.ERROR(f'{user.username}: {len(differences)} rozbieżności'))
+                for difference in differences:
+                    self.stdout.write(f'  {difference}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{user.username}: OK'))
+
+        if inconsistent:
+            raise SystemExit(1)
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY nie blokuje zapisów, ale nie może działać w transakcji
+    atomic = False
+
+    dependencies = [
+        ('car_app', '0003_importjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'id'], name='car_user_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'year', 'id'], include=('price', 'mileage'), name='car_user_year_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'price', 'id'], name='car_user_price_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'mileage', 'id'], name='car_user_mileage_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'mark', 'id'], name='car_user_mark_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'model', 'id'], name='car_user_model_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'fuel', 'id'], name='car_user_fuel_idx'),
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cars', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
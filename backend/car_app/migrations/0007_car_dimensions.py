@@ -0,0 +1,128 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:02
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+# (pole samochodu, tabela słownika)
+DIMENSIONS = [
+    ('mark', 'car_app_mark'),
+    ('model', 'car_app_carmodel'),
+    ('fuel', 'car_app_fuel'),
+    ('city', 'car_app_city'),
+    ('province', 'car_app_province'),
+]
+
+
+def canonical(column):
+    # Odpowiednik dimensions.canonical_name() - nadmiarowe białe znaki są usuwane
+    return rf"btrim(regexp_replace({column}, '\s+', ' ', 'g'))"
+
+
+# Klucze obce Django są DEFERRABLE - bez natychmiastowego sprawdzania kolejne ALTER TABLE
+# w tej samej transakcji zgłosiłyby "pending trigger events"
+FORWARD_SQL = ['SET CONSTRAINTS ALL IMMEDIATE'] + [
+    f'INSERT INTO {table} (name) SELECT DISTINCT {canonical(f"{field}_name")} FROM car_app_car ON CONFLICT (name) DO NOTHING'
+    for field, table in DIMENSIONS
+] + [
+    'UPDATE car_app_car SET {} FROM {} WHERE {}'.format(
+        ', '.join(f'{field}_id = {table}.id' for field, table in DIMENSIONS),
+        ', '.join(table for _, table in DIMENSIONS),
+        ' AND '.join(f'{table}.name = {canonical(f"car_app_car.{field}_name")}' for field, table in DIMENSIONS),
+    ),
+]
+
+REVERSE_SQL = ['SET CONSTRAINTS ALL IMMEDIATE'] + [
+    'UPDATE car_app_car SET {} FROM {} WHERE {}'.format(
+        ', '.join(f'{field}_name = {table}.name' for field, table in DIMENSIONS),
+        ', '.join(table for _, table in DIMENSIONS),
+        ' AND '.join(f'{table}.id = car_app_car.{field}_id' for field, table in DIMENSIONS),
+    ),
+]
+
+
+def dimension_model(name, max_length=100):
+    return migrations.CreateModel(
+        name=name,
+        fields=[
+            ('id', models.AutoField(primary_key=True, serialize=False)),
+            ('name', models.CharField(max_length=max_length, unique=True)),
+        ],
+        options={
+            'ordering': ['name'],
+            'abstract': False,
+        },
+    )
+
+
+def dimension_key(model, null):
+    return models.ForeignKey(
+        db_index=False,
+        null=null,
+        on_delete=django.db.models.deletion.PROTECT,
+        related_name='cars',
+        to=f'car_app.{model}',
+    )
+
+
+DIMENSION_MODELS = {'mark': 'mark', 'model': 'carmodel', 'fuel': 'fuel', 'city': 'city', 'province': 'province'}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_app', '0006_car_stats_summary'),
+    ]
+
+    operations = [
+        dimension_model('Mark'),
+        dimension_model('CarModel'),
+        dimension_model('Fuel', max_length=50),
+        dimension_model('City'),
+        dimension_model('Province'),
+        # Indeksy i wektor wyszukiwania zależą od kolumn tekstowych - odtwarzane na końcu
+        migrations.RemoveIndex(model_name='car', name='car_user_mark_idx'),
+        migrations.RemoveIndex(model_name='car', name='car_user_model_idx'),
+        migrations.RemoveIndex(model_name='car', name='car_user_fuel_idx'),
+        migrations.RemoveIndex(model_name='car', name='car_search_vector_idx'),
+        migrations.RemoveField(model_name='car', name='search_vector'),
+        *[
+            migrations.RenameField(model_name='car', old_name=field, new_name=f'{field}_name')
+            for field in DIMENSION_MODELS
+        ],
+        *[
+            migrations.AddField(model_name='car', name=field, field=dimension_key(model, null=True))
+            for field, model in DIMENSION_MODELS.items()
+        ],
+        migrations.RunSQL(FORWARD_SQL, REVERSE_SQL),
+        *[
+            migrations.AlterField(model_name='car', name=field, field=dimension_key(model, null=False))
+            for field, model in DIMENSION_MODELS.items()
+        ],
+        *[
+            migrations.RemoveField(model_name='car', name=f'{field}_name')
+            for field in DIMENSION_MODELS
+        ],
+        migrations.AddField(
+            model_name='car',
+            name='search_vector',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('generation_name', config='simple'), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['user', 'mark', 'id'], name='car_user_mark_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['user', 'model', 'id'], name='car_user_model_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['user', 'fuel', 'id'], name='car_user_fuel_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='car_search_vector_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Dotychczasowe ponowne importy mogły zostawić kilka wierszy z tym samym external_id.
+# Identyfikator zostaje przy najnowszym wierszu, starsze kopie go tracą (dane zostają).
+DETACH_DUPLICATES_SQL = '''
+UPDATE car_app_car SET external_id = NULL
+WHERE id IN (
+    SELECT id FROM (
+        SELECT id, row_number() OVER (PARTITION BY user_id, external_id ORDER BY id DESC) AS position
+        FROM car_app_car
+        WHERE external_id IS NOT NULL
+    ) ranked
+    WHERE position > 1
+)
+'''
+
+# Indeks budowany bez blokowania zapisów, a następnie podpinany jako ograniczenie
+CREATE_CONSTRAINT_SQL = [
+    'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS car_user_external_id_unique ON car_app_car (user_id, external_id)',
+    'ALTER TABLE car_app_car ADD CONSTRAINT car_user_external_id_unique UNIQUE USING INDEX car_user_external_id_unique',
+]
+
+DROP_CONSTRAINT_SQL = 'ALTER TABLE car_app_car DROP CONSTRAINT IF EXISTS car_user_external_id_unique'
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('car_app', '0007_car_dimensions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('upsert', 'Dodaj i aktualizuj'), ('sync', 'Synchronizuj (usuń brakujące)')], default='upsert', max_length=20),
+        ),
+        migrations.RunSQL(DETACH_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(CREATE_CONSTRAINT_SQL, DROP_CONSTRAINT_SQL),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='car',
+                    constraint=models.UniqueConstraint(fields=('user', 'external_id'), name='car_user_external_id_unique'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:35
+
+import django.db.models.deletion
+import django.db.models.functions.datetime
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indeks na dużej tabeli samochodów budowany bez blokowania zapisów (CONCURRENTLY)
+    atomic = False
+
+    dependencies = [
+        ('car_app', '0008_car_external_id_unique'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('car_id', models.BigIntegerField()),
+                ('external_id', models.IntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now())),
+            ],
+        ),
+        # DEFAULT now() jest stabilny, więc PostgreSQL dodaje kolumny bez przepisywania tabeli;
+        # istniejące wiersze dostają czas migracji
+        migrations.AddField(
+            model_name='car',
+            name='created_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), editable=False),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='updated_at',
+            field=models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), editable=False),
+        ),
+        AddIndexConcurrently(
+            model_name='car',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='car_user_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='cardeletion',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='car_deletions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='cardeletion',
+            index=models.Index(fields=['user', 'deleted_at', 'id'], name='car_deletion_user_idx'),
+        ),
+    ]
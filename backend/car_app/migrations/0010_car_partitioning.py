@@ -0,0 +1,126 @@
+from django.db import migrations
+
+# Liczba partycji (HASH po user_id). Zmiana wymaga nowej migracji przebudowującej tabelę.
+PARTITIONS = 16
+
+TABLE = 'car_app_car'
+NEW_TABLE = 'car_app_car_new'
+SEQUENCE = 'car_app_car_id_seq'
+
+
+def table_definitions(cursor, table):
+    """
+    Definicje ograniczeń (klucz główny, unikalne, klucze obce) i pozostałych indeksów
+    tabeli - odtwarzane bez zmian na przebudowanej tabeli o tej samej nazwie.
+    """
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f') ORDER BY contype, conname",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass "
+        "AND indexrelid NOT IN (SELECT conindid FROM pg_constraint WHERE conrelid = %s::regclass) "
+        "ORDER BY indexrelid::regclass::text",
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    return constraints, indexes
+
+
+def copied_columns(cursor, table):
+    # Kolumny generowane (search_vector) są wyliczane ponownie przy wstawianiu
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER' "
+        "ORDER BY ordinal_position",
+        [table],
+    )
+    return ', '.join(f'"{row[0]}"' for row in cursor.fetchall())
+
+
+def rebuild(schema_editor, create_table, primary_key, restore_id):
+    """
+    Tworzy nową tabelę (LIKE - te same kolumny, domyślne wartości i kolumny generowane),
+    kopiuje wiersze, podmienia tabele i odtwarza ograniczenia oraz indeksy pod tymi
+    samymi nazwami. Tabela jest zablokowana do końca migracji.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        constraints, indexes = table_definitions(cursor, TABLE)
+        columns = copied_columns(cursor, TABLE)
+        cursor.execute(f'LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(create_table)
+        cursor.execute(f'INSERT INTO {NEW_TABLE} ({columns}) SELECT {columns} FROM {TABLE}')
+        cursor.execute(f'DROP TABLE {TABLE}')
+        cursor.execute(f'ALTER TABLE {NEW_TABLE} RENAME TO {TABLE}')
+        restore_id(cursor)
+        for name, kind, definition in constraints:
+            if kind == 'p':
+                definition = primary_key
+            cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+        cursor.execute(f'ANALYZE {TABLE}')
+
+
+def restore_sequence(cursor):
+    # Kolumna tożsamości nie jest obsługiwana w tabelach partycjonowanych (PostgreSQL < 17) -
+    # id pochodzi ze zwykłej sekwencji, którą Django odczytuje przez pg_get_serial_sequence
+    cursor.execute(f'CREATE SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}')")
+    cursor.execute(f"SELECT setval('{SEQUENCE}', coalesce(max(id), 0) + 1, false) FROM {TABLE}")
+
+
+def restore_identity(cursor):
+    cursor.execute(f'ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), coalesce(max(id), 0) + 1, false) FROM {TABLE}"
+    )
+
+
+def partition_cars(apps, schema_editor):
+    # Identyfikatory z sekwencji są globalnie unikalne; klucz główny musi zawierać
+    # klucz partycjonowania, a (id, user_id) obsługuje też wyszukiwanie po samym id
+    create_table = f'CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY HASH (user_id)'
+    create_partitions = [
+        f'CREATE TABLE {TABLE}_p{remainder} PARTITION OF {NEW_TABLE} FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})'
+        for remainder in range(PARTITIONS)
+    ]
+    rebuild(
+        schema_editor,
+        '; '.join([create_table] + create_partitions),
+        'PRIMARY KEY (id, user_id)',
+        restore_sequence,
+    )
+
+
+def unpartition_cars(apps, schema_editor):
+    # LIKE kopiuje DEFAULT nextval() sekwencji, która zniknie razem z tabelą partycjonowaną
+    create_table = (
+        f'CREATE TABLE {NEW_TABLE} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING GENERATED); '
+        f'ALTER TABLE {NEW_TABLE} ALTER COLUMN id DROP DEFAULT'
+    )
+    rebuild(schema_editor, create_table, 'PRIMARY KEY (id)', restore_identity)
+
+
+class Migration(migrations.Migration):
+    """
+    Tabela samochodów partycjonowana po user_id (HASH, PARTITIONS partycji): zapytania
+    filtrują po użytkowniku, więc trafiają do jednej partycji - z własnym VACUUM,
+    mniejszymi indeksami i bez wpływu dużych kont na małe. Stan modelu się nie zmienia.
+
+    Dalsze migracje modelu Car: CREATE INDEX na tabeli partycjonowanej nie działa
+    z CONCURRENTLY (bez AddIndexConcurrently), a ograniczenia unikalności muszą
+    zawierać user_id.
+    """
+
+    dependencies = [
+        ('car_app', '0009_car_changes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_cars, unpartition_cars),
+    ]
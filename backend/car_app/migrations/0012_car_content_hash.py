@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:41
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('car_app', '0011_importjob_heartbeat'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='content_hash',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.MD5(django.db.models.functions.text.Concat(models.F('mark'), models.Value('|'), models.F('model'), models.Value('|'), models.F('generation_name'), models.Value('|'), models.F('year'), models.Value('|'), models.F('mileage'), models.Value('|'), models.F('vol_engine'), models.Value('|'), models.F('fuel'), models.Value('|'), models.F('city'), models.Value('|'), models.F('province'), models.Value('|'), models.F('price'), output_field=models.TextField())), output_field=models.CharField(max_length=32)),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(condition=models.Q(('external_id__isnull', True)), fields=['user', 'content_hash'], name='car_user_content_hash_idx'),
+        ),
+    ]
@@ -1,22 +1,215 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models.functions import MD5, Concat, Now
+
+class Dimension(models.Model):
+    """
+    Tabela słownikowa (marka, model, paliwo...) - samochód przechowuje tylko
+    klucz obcy, a każda nazwa występuje w bazie raz. Wpisy nie są zmieniane
+    ani usuwane, więc pary id <-> nazwa można trzymać w pamięci procesu.
+    """
+    # Klucz 4-bajtowy zamiast domyślnego 8-bajtowego - słowniki mają najwyżej tysiące wpisów
+    id = models.AutoField(primary_key=True)
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+
+class Mark(Dimension):
+    pass
+
+class CarModel(Dimension):
+    pass
+
+class Fuel(Dimension):
+    name = models.CharField(max_length=50, unique=True)
+
+class City(Dimension):
+    pass
+
+class Province(Dimension):
+    pass
+
+# Kolumny treści samochodu - wszystko poza właścicielem, identyfikatorami i znacznikami czasu
+CAR_CONTENT_FIELDS = ['mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price']
 
 class Car(models.Model):
     external_id = models.IntegerField(null=True, blank=True)  
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cars')
-    mark = models.CharField(max_length=100)
-    model = models.CharField(max_length=100)
+    # Indeks na user_id zapewnia złożony indeks (user, id) z Meta.indexes
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cars', db_index=False)
+    # Klucze słownikowe bez osobnych indeksów - zapytania zawsze filtrują po użytkowniku,
+    # więc korzystają z indeksów (user, pole, id) z Meta.indexes
+    mark = models.ForeignKey(Mark, on_delete=models.PROTECT, related_name='cars', db_index=False)
+    model = models.ForeignKey(CarModel, on_delete=models.PROTECT, related_name='cars', db_index=False)
     generation_name = models.CharField(max_length=100, blank=True, null=True)
     year = models.IntegerField()
     mileage = models.IntegerField()
     vol_engine = models.FloatField()
-    fuel = models.CharField(max_length=50)
-    city = models.CharField(max_length=100)
-    province = models.CharField(max_length=100)
+    fuel = models.ForeignKey(Fuel, on_delete=models.PROTECT, related_name='cars', db_index=False)
+    city = models.ForeignKey(City, on_delete=models.PROTECT, related_name='cars', db_index=False)
+    province = models.ForeignKey(Province, on_delete=models.PROTECT, related_name='cars', db_index=False)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Kolumna generowana przez bazę - aktualna także dla wierszy z COPY i bulk_create.
+    # Nazwy słownikowe są wyszukiwane w (małych) tabelach słowników, tu zostaje tylko generacja
+    search_vector = models.GeneratedField(
+        expression=SearchVector('generation_name', config='simple'),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+    # Skrót treści (CAR_CONTENT_FIELDS) - import rozpoznaje wiersz bez external_id jako już
+    # zapisany porównaniem równościowym (złączenie haszujące, indeks), a nie każdy z każdym.
+    # Pusta generacja i NULL dają ten sam skrót - import porównuje jeszcze same kolumny
+    content_hash = models.GeneratedField(
+        expression=MD5(Concat(*[
+            part for field in CAR_CONTENT_FIELDS for part in (models.Value('|'), models.F(field))
+        ][1:], output_field=models.TextField())),
+        output_field=models.CharField(max_length=32),
+        db_persist=True,
+    )
+    # Czas nadawany przez bazę (Now() = statement_timestamp()), także dla wierszy z COPY i bulk_create;
+    # zapisy przez ORM ustawiają updated_at wartością changes.start_car_write() z tej samej transakcji.
+    # Feed zmian wymaga, by transakcja zapisu zaczynała się od start_car_write(), a znacznik
+    # nie był wcześniejszy niż ta chwila
+    created_at = models.DateTimeField(db_default=Now(), editable=False)
+    updated_at = models.DateTimeField(db_default=Now(), editable=False)
     
     def __str__(self):
         return f"{self.mark} {self.model} ({self.year})"
 
     class Meta:
-        ordering = ['-id']
\ No newline at end of file
+        ordering = ['-id']
+        # Tabela jest partycjonowana po user_id (migracja 0010) - ograniczenia unikalności
+        # muszą zawierać user, a filtr po użytkowniku wybiera jedną partycję.
+        # Każde zapytanie filtruje po user_id i sortuje po jednym z ordering_fields z id jako
+        # rozstrzygnięciem remisów - indeksy (user, pole, id) obsługują filtr, sortowanie
+        # i paginację kursorową bez sortowania w pamięci. Wyjątek to pola słownikowe,
+        # sortowane wg nazwy ze słownika: indeks (user, mark, id) daje wtedy grupy jednej
+        # marki, sortowane po id w pamięci (dimensions.sort_lookup)
+        indexes = [
+            models.Index(fields=['user', 'id'], name='car_user_id_idx'),
+            models.Index(fields=['user', 'year', 'id'], include=['price', 'mileage'], name='car_user_year_idx'),
+            models.Index(fields=['user', 'price', 'id'], name='car_user_price_idx'),
+            models.Index(fields=['user', 'mileage', 'id'], name='car_user_mileage_idx'),
+            models.Index(fields=['user', 'mark', 'id'], name='car_user_mark_idx'),
+            models.Index(fields=['user', 'model', 'id'], name='car_user_model_idx'),
+            models.Index(fields=['user', 'fuel', 'id'], name='car_user_fuel_idx'),
+            # Import wierszy bez external_id (importer.CarCsvImporter._upsert)
+            models.Index(
+                fields=['user', 'content_hash'], condition=models.Q(external_id__isnull=True), name='car_user_content_hash_idx'
+            ),
+            # Feed zmian (/api/cars/changes/) - kursor (updated_at, id)
+            models.Index(fields=['user', 'updated_at', 'id'], name='car_user_updated_idx'),
+            GinIndex(fields=['search_vector'], name='car_search_vector_idx'),
+        ]
+        constraints = [
+            # Klucz importu z upsertem - ponowne wgranie tego samego pliku aktualizuje wiersze
+            models.UniqueConstraint(fields=['user', 'external_id'], name='car_user_external_id_unique'),
+        ]
+
+class CarDeletion(models.Model):
+    """
+    Ślad po usuniętym samochodzie dla feedu zmian - klient z lokalną kopią
+    danych dowiaduje się z niego, które wiersze usunąć. Starsze niż
+    CAR_DELETION_RETENTION_DAYS są kasowane (prune_car_deletions).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='car_deletions', db_index=False)
+    car_id = models.BigIntegerField()
+    external_id = models.IntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(db_default=Now())
+
+    def __str__(self):
+        return f"{self.car_id} ({self.deleted_at})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='car_deletion_user_idx'),
+        ]
+
+class ImportJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Oczekuje'),
+        (STATUS_RUNNING, 'W trakcie'),
+        (STATUS_DONE, 'Zakończony'),
+        (STATUS_FAILED, 'Błąd'),
+    ]
+
+    # upsert - wiersze z tym samym external_id są aktualizowane, pozostałe dodawane;
+    # sync - dodatkowo usuwa samochody, których external_id nie ma w pliku (pełny feed)
+    MODE_UPSERT = 'upsert'
+    MODE_SYNC = 'sync'
+    MODE_CHOICES = [
+        (MODE_UPSERT, 'Dodaj i aktualizuj'),
+        (MODE_SYNC, 'Synchronizuj (usuń brakujące)'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    file = models.FileField(upload_to='imports/')
+    original_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default=MODE_UPSERT)
+    bytes_total = models.BigIntegerField(default=0)
+    bytes_processed = models.BigIntegerField(default=0)
+    rows_processed = models.BigIntegerField(default=0)
+    rows_rejected = models.BigIntegerField(default=0)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Odświeżany przy każdej porcji - zadanie running bez sygnału dłużej niż
+    # IMPORT_JOB_STALE_SECONDS zostało porzucone (restart lub awaria procesu).
+    # Dla zadania pending - chwila ostatniego przekazania do puli (jobs.recover_if_stale)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.original_name} ({self.status})"
+
+    class Meta:
+        ordering = ['-id']
+
+class CarStatsSummary(models.Model):
+    """Zbiorcze statystyki samochodów użytkownika aktualizowane przy każdym zapisie."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='car_stats')
+    count = models.BigIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    price_min = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    price_max = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    year_sum = models.BigIntegerField(default=0)
+    mileage_sum = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} ({self.count})"
+
+class CarStatsBucket(models.Model):
+    """Liczba samochodów i suma cen dla jednej wartości wymiaru (paliwo, marka, województwo, rok)."""
+    DIMENSION_CHOICES = [
+        ('fuel', 'Paliwo'),
+        ('mark', 'Marka'),
+        ('province', 'Województwo'),
+        ('year', 'Rok'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='car_stats_buckets')
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+    price_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.dimension}={self.value} ({self.count})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dimension', 'value'], name='car_stats_bucket_unique'),
+        ]
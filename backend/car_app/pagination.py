@@ -1,15 +1,233 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from decimal import Decimal
+from functools import partial
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator as DjangoPaginator
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .counts import get_count
+from .dimensions import sort_lookup
+
+
+def keyset_filter(sort, value, pk, descending, tiebreaker='id'):
+    """
+    Warunek WHERE (sort, id) > (value, pk) - wiersze za podaną pozycją w kolejności sortowania.
+
+    Nadmiarowe ``sort >= value`` jest granicą zakresu indeksu (user, sort, id) - samą
+    alternatywę PostgreSQL sprawdza filtrem na wszystkich wcześniejszych wierszach
+    indeksu, więc koszt rósłby z numerem strony.
+    """
+    lookup = 'lt' if descending else 'gt'
+    if sort == tiebreaker:
+        return Q(**{f'{tiebreaker}__{lookup}': pk})
+    return Q(**{f'{sort}__{lookup}e': value}) & (Q(**{f'{sort}__{lookup}': value}) | Q(**{sort: value, f'{tiebreaker}__{lookup}': pk}))
+
+
+def keyset_order(queryset, sort, descending, tiebreaker='id'):
+    """
+    Zapytanie w kolejności stron kursora: (sort, id) rosnąco lub malejąco, z wartością
+    sortowania pobieraną jako ``cursor_value`` - potrzebną do kursora kolejnej strony.
+    """
+    prefix = '-' if descending else ''
+    return queryset.annotate(cursor_value=F(sort)).order_by(prefix + sort, prefix + tiebreaker)
+
+
+def lookup_field(model, lookup):
+    """Pole modelu na końcu ścieżki zapytania, np. (Car, 'mark__name') -> Mark.name."""
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+class EstimatedCountPage(Page):
+    """Strona przy przybliżonym count - następna istnieje, jeśli zapytanie zwróciło wiersz ponad rozmiar strony."""
+
+    def __init__(self, object_list, number, paginator, has_more):
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self):
+        return self.has_more
+
+
+class CachedCountPaginator(DjangoPaginator):
+    """
+    Paginator pobierający liczbę wierszy z cache / oszacowania zamiast COUNT(*) przy każdej stronie.
+
+    Przy oszacowaniu liczba stron jest tylko przybliżona - numer strony nie jest z nią
+    porównywany, a o istnieniu strony i następnej decyduje pobranie page_size + 1 wierszy.
+    Inaczej zaniżone oszacowanie ucinałoby ostatnie strony (404, brak ``next``).
+    """
+
+    def __init__(self, object_list, per_page, user_id=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.user_id = user_id
+        self.count_approximate = False
+
+    @cached_property
+    def count(self):
+        count, self.count_approximate = get_count(self.object_list, self.user_id)
+        return count
+
+    def validate_number(self, number):
+        # count_approximate ustawia dopiero odczyt count
+        if not self.count or not self.count_approximate:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_approximate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages['no_results'])
+        return EstimatedCountPage(rows[:self.per_page], number, self, has_more=len(rows) > self.per_page)
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 25
     page_size_query_param = 'page_size'
     max_page_size = 250
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(CachedCountPaginator, user_id=request.user.pk)
+        return super().paginate_queryset(queryset, request, view)
     
     def get_paginated_response(self, data):
         return Response({
             'count': self.page.paginator.count,
+            'count_approximate': self.page.paginator.count_approximate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+class KeysetCursorPagination(BasePagination):
+    """
+    Paginacja kursorowa (keyset) - kolejna strona jest wyznaczana warunkiem
+    WHERE (pole, id) > (ostatnia wartość, ostatnie id), a nie przez OFFSET,
+    więc koszt strony nie zależy od jej numeru i nie jest potrzebny COUNT(*).
+
+    Sortowanie pochodzi z parametru ``ordering`` (jak w OrderingFilter),
+    a ``id`` rozstrzyga remisy.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 250
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    default_ordering = '-id'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Nieprawidłowy kursor.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request, view)
+        self.sort = self.get_sort_lookup()
+        self.sort_field = lookup_field(queryset.model, self.sort)
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor['r'])
+
+        # Przy cofaniu się (previous) odwracamy kierunek i wynik
+        descending = self.descending != reverse
+        sort = self.sort
+        queryset = keyset_order(queryset, sort, descending, self.tiebreaker)
+
+        if cursor:
+            queryset = queryset.filter(keyset_filter(sort, cursor['v'], cursor['i'], descending, self.tiebreaker))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        has_next = has_more if not reverse else True
+        has_previous = cursor is not None if not reverse else has_more
+        self.next_position = self.get_position(results[-1]) if results and has_next else None
+        self.previous_position = self.get_position(results[0]) if results and has_previous else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
         })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_ordering(self, request, view):
+        allowed = getattr(view, 'ordering_fields', None) or [self.tiebreaker]
+        ordering = request.query_params.get(self.ordering_param, '').split(',')[0].strip()
+        if ordering.lstrip('-') not in allowed:
+            ordering = self.default_ordering
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_sort_lookup(self):
+        return sort_lookup(self.field)
+
+    def get_position(self, obj):
+        # Obiekt modelu albo wiersz values() (lista samochodów)
+        if isinstance(obj, dict):
+            value, pk = obj['cursor_value'], obj[self.tiebreaker]
+        else:
+            value, pk = obj.cursor_value, getattr(obj, self.tiebreaker)
+        if isinstance(value, Decimal):
+            value = str(value)
+        return {'v': value, 'i': pk}
+
+    def encode_cursor(self, position, reverse):
+        # Pole sortowania (ścieżka w zapytaniu) - kursor z innym sortowaniem jest odrzucany
+        payload = json.dumps({'f': self.sort, 'v': position['v'], 'i': position['i'], 'r': int(reverse)})
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if cursor['f'] != self.sort:
+                raise ValueError
+            # Wartości z kursora trafiają do zapytania - zmieniony kursor to 404, nie błąd bazy
+            if cursor['v'] is not None:
+                cursor['v'] = self.sort_field.to_python(cursor['v'])
+            cursor['i'] = int(cursor['i'])
+            return cursor
+        except (TypeError, ValueError, OverflowError, KeyError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(self.next_position, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(self.previous_position, reverse=True)
@@ -0,0 +1,34 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Daty przekazywane do JSONEncoder DRF (orjson zapisuje je inaczej, np. bez 'Z' dla UTC)
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer DRF z serializacją przez orjson. Wynik jest ten sam co z JSONRenderer
+    przy domyślnych ustawieniach (zapis kompaktowy, UTF-8 bez sekwencji \\u, U+2028/U+2029
+    jako sekwencje); typy spoza JSON (daty, Decimal, leniwe teksty) zamienia JSONEncoder DRF.
+
+    Wcięcia (``Accept: application/json; indent=4``), inne ustawienia UNICODE_JSON /
+    COMPACT_JSON / STRICT_JSON i wartości, których orjson nie zapisze (np. liczby
+    całkowite ponad 64 bity), obsługuje JSONRenderer. Jedyna różnica zapisu: liczby
+    zmiennoprzecinkowe poniżej 1e-4 orjson pisze bez wykładnika lub z krótszym
+    wykładnikiem (0.00001 zamiast 1e-05) - wartość po odczycie jest ta sama.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.ensure_ascii or not self.compact or not self.strict or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Jak w JSONRenderer - znaki końca linii JavaScriptu nie mogą wystąpić dosłownie w <script>
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
@@ -0,0 +1,61 @@
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import Case, F, Q, Value, When
+from rest_framework.filters import OrderingFilter
+from .dimensions import search_ids, sort_lookup
+
+SEARCH_PARAM = 'search'
+
+# Pola słownikowe przeszukiwane razem z generacją (kolumna search_vector samochodu)
+SEARCH_DIMENSIONS = ['mark', 'model', 'city', 'province']
+
+# Trafienie słowa w nazwie słownikowej liczy się jak pojedyncze trafienie w search_vector
+# (ts_rank jednego leksemu o domyślnej wadze D)
+DIMENSION_MATCH_RANK = 0.0607927
+
+
+def search_tokens(term):
+    """Dzieli wpisany tekst na słowa, np. "toyota cor" -> ['toyota', 'cor']."""
+    return re.findall(r'\w+', term or '')
+
+
+def apply_search(queryset, term):
+    """
+    Każde słowo musi być prefiksem słowa w marce, modelu, generacji, mieście
+    lub województwie. Słowniki są przeszukiwane raz na żądanie, a samochody
+    filtrowane po kluczach (indeksy (user, pole, id)) i po indeksie GIN generacji.
+
+    Trafność (``search_rank``) to suma po słowach: ts_rank generacji plus
+    DIMENSION_MATCH_RANK za każde pole słownikowe, w którym słowo wystąpiło.
+    """
+    tokens = search_tokens(term)
+    if not tokens:
+        return queryset
+    rank = Value(0.0)
+    for token in tokens:
+        query = SearchQuery(f'{token}:*', search_type='raw', config='simple')
+        condition = Q(search_vector=query)
+        rank += SearchRank(F('search_vector'), query)
+        for field in SEARCH_DIMENSIONS:
+            ids = search_ids(field, query)
+            if ids:
+                condition |= Q(**{f'{field}__in': ids})
+                rank += Case(When(**{f'{field}__in': ids}, then=Value(DIMENSION_MATCH_RANK)), default=Value(0.0))
+        queryset = queryset.filter(condition)
+    return queryset.annotate(search_rank=rank)
+
+
+class SearchRankOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter, który bez jawnego ``ordering`` sortuje wyniki wyszukiwania wg trafności.
+    Pola słownikowe są sortowane wg nazwy ze słownika (``sort_lookup``).
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return [('-' if term.startswith('-') else '') + sort_lookup(term.lstrip('-')) for term in ordering]
+
+    def get_default_ordering(self, view):
+        if search_tokens(view.request.query_params.get(SEARCH_PARAM)):
+            return ['-search_rank', '-id']
+        return super().get_default_ordering(view)
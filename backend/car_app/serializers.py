@@ -1,6 +1,9 @@
+from django.conf import settings
+from django.utils import timezone
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Car
+from .models import Car, CarDeletion, ImportJob
+from .dimensions import DIMENSION_FIELDS, canonical_name, dimension_model, dimension_name, dimension_names, resolve_ids
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -29,7 +32,166 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
+class DimensionField(serializers.CharField):
+    """
+    Pole słownikowe (marka, model, paliwo...) - w API tekst, w bazie klucz obcy.
+    Walidacja zwraca nazwę kanoniczną; klucz (i brakujący wpis słownika) powstaje
+    dopiero przy zapisie, w ``resolve_dimensions``.
+    """
+
+    def bind(self, field_name, parent):
+        super().bind(field_name, parent)
+        self.model = dimension_model(field_name)
+        self.max_length = self.model._meta.get_field('name').max_length
+
+    def to_internal_value(self, data):
+        name = canonical_name(super().to_internal_value(data))
+        if len(name) > self.max_length:
+            self.fail('max_length', max_length=self.max_length)
+        return name
+
+    def to_representation(self, value):
+        return dimension_name(self.model, value)
+
+def resolve_dimensions(items):
+    """
+    Kopie ``validated_data`` CarSerializer z nazwami słownikowymi zamienionymi na klucze -
+    jedno ``resolve_ids`` na słownik dla całej listy. Brakujące wpisy są tworzone, więc
+    wywołanie należy do transakcji zapisu: element odrzucony przez walidację innego pola
+    (albo wycofany zapis) nie zostawia w słownikach wpisów bez samochodu. Dane wejściowe
+    pozostają bez zmian - można je zapisać ponownie po wycofaniu transakcji.
+    """
+    items = [dict(data) for data in items]
+    for field in DIMENSION_FIELDS:
+        key = f'{field}_id'
+        names = {data[key] for data in items if key in data}
+        if names:
+            ids = resolve_ids(dimension_model(field), names)
+            for data in items:
+                if key in data:
+                    data[key] = ids[data[key]]
+    return items
+
+EXTERNAL_ID_TAKEN_MESSAGE = 'Samochód o tym external_id już istnieje.'
+
+def is_external_id_conflict(error):
+    """
+    Czy IntegrityError to naruszenie unikalności (user, external_id). Na tabeli
+    partycjonowanej baza podaje nazwę indeksu partycji, np. car_app_car_p8_user_id_external_id_key.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    return 'external_id' in (getattr(diag, 'constraint_name', None) or '')
+
 class CarSerializer(serializers.ModelSerializer):
+    mark = DimensionField(source='mark_id')
+    model = DimensionField(source='model_id')
+    fuel = DimensionField(source='fuel_id')
+    city = DimensionField(source='city_id')
+    province = DimensionField(source='province_id')
+
     class Meta:
         model = Car
-        exclude = ['user']
\ No newline at end of file
+        fields = ('id', 'external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price',
+                  'created_at', 'updated_at')
+
+    def validate_external_id(self, value):
+        """
+        Unikalność external_id w samochodach użytkownika - DRF nie tworzy walidatora
+        dla ograniczenia (user, external_id), bo user nie jest polem serializera.
+        Operacje zbiorcze przekazują w kontekście ``external_ids`` (external_id -> id
+        samochodu) pobrane jednym zapytaniem dla całej partii; pojedyncze - ``request``.
+        """
+        if value is None:
+            return value
+        taken = self.context.get('external_ids')
+        if taken is not None:
+            owner = taken.get(value)
+        else:
+            request = self.context.get('request')
+            if request is None:
+                return value
+            owner = Car.objects.filter(user=request.user, external_id=value).values_list('id', flat=True).first()
+        if owner is not None and (self.instance is None or owner != self.instance.pk):
+            raise serializers.ValidationError(EXTERNAL_ID_TAKEN_MESSAGE)
+        return value
+
+    def create(self, validated_data):
+        return super().create(resolve_dimensions([validated_data])[0])
+
+    def update(self, instance, validated_data):
+        return super().update(instance, resolve_dimensions([validated_data])[0])
+
+# Pola CarSerializer pobierane przez values() - pola słownikowe jako klucze
+CAR_VALUE_FIELDS = ('id', 'external_id', 'mark_id', 'model_id', 'generation_name', 'year', 'mileage', 'vol_engine',
+                    'fuel_id', 'city_id', 'province_id', 'price', 'created_at', 'updated_at')
+
+def car_values(queryset):
+    """Zapytanie o pola CarSerializer jako słowniki (values) zamiast obiektów modelu."""
+    return queryset.values(*CAR_VALUE_FIELDS)
+
+def datetime_representation():
+    """
+    Funkcja zamieniająca datę na tekst jak DateTimeField DRF, ze strefą czasową
+    odczytaną raz dla całej listy, a nie dla każdej wartości.
+    """
+    return serializers.DateTimeField(
+        default_timezone=timezone.get_current_timezone() if settings.USE_TZ else None
+    ).to_representation
+
+def represent_cars(rows):
+    """
+    Wiersze ``car_values`` w formacie CarSerializer (te same pola, kolejność i postać
+    wartości) bez budowy obiektów modelu i przechodzenia przez pola serializera.
+    Tylko do odczytu - zapis i walidacja zostają w CarSerializer. Nazwy słownikowe
+    całej listy są pobierane jednym wywołaniem na słownik.
+    """
+    rows = list(rows)
+    names = {
+        field: dimension_names(dimension_model(field), {row[f'{field}_id'] for row in rows} - {None})
+        for field in DIMENSION_FIELDS
+    }
+    marks, models, fuels, cities, provinces = (names[field] for field in ('mark', 'model', 'fuel', 'city', 'province'))
+    datetime_text = datetime_representation()
+    return [
+        {
+            'id': row['id'],
+            'external_id': row['external_id'],
+            'mark': marks.get(row['mark_id']),
+            'model': models.get(row['model_id']),
+            'generation_name': row['generation_name'],
+            'year': row['year'],
+            'mileage': row['mileage'],
+            'vol_engine': row['vol_engine'],
+            'fuel': fuels.get(row['fuel_id']),
+            'city': cities.get(row['city_id']),
+            'province': provinces.get(row['province_id']),
+            # Jak DecimalField DRF (COERCE_DECIMAL_TO_STRING) - cena ma w bazie dokładnie 2 miejsca po przecinku
+            'price': '{:f}'.format(row['price']),
+            'created_at': datetime_text(row['created_at']),
+            'updated_at': datetime_text(row['updated_at']),
+        }
+        for row in rows
+    ]
+
+class CarDeletionSerializer(serializers.ModelSerializer):
+    """Usunięty samochód w feedzie zmian - id samochodu, nie śladu."""
+    id = serializers.IntegerField(source='car_id')
+
+    class Meta:
+        model = CarDeletion
+        fields = ('id', 'external_id', 'deleted_at')
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'status', 'mode', 'original_name', 'bytes_total', 'bytes_processed', 'rows_processed',
+                  'rows_rejected', 'progress', 'result', 'error', 'created_at', 'started_at', 'finished_at')
+
+    def get_progress(self, obj):
+        if obj.status == ImportJob.STATUS_DONE:
+            return 100
+        if not obj.bytes_total:
+            return 0
+        return min(99, round(obj.bytes_processed * 100 / obj.bytes_total))
@@ -0,0 +1,86 @@
+from datetime import datetime
+from .summary import aget_summary, get_summary
+
+# Wymiary rozkładów zwracanych przez /api/statistics/
+BREAKDOWN_FIELDS = ['fuel', 'mark', 'province', 'year']
+TOP_MARKS = 10
+
+
+def _breakdown(groups, field):
+    rows = [{field: value, 'count': count} for value, count in groups[field]]
+    rows.sort(key=lambda row: row['count'], reverse=True)
+    return rows
+
+
+def _price_trends(avg_by_year, avg_price):
+    current_year = datetime.now().year
+    start_year = current_year - 11
+
+    price_trends_data = []
+    for year in sorted(avg_by_year):
+        if start_year <= year <= current_year:
+            avg = avg_by_year[year]
+            price_trends_data.append({
+                'month': str(year),
+                'avg_price': round(avg, 2) if avg else 0
+            })
+
+    if len(price_trends_data) < 6:
+        avg_price = avg_price or 50000
+        price_trends_data = []
+        for i in range(12):
+            year = current_year - 11 + i
+            variation = (-1 if i % 2 == 0 else 1) * (i * 2000)
+            price_trends_data.append({
+                'month': str(year),
+                'avg_price': round(max(10000, avg_price + variation), 2)
+            })
+    return price_trends_data
+
+
+def summary_statistics(user):
+    """Statystyki z przyrostowo utrzymywanego podsumowania - koszt nie zależy od liczby samochodów."""
+    return _summary_payload(*get_summary(user.pk))
+
+
+async def asummary_statistics(user):
+    """Asynchroniczna wersja ``summary_statistics`` dla widoków pod ASGI."""
+    return _summary_payload(*await aget_summary(user.pk))
+
+
+def _summary_payload(totals, buckets):
+    count = totals['count']
+    groups = {field: [] for field in BREAKDOWN_FIELDS}
+    avg_by_year = {}
+
+    for (dimension, value), (bucket_count, price_sum) in buckets.items():
+        if dimension == 'year':
+            value = int(value)
+            avg_by_year[value] = price_sum / bucket_count
+        groups[dimension].append((value, bucket_count))
+
+    return _statistics_payload(
+        count,
+        totals['price_sum'] / count if count else None,
+        totals['price_max'],
+        totals['price_min'],
+        totals['year_sum'] / count if count else None,
+        totals['mileage_sum'] / count if count else None,
+        groups,
+        avg_by_year,
+    )
+
+
+def _statistics_payload(count, avg_price, max_price, min_price, avg_year, avg_mileage, groups, avg_by_year):
+    return {
+        'total_cars': count,
+        'avg_price': round(avg_price or 0, 2),
+        'max_price': max_price or 0,
+        'min_price': min_price or 0,
+        'avg_year': round(float(avg_year or 0), 1),
+        'avg_mileage': round(float(avg_mileage or 0), 0),
+        'cars_by_fuel': _breakdown(groups, 'fuel'),
+        'cars_by_mark': _breakdown(groups, 'mark')[:TOP_MARKS],
+        'cars_by_province': _breakdown(groups, 'province'),
+        'price_trends': _price_trends(avg_by_year, avg_price)
+    }
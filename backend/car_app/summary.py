@@ -0,0 +1,293 @@
+from collections import defaultdict
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from .cache import invalidate_user_data
+from .dimensions import DIMENSION_FIELDS, car_dimension_value, dimension_model, dimension_names
+from .models import Car, CarStatsBucket, CarStatsSummary
+
+DIMENSIONS = [choice for choice, _ in CarStatsBucket.DIMENSION_CHOICES]
+
+# Przestrzeń nazw blokad doradczych (pg_advisory_xact_lock) dla podsumowań
+STATS_LOCK_NAMESPACE = 7311
+
+CENTS = Decimal('0.01')
+
+
+class StatsDelta:
+    """
+    Zmiana podsumowania wynikająca z dodania (sign=1) lub usunięcia (sign=-1)
+    samochodów. Zbierana w pamięci i zapisywana jednym apply_delta().
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.price_sum = Decimal(0)
+        self.year_sum = 0
+        self.mileage_sum = 0
+        self.price_min = None
+        self.price_max = None
+        self.removed = False
+        self.buckets = defaultdict(lambda: [0, Decimal(0)])
+
+    def add(self, car, sign=1):
+        price = Decimal(car.price).quantize(CENTS)
+        self.count += sign
+        self.price_sum += sign * price
+        self.year_sum += sign * car.year
+        self.mileage_sum += sign * car.mileage
+        if sign > 0:
+            self.price_min = price if self.price_min is None else min(self.price_min, price)
+            self.price_max = price if self.price_max is None else max(self.price_max, price)
+        else:
+            self.removed = True
+        for dimension in DIMENSIONS:
+            bucket = self.buckets[(dimension, car_dimension_value(car, dimension))]
+            bucket[0] += sign
+            bucket[1] += sign * price
+
+    def add_frame(self, frame, sign=1):
+        """Dodaje (lub odejmuje) porcję wierszy (DataFrame) - agregacja wektorowa, ceny liczone w groszach."""
+        if frame.empty:
+            return
+        cents = (frame['price'] * 100).round().astype('int64')
+        self.count += sign * len(frame)
+        self.price_sum += sign * Decimal(int(cents.sum())) / 100
+        self.year_sum += sign * int(frame['year'].sum())
+        self.mileage_sum += sign * int(frame['mileage'].sum())
+        if sign > 0:
+            price_min, price_max = Decimal(int(cents.min())) / 100, Decimal(int(cents.max())) / 100
+            self.price_min = price_min if self.price_min is None else min(self.price_min, price_min)
+            self.price_max = price_max if self.price_max is None else max(self.price_max, price_max)
+        else:
+            self.removed = True
+        for dimension in DIMENSIONS:
+            grouped = cents.groupby(frame[dimension]).agg(['count', 'sum'])
+            for value, (count, total) in grouped.iterrows():
+                bucket = self.buckets[(dimension, str(value))]
+                bucket[0] += sign * int(count)
+                bucket[1] += sign * Decimal(int(total)) / 100
+
+    @classmethod
+    def from_frame(cls, frame):
+        delta = cls()
+        delta.add_frame(frame)
+        return delta
+
+
+def record_changes(user_id, added=(), removed=()):
+    """Aktualizuje podsumowanie po zapisie pojedynczych samochodów (modeli Car)."""
+    delta = StatsDelta()
+    for car in removed:
+        delta.add(car, sign=-1)
+    for car in added:
+        delta.add(car)
+    apply_delta(user_id, delta)
+
+
+def lock_user_stats(user_id):
+    """Serializuje zmiany podsumowania użytkownika do końca bieżącej transakcji."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [STATS_LOCK_NAMESPACE, user_id])
+
+
+def apply_delta(user_id, delta):
+    """
+    Nanosi zmianę na podsumowanie użytkownika. Jeśli podsumowanie jeszcze nie
+    istnieje, zmiana jest pomijana - zostanie uwzględniona przy jego przebudowie.
+    """
+    if not delta.count and not delta.removed:
+        return
+    with transaction.atomic():
+        lock_user_stats(user_id)
+        summary = CarStatsSummary.objects.select_for_update().filter(user_id=user_id).first()
+        if summary is None:
+            return
+
+        summary.count += delta.count
+        summary.price_sum += delta.price_sum
+        summary.year_sum += delta.year_sum
+        summary.mileage_sum += delta.mileage_sum
+        if delta.removed:
+            # Minimum i maksimum po usunięciu odczytujemy z indeksu (user, price, id)
+            bounds = Car.objects.filter(user_id=user_id).aggregate(price_min=Min('price'), price_max=Max('price'))
+            summary.price_min, summary.price_max = bounds['price_min'], bounds['price_max']
+        else:
+            summary.price_min = _least(summary.price_min, delta.price_min)
+            summary.price_max = _greatest(summary.price_max, delta.price_max)
+        summary.save()
+
+        _apply_buckets(user_id, delta.buckets)
+
+
+def _least(current, value):
+    return value if current is None else min(current, value)
+
+
+def _greatest(current, value):
+    return value if current is None else max(current, value)
+
+
+def _apply_buckets(user_id, buckets):
+    rows = [(user_id, dimension, value, count, price_sum) for (dimension, value), (count, price_sum) in buckets.items() if count or price_sum]
+    if not rows:
+        return
+    table = connection.ops.quote_name(CarStatsBucket._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'''
+            INSERT INTO {table} (user_id, dimension, value, count, price_sum)
+            VALUES {placeholders}
+            ON CONFLICT (user_id, dimension, value) DO UPDATE
+            SET count = {table}.count + EXCLUDED.count,
+                price_sum = {table}.price_sum + EXCLUDED.price_sum
+            ''',
+            [item for row in rows for item in row],
+        )
+    CarStatsBucket.objects.filter(user_id=user_id, count__lte=0).delete()
+
+
+def _grouped_rows(user_id):
+    """
+    Jedno zapytanie z GROUPING SETS: kubełki każdego wymiaru oraz (zbiór pusty)
+    wartości zbiorcze - jeden skan danych użytkownika zamiast osobnej agregacji na wymiar.
+    """
+    quote = connection.ops.quote_name
+    columns = {name: quote(Car._meta.get_field(name).column) for name in DIMENSIONS + ['price', 'year', 'mileage', 'user']}
+    group_columns = ', '.join(columns[name] for name in DIMENSIONS)
+    sets = ', '.join(f'({columns[name]})' for name in DIMENSIONS)
+    sql = f'''
+        SELECT {group_columns},
+               GROUPING({group_columns}) AS grouping_id,
+               COUNT(*), SUM({columns['price']}), MIN({columns['price']}), MAX({columns['price']}),
+               SUM({columns['year']}), SUM({columns['mileage']})
+        FROM {quote(Car._meta.db_table)}
+        WHERE {columns['user']} = %s
+        GROUP BY GROUPING SETS ({sets}, ())
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id])
+        return cursor.fetchall()
+
+
+def live_snapshot(user_id):
+    """Podsumowanie policzone od zera z tabeli samochodów: (wartości zbiorcze, kubełki)."""
+    totals = {'count': 0, 'price_sum': 0, 'price_min': None, 'price_max': None, 'year_sum': 0, 'mileage_sum': 0}
+    grouped = defaultdict(list)
+    width = len(DIMENSIONS)
+    all_grouped = (1 << width) - 1
+
+    for row in _grouped_rows(user_id):
+        keys, grouping_id, aggregates = row[:width], row[width], row[width + 1:]
+        count, price_sum, price_min, price_max, year_sum, mileage_sum = aggregates
+        if grouping_id == all_grouped:
+            totals.update(
+                count=count, price_sum=price_sum or 0, price_min=price_min, price_max=price_max,
+                year_sum=year_sum or 0, mileage_sum=mileage_sum or 0,
+            )
+            continue
+        # Bit ustawiony w GROUPING() oznacza kolumnę nieuczestniczącą w danym zbiorze
+        position = next(i for i in range(width) if not grouping_id & (1 << (width - 1 - i)))
+        grouped[DIMENSIONS[position]].append((keys[position], count, price_sum))
+
+    buckets = {}
+    for dimension, rows in grouped.items():
+        if dimension in DIMENSION_FIELDS:
+            # Grupowanie po kluczach, nazwy ze słownika
+            names = dimension_names(dimension_model(dimension), [value for value, _, _ in rows])
+            rows = [(names[value], count, price_sum) for value, count, price_sum in rows]
+        for value, count, price_sum in rows:
+            buckets[(dimension, str(value))] = (count, price_sum)
+    return totals, buckets
+
+
+SUMMARY_TOTAL_FIELDS = ('count', 'price_sum', 'price_min', 'price_max', 'year_sum', 'mileage_sum')
+
+
+def _bucket_rows(user_id):
+    return CarStatsBucket.objects.filter(user_id=user_id).values_list('dimension', 'value', 'count', 'price_sum')
+
+
+def stored_snapshot(user_id):
+    summary = CarStatsSummary.objects.filter(user_id=user_id).first()
+    if summary is None:
+        return None, None
+    totals = {field: getattr(summary, field) for field in SUMMARY_TOTAL_FIELDS}
+    buckets = {
+        (dimension, value): (count, price_sum)
+        for dimension, value, count, price_sum in _bucket_rows(user_id)
+    }
+    return totals, buckets
+
+
+async def astored_snapshot(user_id):
+    """Asynchroniczna wersja ``stored_snapshot`` (async ORM)."""
+    summary = await CarStatsSummary.objects.filter(user_id=user_id).afirst()
+    if summary is None:
+        return None, None
+    totals = {field: getattr(summary, field) for field in SUMMARY_TOTAL_FIELDS}
+    buckets = {
+        (dimension, value): (count, price_sum)
+        async for dimension, value, count, price_sum in _bucket_rows(user_id)
+    }
+    return totals, buckets
+
+
+def rebuild_summary(user_id):
+    """
+    Przelicza podsumowanie użytkownika od zera. Poprawione podsumowanie może różnić się
+    od zapisanego, więc po zatwierdzeniu podbijana jest wersja danych - odpowiedzi
+    w cache (statystyki, ETag) zbudowane na starym podsumowaniu przestają obowiązywać.
+    """
+    with transaction.atomic():
+        lock_user_stats(user_id)
+        totals, buckets = live_snapshot(user_id)
+        CarStatsBucket.objects.filter(user_id=user_id).delete()
+        CarStatsSummary.objects.update_or_create(user_id=user_id, defaults=totals)
+        CarStatsBucket.objects.bulk_create(
+            [
+                CarStatsBucket(user_id=user_id, dimension=dimension, value=value, count=count, price_sum=price_sum)
+                for (dimension, value), (count, price_sum) in buckets.items()
+            ],
+            batch_size=1000,
+        )
+        invalidate_user_data(user_id)
+
+
+def check_summary(user_id):
+    """Porównuje zapisane podsumowanie z agregacją na żywo; zwraca listę rozbieżności."""
+    stored_totals, stored_buckets = stored_snapshot(user_id)
+    if stored_totals is None:
+        return ['brak podsumowania']
+    live_totals, live_buckets = live_snapshot(user_id)
+
+    differences = [
+        f'{field}: zapisane={stored_totals[field]} na żywo={live_totals[field]}'
+        for field in live_totals if stored_totals[field] != live_totals[field]
+    ]
+    for key in sorted(set(stored_buckets) | set(live_buckets)):
+        if stored_buckets.get(key) != live_buckets.get(key):
+            differences.append(f'{key[0]}={key[1]}: zapisane={stored_buckets.get(key)} na żywo={live_buckets.get(key)}')
+    return differences
+
+
+def get_summary(user_id):
+    """Zwraca podsumowanie i jego kubełki, budując je przy pierwszym użyciu."""
+    totals, buckets = stored_snapshot(user_id)
+    if totals is None:
+        rebuild_summary(user_id)
+        totals, buckets = stored_snapshot(user_id)
+    return totals, buckets
+
+
+async def aget_summary(user_id):
+    """Asynchroniczna wersja ``get_summary``."""
+    totals, buckets = await astored_snapshot(user_id)
+    if totals is None:
+        # Budowa podsumowania to zapis w transakcji - transakcje są dostępne tylko w kodzie synchronicznym
+        await sync_to_async(rebuild_summary)(user_id)
+        totals, buckets = await astored_snapshot(user_id)
+    return totals, buckets
@@ -0,0 +1,1285 @@
+import base64
+import csv
+import gzip
+import importlib
+import io
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction
+import brotli
+import psycopg2
+import pyarrow.parquet as pq
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.urls import clear_url_caches, resolve
+from django.test import AsyncClient, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from .authentication import _version_key, token_cache
+from .cache import get_data_version, invalidate_user_data
+from .exports import CSV_EXPORT_FIELDS, PARQUET_SCHEMA, stream_csv, stream_ndjson, stream_parquet
+from .compression import CompressionMiddleware
+from .instrumentation import QueryInstrumentationMiddleware
+from . import async_views, dimensions, health, jobs, pagination, urls
+from .changes import CAR_WRITE_LOCK_KEY
+from .dimensions import resolve_id
+from .importer import CarCsvImporter
+from .management.commands.explain_car_queries import Command as ExplainCarQueries
+from .models import Car, CarDeletion, CarModel, CarStatsSummary, City, Fuel, ImportJob, Mark, Province
+from .serializers import CarSerializer, car_values, represent_cars
+from .summary import check_summary, rebuild_summary
+
+MARKS = ['Audi', 'BMW', 'Opel', 'Skoda', 'Toyota']
+FUELS = ['Gasoline', 'Diesel', 'LPG']
+PROVINCES = ['Mazowieckie', 'Małopolskie', 'Śląskie']
+
+
+def forget_dimensions():
+    """
+    Zapomina pary id <-> nazwa słowników zapamiętane w pamięci procesu po zatwierdzeniu
+    (także przez captureOnCommitCallbacks) - wiersze słowników nie przeżywają testu.
+    """
+    dimensions._ids_by_name.clear()
+    dimensions._names_by_id.clear()
+
+
+def create_cars(user, count):
+    Car.objects.bulk_create([
+        Car(
+            user=user,
+            external_id=i,
+            mark_id=resolve_id(Mark, MARKS[i % len(MARKS)]),
+            model_id=resolve_id(CarModel, f'model{i % 7}'),
+            generation_name=f'gen {i % 3}',
+            year=2010 + i % 12,
+            mileage=10000 * (i % 20),
+            vol_engine=1.6,
+            fuel_id=resolve_id(Fuel, FUELS[i % len(FUELS)]),
+            city_id=resolve_id(City, f'City{i % 11}'),
+            province_id=resolve_id(Province, PROVINCES[i % len(PROVINCES)]),
+            price=Decimal(20000 + 1000 * i),
+        )
+        for i in range(count)
+    ])
+
+
+class StatisticsQueriesTest(TestCase):
+    """/api/statistics/ czyta podsumowanie - liczba zapytań nie zależy od liczby samochodów."""
+
+    def setUp(self):
+        # Tokeny, wersje danych i odpowiedzi z poprzednich testów
+        cache.clear()
+
+    def authenticated_client(self, username, cars):
+        user = User.objects.create_user(username, password='secret')
+        create_cars(user, cars)
+        rebuild_summary(user.pk)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        return client
+
+    def test_query_count_does_not_depend_on_car_count(self):
+        for username, cars in [('few', 3), ('many', 120)]:
+            client = self.authenticated_client(username, cars)
+            # Token (z użytkownikiem), podsumowanie i jego kubełki
+            with self.assertNumQueries(3):
+                response = client.get('/api/statistics/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['total_cars'], cars)
+
+    def test_cached_response_needs_no_queries(self):
+        client = self.authenticated_client('cached', 10)
+        first = client.get('/api/statistics/')
+        with self.assertNumQueries(0):
+            second = client.get('/api/statistics/')
+        self.assertEqual(second.json(), first.json())
+
+    def test_summary_is_built_on_first_request(self):
+        user = User.objects.create_user('fresh', password='secret')
+        create_cars(user, 20)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/statistics/')
+        self.assertEqual(response.json()['total_cars'], 20)
+        self.assertEqual(sum(row['count'] for row in response.json()['cars_by_fuel']), 20)
+
+    def test_rebuild_invalidates_cached_responses(self):
+        self.addCleanup(forget_dimensions)
+        client = self.authenticated_client('rebuilt', 10)
+        user = User.objects.get(username='rebuilt')
+        # Rozjechane podsumowanie trafia do cache odpowiedzi
+        CarStatsSummary.objects.filter(user=user).update(count=7)
+        self.assertEqual(client.get('/api/statistics/').json()['total_cars'], 7)
+        version = get_data_version(user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_car_stats', 'rebuilt', stdout=io.StringIO())
+        self.assertNotEqual(get_data_version(user.pk), version)
+        self.assertEqual(client.get('/api/statistics/').json()['total_cars'], 10)
+
+
+
+class EstimatedCountPaginationTest(TestCase):
+    """Przy przybliżonym count o ostatnich stronach decydują wiersze, nie oszacowana liczba stron."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('paged', password='secret')
+        create_cars(user, 30)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def get_page(self, page, estimate):
+        with mock.patch.object(pagination, 'get_count', return_value=(estimate, True)):
+            return self.client.get(f'/api/cars/?page={page}&page_size=10')
+
+    def test_underestimated_count_keeps_last_pages(self):
+        first, last = self.get_page(1, 5).json(), self.get_page(3, 5).json()
+        self.assertIsNotNone(first['next'])
+        self.assertEqual(len(last['results']), 10)
+        self.assertIsNone(last['next'])
+        self.assertTrue(last['count_approximate'])
+
+    def test_overestimated_count_ends_at_last_row(self):
+        self.assertIsNone(self.get_page(3, 100).json()['next'])
+        self.assertEqual(self.get_page(4, 100).status_code, 404)
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('token-owner', password='secret')
+        self.key = Token.objects.create(user=self.user).key
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def test_revoked_token_rejected_after_version_is_evicted(self):
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 200)
+        # Wpis, który zostaje w pamięci innego procesu
+        entry = token_cache._entries[self.key]
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.filter(key=self.key).delete()
+        token_cache._entries[self.key] = entry
+        # Podbita wersja usunięta z cache (wygaśnięcie, culling)
+        cache.delete(_version_key(self.key))
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 401)
+
+    def test_password_change_rejects_cached_token(self):
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 200)
+        entry = token_cache._entries[self.key]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/api/users/change-password/', {'current_password': 'secret', 'new_password': 'new-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 401)
+        # Także proces, który nadal ma wpis w pamięci - wersja tokenu jest podbita
+        token_cache._entries[self.key] = entry
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 401)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {response.json()["token"]}')
+        self.assertEqual(self.client.get('/api/statistics/').status_code, 200)
+        token_cache.discard(response.json()['token'])
+
+    def test_account_deletion_rejects_cached_token(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        entry = token_cache._entries[self.key]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete('/api/users/me/').status_code, 204)
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+        token_cache._entries[self.key] = entry
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def tearDown(self):
+        token_cache.discard(self.key)
+
+
+class DimensionOrderingTest(TestCase):
+    """
+    Sortowanie po polach słownikowych idzie wg nazwy, nie wg kolejności dodania do słownika.
+    Świadomy koszt: kolejność wg nazwy wymaga złączenia ze słownikiem, a indeks
+    (user, mark, id) czyta całą grupę bieżącej marki zamiast samej strony (dimensions.sort_lookup).
+    """
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('sorted', password='secret')
+        # Słownik wypełniony w kolejności odwrotnej do alfabetycznej
+        for name in reversed(MARKS):
+            resolve_id(Mark, name)
+        create_cars(user, 20)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def marks(self, url):
+        return [car['mark'] for car in self.client.get(url).json()['results']]
+
+    def test_ordering_by_mark_is_alphabetical(self):
+        self.assertEqual(self.marks('/api/cars/?ordering=mark&page_size=50'), sorted(self.marks('/api/cars/?page_size=50')))
+        self.assertEqual(self.marks('/api/cars/?ordering=-mark&page_size=50'), sorted(self.marks('/api/cars/?page_size=50'), reverse=True))
+
+    def test_cursor_pages_follow_name_order(self):
+        url, marks = '/api/cars/?pagination=cursor&ordering=mark&page_size=3', []
+        while url:
+            page = self.client.get(url).json()
+            marks += [car['mark'] for car in page['results']]
+            url = page['next']
+        self.assertEqual(len(marks), 20)
+        self.assertEqual(marks, sorted(marks))
+
+    def test_export_sort_by_mark(self):
+        response = self.client.get('/api/export-json/?sort_by=mark&layout=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        marks = [json.loads(line)['mark'] for line in lines]
+        self.assertEqual(len(marks), 20)
+        self.assertEqual(marks, sorted(marks))
+
+    def test_explain_command_plans_list_ordering(self):
+        # Plan 'list mark' dotyczy tego samego zapytania co pierwsza strona listy
+        sql, params = ExplainCarQueries().get_queries(User.objects.get(username='sorted'))['list mark']
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            ids = [row[0] for row in cursor.fetchall()]
+        page = self.client.get('/api/cars/?pagination=cursor&ordering=mark&page_size=25').json()['results']
+        self.assertEqual(ids, [car['id'] for car in page])
+
+        output = io.StringIO()
+        call_command('explain_car_queries', 'sorted', '--summary', stdout=output)
+        self.assertIn('list mark:', output.getvalue())
+
+
+class JsonExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('exporter', password='secret')
+        create_cars(user, 12)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_rows_match_car_list(self):
+        cars = self.client.get('/api/cars/?page_size=50').json()['results']
+        for layout in ['json', 'ndjson']:
+            with self.subTest(layout=layout):
+                response = self.client.get(f'/api/export-json/?layout={layout}')
+                content = b''.join(response.streaming_content).decode()
+                rows = json.loads(content) if layout == 'json' else [json.loads(line) for line in content.splitlines()]
+                # Te same pola w tej samej kolejności, łącznie z created_at i updated_at
+                self.assertEqual([list(row.items()) for row in rows], [list(car.items()) for car in cars])
+
+
+class StreamedExportTest(TestCase):
+    # 23 wiersze w partiach po 5 - pięć zapytań keyset, ostatnia partia niepełna
+    CARS = 23
+    CHUNK_SIZE = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('streamer', password='secret')
+        create_cars(self.user, self.CARS)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def expected_prices(self, *ordering):
+        cars = Car.objects.filter(user=self.user).order_by(*ordering)
+        return ['{:f}'.format(price) for price in cars.values_list('price', flat=True)]
+
+    def stream(self, url, name, stream):
+        # Widok używa domyślnego EXPORT_CHUNK_SIZE - mniejsze partie wymuszają kilka zapytań keyset
+        with mock.patch(f'car_app.views.{name}', lambda queryset: stream(queryset, chunk_size=self.CHUNK_SIZE)):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    def test_csv_body_spans_batches(self):
+        cases = [('', ['-id']), ('?sort_by=mark', ['mark__name', 'id']), ('?sort_by=-price', ['-price', 'id'])]
+        for query, ordering in cases:
+            with self.subTest(query=query):
+                chunks = self.stream(f'/api/export-csv/{query}', 'stream_csv', stream_csv)
+                # Nagłówek w osobnym kawałku, potem po jednym kawałku na partię
+                self.assertEqual(len(chunks), 1 + -(-self.CARS // self.CHUNK_SIZE))
+                self.assertEqual(chunks[0], '\ufeff' + ','.join(CSV_EXPORT_FIELDS) + '\r\n')
+                rows = list(csv.reader(io.StringIO(''.join(chunks[1:]))))
+                self.assertEqual(len(rows), self.CARS)
+                self.assertEqual([row[-1] for row in rows], self.expected_prices(*ordering))
+
+    def test_ndjson_body_spans_batches(self):
+        cases = [('', ['-id']), ('&sort_by=mark', ['mark__name', 'id']), ('&sort_by=-price', ['-price', 'id'])]
+        for query, ordering in cases:
+            with self.subTest(query=query):
+                chunks = self.stream(f'/api/export-json/?layout=ndjson{query}', 'stream_ndjson', stream_ndjson)
+                self.assertEqual(len(chunks), -(-self.CARS // self.CHUNK_SIZE))
+                self.assertTrue(all(chunk.endswith('\n') for chunk in chunks))
+                rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+                self.assertEqual(len(rows), self.CARS)
+                self.assertEqual(len({row['id'] for row in rows}), self.CARS)
+                self.assertEqual([row['price'] for row in rows], self.expected_prices(*ordering))
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('cursor', password='secret')
+        create_cars(user, 10)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def get(self, ordering, cursor):
+        cursor = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return self.client.get(f'/api/cars/?pagination=cursor&ordering={ordering}&page_size=3&cursor={cursor}')
+
+    def test_next_cursor_continues_page(self):
+        first = self.client.get('/api/cars/?pagination=cursor&ordering=price&page_size=3').json()
+        second = self.client.get(first['next']).json()
+        prices = [car['price'] for car in first['results'] + second['results']]
+        self.assertEqual(prices, ['20000.00', '21000.00', '22000.00', '23000.00', '24000.00', '25000.00'])
+
+    def test_tampered_cursor_is_not_found(self):
+        for ordering, cursor in [
+            ('price', {'f': 'price', 'v': 'abc', 'i': 3, 'r': 0}),
+            ('price', {'f': 'price', 'v': '22000.00', 'i': 'x', 'r': 0}),
+            ('year', {'f': 'year', 'v': {}, 'i': 3, 'r': 0}),
+            ('mark', {'f': 'mark__name', 'v': 'Audi', 'i': None, 'r': 0}),
+            ('price', {'f': 'year', 'v': 2015, 'i': 3, 'r': 0}),
+            ('price', ['price', '22000.00', 3]),
+        ]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(ordering, cursor).status_code, 404)
+
+
+class CommittedDataTestCase(TransactionTestCase):
+    """
+    Testy z zatwierdzanymi transakcjami (feed zmian, importy w tle).
+    """
+
+    def setUp(self):
+        cache.clear()
+        forget_dimensions()
+        self.addCleanup(forget_dimensions)
+        self.user = User.objects.create_user('committed', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class ChangesFeedTest(CommittedDataTestCase):
+    def changes(self, since=None):
+        response = self.client.get('/api/cars/changes/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def create_car(self, **fields):
+        data = {'mark': 'Audi', 'model': 'A4', 'year': 2015, 'mileage': 1000, 'vol_engine': 2.0,
+                'fuel': 'Diesel', 'city': 'Kraków', 'province': 'Małopolskie', 'price': '30000.00', **fields}
+        response = self.client.post('/api/cars/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        create_cars(self.user, 3)
+        first = self.changes()
+        self.assertEqual(len(first['changes']), 3)
+        self.assertFalse(first['has_more'])
+        self.assertEqual(self.changes(first['next'])['changes'], [])
+
+        car = self.create_car()
+        second = self.changes(first['next'])
+        self.assertEqual([change['id'] for change in second['changes']], [car['id']])
+        self.assertEqual(self.changes(second['next'])['changes'], [])
+
+    def test_limit_pages_through_changes(self):
+        create_cars(self.user, 5)
+        ids, since = [], None
+        while True:
+            response = self.client.get('/api/cars/changes/', {'limit': 2, **({'since': since} if since else {})}).json()
+            ids += [change['id'] for change in response['changes']]
+            since = response['next']
+            if not response['has_more']:
+                break
+        self.assertEqual(sorted(ids), sorted(Car.objects.values_list('id', flat=True)))
+
+    def test_update_is_propagated(self):
+        car = self.create_car()
+        since = self.changes()['next']
+        response = self.client.patch(f'/api/cars/{car["id"]}/', {'price': '25000.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        changes = self.changes(since)
+        self.assertEqual([(change['id'], change['price']) for change in changes['changes']], [(car['id'], '25000.00')])
+        self.assertEqual(changes['deleted'], [])
+
+    def test_delete_is_propagated(self):
+        car = self.create_car(external_id=7)
+        since = self.changes()['next']
+        self.assertEqual(self.client.delete(f'/api/cars/{car["id"]}/').status_code, 204)
+        changes = self.changes(since)
+        self.assertEqual(changes['changes'], [])
+        self.assertEqual([(deletion['id'], deletion['external_id']) for deletion in changes['deleted']], [(car['id'], 7)])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/cars/changes/', {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+    def open_session(self):
+        session = psycopg2.connect(**connection.get_connection_params())
+        self.addCleanup(session.close)
+        return session
+
+    def test_unrelated_open_transaction_does_not_hold_back_feed(self):
+        idle = self.open_session()
+        with idle.cursor() as cursor:
+            cursor.execute('SELECT 1')  # Bezczynna transakcja w toku
+        car = self.create_car()
+        self.assertEqual([change['id'] for change in self.changes()['changes']], [car['id']])
+
+    def test_open_car_write_holds_back_later_changes(self):
+        before = self.create_car()
+        writer = self.open_session()
+        with writer.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [CAR_WRITE_LOCK_KEY])
+        # Zapisany po starcie trwającej transakcji zapisu - jeszcze nie ostateczny dla feedu
+        after = self.create_car()
+        self.assertEqual([change['id'] for change in self.changes()['changes']], [before['id']])
+        writer.rollback()
+        self.assertEqual([change['id'] for change in self.changes()['changes']], [before['id'], after['id']])
+
+
+def car_data(**fields):
+    return {'mark': 'Audi', 'model': 'A4', 'year': 2015, 'mileage': 1000, 'vol_engine': 2.0,
+            'fuel': 'Diesel', 'city': 'Kraków', 'province': 'Małopolskie', 'price': '30000.00', **fields}
+
+
+class BulkCarsTest(TestCase):
+    """Operacje zbiorcze: statusy 201/200, 207 i 400 oraz podsumowanie i wersja danych po zapisie."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(forget_dimensions)
+        self.user = User.objects.create_user('bulk', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, data, url='/api/cars/bulk/'):
+        # Podbicie wersji danych następuje po zatwierdzeniu transakcji
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data, format='json')
+
+    def statistics(self):
+        return self.client.get('/api/statistics/').json()
+
+    def test_create_statuses(self):
+        response = self.request('post', [car_data(), car_data(price='31000.00')])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['succeeded'], 2)
+
+        response = self.request('post', [car_data(price='32000.00'), car_data(year='abc')])
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body['succeeded'], body['failed']), (1, 1))
+        self.assertEqual(body['results'][0]['status'], 'created')
+        self.assertIn('year', body['results'][1]['errors'])
+
+        response = self.request('post', [car_data(year='abc'), {}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['failed'], 2)
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 3)
+
+    def test_duplicate_external_id_in_request(self):
+        response = self.request('post', [car_data(external_id=1), car_data(external_id=1)])
+        self.assertEqual(response.status_code, 207)
+        self.assertIn('external_id', response.json()['results'][1]['errors'])
+
+    def test_update_statuses(self):
+        other = User.objects.create_user('other', password='secret')
+        create_cars(other, 1)
+        foreign = Car.objects.get(user=other)
+        created = self.request('post', [car_data(), car_data()]).json()['results']
+        first, second = (result['car']['id'] for result in created)
+
+        response = self.request('patch', [{'id': first, 'price': '35000.00'}, {'id': foreign.pk, 'price': '1.00'}, {'id': 0}, {'price': '1.00'}])
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual(results[0]['car']['price'], '35000.00')
+        self.assertEqual([list(result['errors']) for result in results[1:]], [['id'], ['id'], ['id']])
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.price, Decimal(20000))
+
+        response = self.request('put', [{'id': second, **car_data(mark='BMW')}, {'id': second, **car_data()}])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['results'][1]['errors'], {'id': ['Identyfikator powtarza się w żądaniu.']})
+
+        response = self.request('put', [{'id': first, 'price': '1.00'}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_by_ids(self):
+        other = User.objects.create_user('other', password='secret')
+        create_cars(other, 1)
+        create_cars(self.user, 2)
+        ids = list(Car.objects.filter(user=self.user).values_list('id', flat=True))
+        foreign = Car.objects.get(user=other).pk
+
+        response = self.request('delete', {'ids': [ids[0], foreign]})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result.get('status') for result in response.json()['results']], ['deleted', None])
+        self.assertTrue(Car.objects.filter(pk=foreign).exists())
+
+        self.assertEqual(self.request('delete', {'ids': ['x']}).status_code, 400)
+        self.assertEqual(self.request('delete', {'ids': [ids[0]]}).status_code, 400)
+
+    def test_delete_by_filter_requires_valid_filter(self):
+        create_cars(self.user, 10)
+        # Bez listy i bez filtrów, filtry nieczytelne - nic nie jest usuwane
+        for url in ['/api/cars/bulk/', '/api/cars/bulk/?year_min=abc', '/api/cars/bulk/?search=%20-%20', '/api/cars/bulk/?page=2']:
+            with self.subTest(url=url):
+                self.assertEqual(self.request('delete', None, url).status_code, 400)
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 10)
+
+        response = self.request('delete', None, '/api/cars/bulk/?fuel=diesel')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'deleted': 3})
+        self.assertFalse(Car.objects.filter(user=self.user, fuel__name='Diesel').exists())
+
+    def test_summary_and_data_version_follow_bulk_writes(self):
+        self.assertEqual(self.statistics()['total_cars'], 0)
+        version = get_data_version(self.user.pk)
+
+        created = self.request('post', [car_data(price='10000.00'), car_data(price='20000.00', fuel='LPG')]).json()['results']
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+        statistics = self.statistics()
+        self.assertEqual(statistics['total_cars'], 2)
+        self.assertEqual((statistics['min_price'], statistics['max_price']), (10000, 20000))
+
+        first, second = (result['car']['id'] for result in created)
+        version = get_data_version(self.user.pk)
+        self.request('patch', [{'id': first, 'fuel': 'LPG'}])
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+        self.assertEqual(self.statistics()['cars_by_fuel'], [{'fuel': 'LPG', 'count': 2}])
+
+        version = get_data_version(self.user.pk)
+        self.request('delete', {'ids': [second]})
+        self.assertNotEqual(get_data_version(self.user.pk), version)
+        statistics = self.statistics()
+        self.assertEqual(statistics['total_cars'], 1)
+        self.assertEqual(statistics['cars_by_fuel'], [{'fuel': 'LPG', 'count': 1}])
+
+    def test_rejected_items_leave_no_dimension_rows(self):
+        car = self.request('post', [car_data()]).json()['results'][0]['car']
+        # Nowa marka w elemencie, który nie przechodzi walidacji innego pola
+        rejected = [
+            ('post', '/api/cars/', car_data(mark='Lancia', year='abc')),
+            ('patch', f'/api/cars/{car["id"]}/', {'mark': 'Lancia', 'price': 'abc'}),
+            ('post', '/api/cars/bulk/', [car_data(mark='Lancia', year='abc')]),
+            ('patch', '/api/cars/bulk/', [{'id': car['id'], 'mark': 'Lancia', 'price': 'abc'}]),
+        ]
+        for method, url, data in rejected:
+            with self.subTest(method=method, url=url):
+                self.assertEqual(self.request(method, data, url).status_code, 400)
+                self.assertFalse(Mark.objects.filter(name='Lancia').exists())
+
+        response = self.request('post', [car_data(mark='Lancia'), car_data(mark='Lancia', year='abc')])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['results'][0]['car']['mark'], 'Lancia')
+        self.assertEqual(Mark.objects.filter(name='Lancia').count(), 1)
+
+    def test_external_id_conflict_retry_resolves_dimensions_again(self):
+        self.request('post', [car_data(external_id=1)])
+        # external_id zajęty po walidacji - pierwszy zapis partii wycofany razem z nowymi wpisami słownika
+        with mock.patch('car_app.bulk.taken_external_ids', return_value={}):
+            response = self.request('post', [car_data(external_id=1, mark='Lancia'), car_data(external_id=2, mark='Lada')])
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual(results[0]['errors'], {'external_id': ['Samochód o tym external_id już istnieje.']})
+        self.assertEqual(results[1]['car']['mark'], 'Lada')
+        self.assertEqual(Car.objects.get(user=self.user, external_id=2).mark.name, 'Lada')
+        self.assertFalse(Mark.objects.filter(name='Lancia').exists())
+
+
+CSV_HEADER = 'external_id,mark,model,generation_name,year,mileage,vol_engine,fuel,city,province,price\n'
+
+
+def csv_file(*rows):
+    return io.StringIO(CSV_HEADER + ''.join(f'{row}\n' for row in rows))
+
+
+class UpsertImportTest(TestCase):
+    """Import CSV jako upsert po (user, external_id): liczniki, wiersze bez zmian, tryb sync."""
+
+    ROWS = [
+        '1,Audi,A4,B8,2012,150000,2.0,Diesel,Kraków,Małopolskie,35000',
+        '2,BMW,320,E90,2010,200000,2.0,Gasoline,Warszawa,Mazowieckie,28000.50',
+        '3,Opel,Astra,J,2015,90000,1.4,LPG,Katowice,Śląskie,31000',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('importer', password='secret')
+        rebuild_summary(self.user.pk)
+
+    def run_import(self, *rows, mode=ImportJob.MODE_UPSERT, chunk_size=2):
+        result = CarCsvImporter(self.user, chunk_size=chunk_size, mode=mode).run(csv_file(*rows))
+        # Podsumowanie statystyk poprawione o każdą porcję tak, jak przeliczone od zera
+        self.assertEqual(check_summary(self.user.pk), [])
+        return result
+
+    def counts(self, result):
+        return {key: result[key] for key in ('inserted', 'updated', 'unchanged', 'rejected_rows', 'deleted_from_feed')}
+
+    def test_reimport_is_unchanged(self):
+        self.assertEqual(self.counts(self.run_import(*self.ROWS)),
+                         {'inserted': 3, 'updated': 0, 'unchanged': 0, 'rejected_rows': 0, 'deleted_from_feed': 0})
+        updated_at = dict(Car.objects.values_list('external_id', 'updated_at'))
+
+        self.assertEqual(self.counts(self.run_import(*self.ROWS)),
+                         {'inserted': 0, 'updated': 0, 'unchanged': 3, 'rejected_rows': 0, 'deleted_from_feed': 0})
+        # Wiersze bez zmian nie są zapisywane (IS DISTINCT FROM) - updated_at zostaje
+        self.assertEqual(dict(Car.objects.values_list('external_id', 'updated_at')), updated_at)
+
+    def test_changed_rows_are_updated(self):
+        self.run_import(*self.ROWS)
+        changed = self.ROWS[1].replace('28000.50', '27000')
+        result = self.run_import(self.ROWS[0], changed, self.ROWS[2], '4,Skoda,Octavia,III,2018,60000,1.6,Diesel,Poznań,Wielkopolskie,52000')
+        self.assertEqual(self.counts(result),
+                         {'inserted': 1, 'updated': 1, 'unchanged': 2, 'rejected_rows': 0, 'deleted_from_feed': 0})
+        self.assertEqual(Car.objects.get(user=self.user, external_id=2).price, Decimal('27000.00'))
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 4)
+
+    def test_rows_without_external_id_are_not_duplicated(self):
+        rows = [',Audi,A3,8P,2008,210000,1.9,Diesel,Gdańsk,Pomorskie,15000',
+                ',Audi,A3,8P,2008,210000,1.9,Diesel,Gdańsk,Pomorskie,16000', *self.ROWS]
+        self.assertEqual(self.run_import(*rows)['inserted'], 5)
+        result = self.run_import(*rows)
+        self.assertEqual((result['inserted'], result['unchanged']), (0, 5))
+        self.assertEqual(Car.objects.filter(user=self.user, external_id__isnull=True).count(), 2)
+
+        # Inna treść to nowy samochód - bez external_id nie ma czego aktualizować
+        result = self.run_import(rows[0].replace('15000', '14000'))
+        self.assertEqual((result['inserted'], result['unchanged']), (1, 0))
+
+    def test_row_without_external_id_matches_car_saved_through_api(self):
+        # Skrót treści z kolumny generowanej tabeli samochodów i z tabeli importu jest ten sam
+        car = Car.objects.create(
+            user=self.user, mark_id=resolve_id(Mark, 'Fiat'), model_id=resolve_id(CarModel, 'Panda'), generation_name=None,
+            year=2009, mileage=120000, vol_engine=1.1, fuel_id=resolve_id(Fuel, 'Gasoline'), city_id=resolve_id(City, 'Łódź'),
+            province_id=resolve_id(Province, 'Łódzkie'), price=Decimal('9000.5'),
+        )
+        rebuild_summary(self.user.pk)
+        result = self.run_import(',Fiat,Panda,,2009,120000,1.1,Gasoline,Łódź,Łódzkie,9000.50')
+        self.assertEqual((result['inserted'], result['unchanged']), (0, 1))
+        self.assertEqual(Car.objects.get(pk=car.pk).content_hash, Car.objects.get(user=self.user).content_hash)
+
+    def test_duplicate_external_id_keeps_last_row(self):
+        result = self.run_import(self.ROWS[0], self.ROWS[0].replace('35000', '34000'), chunk_size=10)
+        self.assertEqual(result['inserted'], 1)
+        self.assertEqual(result['rejected_rows'], 1)
+        self.assertEqual(Car.objects.get(user=self.user, external_id=1).price, Decimal('34000.00'))
+
+    def test_sync_deletes_cars_missing_from_file(self):
+        other = User.objects.create_user('other', password='secret')
+        create_cars(other, 3)
+        self.run_import(*self.ROWS, ',Fiat,Panda,II,2009,120000,1.1,Gasoline,Łódź,Łódzkie,9000')
+        changed = self.ROWS[0].replace('35000', '36000')
+        result = self.run_import(changed, self.ROWS[2], mode=ImportJob.MODE_SYNC)
+        self.assertEqual(self.counts(result),
+                         {'inserted': 0, 'updated': 1, 'unchanged': 1, 'rejected_rows': 0, 'deleted_from_feed': 1})
+        # Samochody bez external_id i samochody innych użytkowników nie należą do feedu
+        self.assertEqual(set(Car.objects.filter(user=self.user).values_list('external_id', flat=True)), {1, 3, None})
+        self.assertEqual(Car.objects.filter(user=other).count(), 3)
+        self.assertEqual(list(CarDeletion.objects.filter(user=self.user).values_list('external_id', flat=True)), [2])
+
+    def test_sync_with_rejected_rows_deletes_nothing(self):
+        self.run_import(*self.ROWS)
+        result = self.run_import(self.ROWS[0], '2,BMW,320,E90,abc,200000,2.0,Gasoline,Warszawa,Mazowieckie,28000', mode=ImportJob.MODE_SYNC)
+        self.assertEqual((result['rejected_rows'], result['deleted_from_feed']), (1, 0))
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 3)
+
+    def test_sync_with_duplicate_external_id_still_deletes(self):
+        self.run_import(*self.ROWS)
+        result = self.run_import(self.ROWS[0], self.ROWS[0].replace('35000', '34000'), mode=ImportJob.MODE_SYNC, chunk_size=10)
+        self.assertEqual((result['rejected_rows'], result['deleted_from_feed']), (1, 2))
+        self.assertEqual(list(Car.objects.filter(user=self.user).values_list('external_id', 'price')), [(1, Decimal('34000.00'))])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CSV_IMPORT_CHUNK_SIZE=2)
+class ImportJobTest(CommittedDataTestCase):
+    """
+    Import w tle: 202 -> odpytywanie -> done/failed oraz przywracanie porzuconych zadań.
+    Zadania wykonuje osobna pula z jednym wątkiem, którego połączenie z bazą jest
+    zamykane po teście - inaczej usunięcie testowej bazy kończy się błędem
+    "database is being accessed by other users".
+    """
+
+    def setUp(self):
+        super().setUp()
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-job-test')
+        patcher = mock.patch.object(jobs, '_executor', executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(executor.shutdown)
+        self.addCleanup(lambda: executor.submit(connections.close_all).result())
+
+    def upload(self, *rows, mode=ImportJob.MODE_UPSERT):
+        content = (CSV_HEADER + ''.join(f'{row}\n' for row in rows)).encode()
+        response = self.client.post('/api/upload-csv/', {'file': SimpleUploadedFile('cars.csv', content), 'mode': mode})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], ImportJob.STATUS_PENDING)
+        return response.json()['id']
+
+    def poll(self, job_id):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            job = self.client.get(f'/api/import-jobs/{job_id}/').json()
+            if job['status'] in (ImportJob.STATUS_DONE, ImportJob.STATUS_FAILED):
+                return job
+            time.sleep(0.05)
+        self.fail(f'Import job {job_id} did not finish')
+
+    def test_upload_succeeds(self):
+        job = self.poll(self.upload(*UpsertImportTest.ROWS))
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        self.assertEqual((job['progress'], job['rows_processed'], job['result']['inserted']), (100, 3, 3))
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 3)
+        # Plik jest usuwany po zakończeniu zadania
+        self.assertFalse(ImportJob.objects.get(pk=job['id']).file)
+
+    def test_job_of_other_user_is_not_found(self):
+        job_id = self.upload(*UpsertImportTest.ROWS)
+        self.poll(job_id)
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', password='secret'))
+        self.assertEqual(other.get(f'/api/import-jobs/{job_id}/').status_code, 404)
+
+    def test_upload_runs_in_chunks(self):
+        rebuild_summary(self.user.pk)
+        job = self.poll(self.upload(*UpsertImportTest.ROWS, ',Fiat,Panda,II,2009,120000,1.1,Gasoline,Łódź,Łódzkie,9000'))
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        self.assertEqual((job['progress'], job['rows_processed'], job['rows_rejected']), (100, 4, 0))
+        self.assertEqual(job['result']['inserted'], 4)
+        # Porcje po CSV_IMPORT_CHUNK_SIZE wierszy, każda zapisana przez COPY i zatwierdzona osobno
+        self.assertEqual([chunk['rows'] for chunk in job['result']['chunks']], [2, 2])
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(check_summary(self.user.pk), [])
+        self.assertFalse(ImportJob.objects.get(pk=job['id']).file)
+
+    def test_rejected_rows_are_counted(self):
+        job = self.poll(self.upload(UpsertImportTest.ROWS[0], '2,BMW,320,E90,abc,200000,2.0,Gasoline,Warszawa,Mazowieckie,28000',
+                                    '3,Opel,Astra,J,2015,90000,1.4,LPG,Katowice,,31000'))
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        self.assertEqual(job['rows_rejected'], 2)
+        self.assertEqual(job['result']['rejected_by_reason'], {'invalid_number': 1, 'missing_value': 1})
+        self.assertEqual(Car.objects.filter(user=self.user).count(), 1)
+
+    def test_copy_keeps_quoted_and_empty_values(self):
+        job = self.poll(self.upload('1,Alfa  Romeo,Giulia,"Veloce, ""Q4""",2019,30000,2.0,Gasoline,Kraków,Małopolskie,120000.99',
+                                    '2,Audi,A4,,2012,150000,2.0,Diesel,Kraków,Małopolskie,35000'))
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        cars = {car.external_id: car for car in Car.objects.filter(user=self.user).select_related('mark')}
+        self.assertEqual(cars[1].generation_name, 'Veloce, "Q4"')
+        self.assertEqual(cars[1].mark.name, 'Alfa Romeo')
+        self.assertEqual(cars[1].price, Decimal('120000.99'))
+        self.assertIsNone(cars[2].generation_name)
+
+    def test_failed_import(self):
+        response = self.client.post('/api/upload-csv/', {'file': SimpleUploadedFile('cars.csv', b'mark;model\nAudi;A4\n')})
+        with self.assertLogs('car_app.jobs', 'ERROR'):
+            job = self.poll(response.json()['id'])
+        self.assertEqual(job['status'], ImportJob.STATUS_FAILED)
+        self.assertIn('Brak wymaganych kolumn', job['error'])
+        self.assertFalse(Car.objects.exists())
+
+    def stale_job(self, **fields):
+        old = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS + 60)
+        job = ImportJob(user=self.user, status=ImportJob.STATUS_RUNNING, started_at=old, heartbeat_at=old, **fields)
+        job.file.save('cars.csv', ContentFile((CSV_HEADER + '\n'.join(UpsertImportTest.ROWS)).encode()))
+        return job
+
+    def test_stale_job_without_chunks_is_requeued(self):
+        with self.assertLogs('car_app.jobs', 'WARNING'):
+            job = self.poll(self.stale_job().pk)
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        self.assertEqual(job['result']['inserted'], 3)
+
+    def test_stale_job_after_chunks_fails(self):
+        with self.assertLogs('car_app.jobs', 'WARNING'):
+            job = self.poll(self.stale_job(rows_processed=2).pk)
+        self.assertEqual(job['status'], ImportJob.STATUS_FAILED)
+        self.assertIn('po 2 wierszach', job['error'])
+        self.assertFalse(ImportJob.objects.get(pk=job['id']).file)
+
+    def test_pending_job_never_started_is_resubmitted(self):
+        # Zadanie z kolejki puli procesu, który zakończył się przed jego rozpoczęciem
+        job = ImportJob(user=self.user)
+        job.file.save('cars.csv', ContentFile((CSV_HEADER + '\n'.join(UpsertImportTest.ROWS)).encode()))
+        old = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS + 60)
+        ImportJob.objects.filter(pk=job.pk).update(created_at=old)
+        with self.assertLogs('car_app.jobs', 'WARNING'):
+            job = self.poll(job.pk)
+        self.assertEqual(job['status'], ImportJob.STATUS_DONE)
+        self.assertEqual(job['result']['inserted'], 3)
+
+    def test_recent_pending_job_is_not_resubmitted(self):
+        job = ImportJob(user=self.user)
+        job.file.save('cars.csv', ContentFile(b''))
+        with mock.patch.object(jobs, 'enqueue_import_job') as enqueue:
+            self.assertEqual(self.client.get(f'/api/import-jobs/{job.pk}/').json()['status'], ImportJob.STATUS_PENDING)
+        enqueue.assert_not_called()
+
+    def test_running_job_is_left_alone(self):
+        job = self.stale_job()
+        ImportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now())
+        self.assertEqual(self.client.get(f'/api/import-jobs/{job.pk}/').json()['status'], ImportJob.STATUS_RUNNING)
+
+
+class SearchTest(TestCase):
+    """Wyszukiwanie pełnotekstowe: prefiksy słów, nazwy słownikowe i sortowanie wg trafności."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('searcher', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.corolla = self.car('Toyota', 'Corolla', 'E210', 'Kraków', 'Małopolskie')
+        self.yaris = self.car('Toyota', 'Yaris', 'XP150', 'Warszawa', 'Mazowieckie')
+        self.astra = self.car('Opel', 'Astra', 'Toyota Edition', 'Katowice', 'Śląskie')
+        self.golf = self.car('Volkswagen', 'Golf', None, 'Kraków', 'Małopolskie')
+
+    def car(self, mark, model, generation, city, province):
+        return Car.objects.create(
+            user=self.user, mark_id=resolve_id(Mark, mark), model_id=resolve_id(CarModel, model),
+            generation_name=generation, year=2015, mileage=100000, vol_engine=1.6, fuel_id=resolve_id(Fuel, 'Gasoline'),
+            city_id=resolve_id(City, city), province_id=resolve_id(Province, province), price=Decimal(30000),
+        )
+
+    def search(self, term, **params):
+        return [car['id'] for car in self.client.get('/api/cars/', {'search': term, **params}).json()['results']]
+
+    def test_prefix_matches(self):
+        self.assertCountEqual(self.search('toyo'), [self.corolla.pk, self.yaris.pk, self.astra.pk])
+        self.assertEqual(self.search('coro'), [self.corolla.pk])
+        self.assertEqual(self.search('xp1'), [self.yaris.pk])
+        self.assertEqual(self.search('olla'), [])
+
+    def test_dimension_names_match(self):
+        self.assertCountEqual(self.search('krak'), [self.corolla.pk, self.golf.pk])
+        self.assertEqual(self.search('Śląsk'), [self.astra.pk])
+        self.assertEqual(self.search('VOLKS'), [self.golf.pk])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('toyota krak'), [self.corolla.pk])
+        self.assertEqual(self.search('toyota edition'), [self.astra.pk])
+        self.assertEqual(self.search('toyota golf'), [])
+
+    def test_results_ordered_by_relevance(self):
+        # Corolla ma "toyota" w marce i w generacji - wyżej niż nowsze samochody z jednym trafieniem
+        Car.objects.filter(pk=self.corolla.pk).update(generation_name='Toyota E210')
+        results = self.search('toyota')
+        self.assertEqual(results[0], self.corolla.pk)
+        self.assertCountEqual(results[1:], [self.yaris.pk, self.astra.pk])
+        # Przy równej trafności nowsze pierwsze
+        self.assertEqual(self.search('krak'), [self.golf.pk, self.corolla.pk])
+
+    def test_explicit_ordering_wins_over_relevance(self):
+        Car.objects.filter(pk=self.corolla.pk).update(generation_name='Toyota E210')
+        self.assertEqual(self.search('toyota', ordering='-id'), [self.astra.pk, self.yaris.pk, self.corolla.pk])
+        self.assertEqual(self.search('toyota', ordering='model'), [self.astra.pk, self.corolla.pk, self.yaris.pk])
+
+    def test_export_follows_search(self):
+        response = self.client.get('/api/export-json/', {'search': 'toyota krak'})
+        self.assertEqual([car['id'] for car in json.loads(b''.join(response.streaming_content))], [self.corolla.pk])
+
+
+class FacetsTest(TestCase):
+    """Liczności faset: uwzględniają bieżące filtry, ale każda pomija własny."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('facets', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        create_cars(self.user, 60)
+
+    def counts(self, queryset, field):
+        names = dict(dimensions.dimension_model(field).objects.values_list('id', 'name'))
+        result = {}
+        for pk in queryset.values_list(f'{field}_id', flat=True):
+            result[names[pk]] = result.get(names[pk], 0) + 1
+        return result
+
+    def facet(self, response, field):
+        return {item['value']: item['count'] for item in response[field]}
+
+    def test_facet_skips_own_filter(self):
+        response = self.client.get('/api/facets/', {'mark': 'audi', 'fuel': 'diesel', 'year_max': 2018}).json()
+        audi = Car.objects.filter(user=self.user, mark__name='Audi', year__lte=2018)
+        diesel = Car.objects.filter(user=self.user, fuel__name='Diesel', year__lte=2018)
+        both = audi.filter(fuel__name='Diesel')
+
+        # Marki wśród diesli, paliwa wśród Audi - obie z wieloma wartościami
+        self.assertEqual(self.facet(response, 'mark'), self.counts(diesel, 'mark'))
+        self.assertEqual(self.facet(response, 'fuel'), self.counts(audi, 'fuel'))
+        self.assertGreater(len(response['mark']), 1)
+        self.assertGreater(len(response['fuel']), 1)
+        # Województwo i ceny - oba filtry oraz rok
+        self.assertEqual(self.facet(response, 'province'), self.counts(both, 'province'))
+        self.assertEqual(sum(item['count'] for item in response['price']), both.count())
+        # Rok pomija year_max, ale nie filtry marki i paliwa
+        years = Car.objects.filter(user=self.user, mark__name='Audi', fuel__name='Diesel')
+        self.assertEqual(sum(item['count'] for item in response['year']), years.count())
+        self.assertGreater(years.count(), both.count())
+
+    def test_unfiltered_counts_cover_all_cars(self):
+        response = self.client.get('/api/facets/').json()
+        for field in ['mark', 'fuel', 'province', 'year', 'price']:
+            self.assertEqual(sum(item['count'] for item in response[field]), 60)
+
+    def test_facets_respect_non_facet_filters(self):
+        response = self.client.get('/api/facets/', {'model': 'model3', 'mark': 'bmw'}).json()
+        model3 = Car.objects.filter(user=self.user, model__name='model3')
+        self.assertEqual(self.facet(response, 'mark'), self.counts(model3, 'mark'))
+        self.assertEqual(self.facet(response, 'fuel'), self.counts(model3.filter(mark__name='BMW'), 'fuel'))
+
+    def test_no_matching_value_gives_empty_facets(self):
+        response = self.client.get('/api/facets/', {'mark': 'nosuchmark'}).json()
+        self.assertEqual(sum(item['count'] for item in response['mark']), 60)
+        self.assertEqual(response['fuel'], [])
+        self.assertEqual(response['year'], [])
+
+
+class ConditionalResponseTest(TestCase):
+    """ETag z wersji danych (304 bez wykonania widoku), unieważnienie po zapisie i kompresja eksportów."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(forget_dimensions)
+        self.user = User.objects.create_user('etag', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        create_cars(self.user, 30)
+
+    def test_matching_etag_gives_304(self):
+        response = self.client.get('/api/statistics/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/statistics/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_etag_depends_on_query(self):
+        etag = self.client.get('/api/cars/')['ETag']
+        response = self.client.get('/api/cars/', {'mark': 'audi'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_write_invalidates_etag_and_cache(self):
+        response = self.client.get('/api/statistics/')
+        etag, total = response['ETag'], response.json()['total_cars']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/cars/', car_data(), format='json').status_code, 201)
+
+        response = self.client.get('/api/statistics/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Odpowiedź z cache_per_user też nie jest już zwracana
+        self.assertEqual(response.json()['total_cars'], total + 1)
+
+    def test_streamed_export_negotiates_encoding(self):
+        plain = b''.join(self.client.get('/api/export-json/').streaming_content)
+        self.assertEqual(len(json.loads(plain)), 30)
+
+        response = self.client.get('/api/export-json/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(brotli.decompress(b''.join(response.streaming_content)), plain)
+
+        response = self.client.get('/api/export-json/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+        response = self.client.get('/api/export-json/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), plain)
+
+    def test_compressed_export_etag_revalidates(self):
+        response = self.client.get('/api/export-csv/', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/'))
+
+        response = self.client.get('/api/export-csv/', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class RepresentCarsTest(TestCase):
+    """represent_cars (wiersze values()) daje to samo co CarSerializer - pole w pole."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('represent', password='secret')
+        create_cars(self.user, 12)
+        Car.objects.create(
+            user=self.user, external_id=None, mark_id=resolve_id(Mark, 'Škoda'), model_id=resolve_id(CarModel, 'Octavia'),
+            generation_name=None, year=2019, mileage=0, vol_engine=1.0, fuel_id=resolve_id(Fuel, 'LPG'),
+            city_id=resolve_id(City, 'Łódź'), province_id=resolve_id(Province, 'Łódzkie'), price=Decimal('1234.5'),
+        )
+        self.cars = Car.objects.filter(user=self.user).order_by('id')
+
+    def assertSameRepresentation(self):
+        expected = CarSerializer(self.cars, many=True).data
+        rows = represent_cars(car_values(self.cars))
+        self.assertEqual(len(rows), len(expected))
+        for row, car in zip(rows, expected):
+            self.assertEqual(list(row), list(car))
+            self.assertEqual(row, dict(car))
+
+    def test_matches_serializer(self):
+        self.assertSameRepresentation()
+        last = represent_cars(car_values(self.cars))[-1]
+        self.assertEqual(last['price'], '1234.50')
+        self.assertEqual(last['mark'], 'Škoda')
+        self.assertIsNone(last['external_id'])
+        self.assertIsNone(last['generation_name'])
+
+    def test_timestamps_follow_current_timezone(self):
+        # Mikrosekundy i strefa inna niż UTC - format daty jak w DateTimeField DRF
+        Car.objects.filter(user=self.user).update(updated_at=timezone.now().replace(microsecond=123456))
+        with timezone.override('Europe/Warsaw'):
+            self.assertSameRepresentation()
+            self.assertTrue(represent_cars(car_values(self.cars))[0]['updated_at'].endswith(('+01:00', '+02:00')))
+
+    def test_recent_cars_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        expected = CarSerializer(self.cars.order_by('-id')[:5], many=True).data
+        self.assertEqual(client.get('/api/recent-cars/').json(), json.loads(json.dumps(expected)))
+
+
+class AsyncMiddlewareTest(SimpleTestCase):
+    """Pod ASGI żadne oprogramowanie pośredniczące nie przełącza żądania do wątku."""
+
+    def test_every_middleware_is_async_capable(self):
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), 'async_capable', False), path)
+
+    def test_mode_follows_next_handler(self):
+        async def async_response(request):
+            pass
+
+        def sync_response(request):
+            pass
+
+        for middleware in (QueryInstrumentationMiddleware, CompressionMiddleware):
+            self.assertTrue(iscoroutinefunction(middleware(async_response)))
+            self.assertFalse(iscoroutinefunction(middleware(sync_response)))
+
+
+class AsyncRequestTest(TestCase):
+    """Żądania obsługiwane asynchronicznie (AsyncClient): kompresja i liczenie zapytań."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        create_cars(self.user, 20)
+
+    @override_settings(DEBUG=True)
+    async def test_async_request_is_compressed_and_instrumented(self):
+        response = await AsyncClient().get(
+            '/api/cars/', headers={'Authorization': f'Token {self.token.key}', 'Accept-Encoding': 'br'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(json.loads(brotli.decompress(response.content))['count'], 20)
+        # Zapytania widoku synchronicznego (w wątku) trafiają do statystyk żądania
+        self.assertGreater(int(response['X-DB-Queries']), 0)
+
+
+class AsyncViewsTest(TestCase):
+    """
+    Widoki async (SERVE_ASGI): statusy, te same dane co widoki synchroniczne, ETag/304
+    i pełne eksporty strumieniowe. urls.py wybiera widoki przy imporcie, więc moduł
+    adresów jest wczytywany ponownie z włączonym SERVE_ASGI.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('async-views', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        create_cars(self.user, 25)
+        self.addCleanup(token_cache.discard, self.token.key)
+
+    def serve_asgi(self):
+        def reload_urls():
+            # Główny moduł adresów trzyma resolver car_app.urls z już odczytanymi wzorcami
+            importlib.reload(urls)
+            importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+            clear_url_caches()
+        # Sprzątanie w odwrotnej kolejności - adresy wczytywane ponownie po wyłączeniu SERVE_ASGI
+        self.addCleanup(reload_urls)
+        self.enterContext(override_settings(SERVE_ASGI=True))
+        reload_urls()
+        # Statystyki itp. z cache_per_user są wspólne dla obu wersji widoków
+        cache.clear()
+
+    def aget(self, url, data=None, authenticated=True, **headers):
+        if authenticated:
+            headers['Authorization'] = f'Token {self.token.key}'
+
+        async def get():
+            response = await AsyncClient().get(url, data, headers=headers)
+            if response.streaming:
+                response.body = b''.join([chunk async for chunk in response.streaming_content])
+            return response
+        return async_to_sync(get)()
+
+    def test_async_views_are_routed(self):
+        self.serve_asgi()
+        for url, view in [('/api/statistics/', async_views.get_statistics), ('/api/export-csv/', async_views.export_csv),
+                          ('/api/recent-cars/', async_views.get_recent_cars)]:
+            self.assertIs(resolve(url).func, view)
+
+    def test_payloads_match_sync_views(self):
+        endpoints = ['/api/statistics/', '/api/distinct/', '/api/recent-cars/']
+        expected = {url: self.client.get(url).json() for url in endpoints}
+        self.serve_asgi()
+        for url in endpoints:
+            response = self.aget(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.json(), expected[url], url)
+
+    def test_etag_not_modified(self):
+        self.serve_asgi()
+        response = self.aget('/api/statistics/')
+        etag = response['ETag']
+        response = self.aget('/api/statistics/', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Car.objects.filter(user=self.user).update(price=Decimal(1))
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_user_data(self.user.pk)
+        self.assertEqual(self.aget('/api/statistics/', **{'If-None-Match': etag}).status_code, 200)
+
+    def test_streaming_exports_complete(self):
+        exports = [('/api/export-csv/', {}), ('/api/export-json/', {}), ('/api/export-json/', {'layout': 'ndjson'})]
+        expected = [b''.join(self.client.get(url, params).streaming_content) for url, params in exports]
+        self.serve_asgi()
+        for (url, params), body in zip(exports, expected):
+            response = self.aget(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+            self.assertEqual(response.body, body, url)
+        self.assertEqual(len(json.loads(expected[1])), 25)
+
+        response = self.aget('/api/export-json/', **{'Accept-Encoding': 'br'})
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.body), expected[1])
+
+    def test_parquet_export(self):
+        self.serve_asgi()
+        response = self.aget('/api/export-parquet/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        self.assertEqual(pq.read_table(io.BytesIO(response.body)).num_rows, 25)
+
+    def test_authentication_and_method(self):
+        self.serve_asgi()
+        response = self.aget('/api/statistics/', authenticated=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+        response = self.aget('/api/statistics/', authenticated=False, Authorization='Token invalid')
+        self.assertEqual(response.status_code, 401)
+
+        async def post():
+            return await AsyncClient().post('/api/statistics/', headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(async_to_sync(post)().status_code, 405)
+
+
+class ParquetExportTest(TestCase):
+    """Eksport Parquet: typowany schemat (także znaczniki czasu) i strumień grup wierszy."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('parquet', password='secret')
+        self.client.force_login(self.user)
+        create_cars(self.user, 10)
+        Car.objects.filter(user=self.user, external_id=0).update(generation_name=None, price=Decimal('1234.56'))
+
+    def test_round_trip(self):
+        response = self.client.get('/api/export-parquet/', {'sort_by': 'price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.parquet', response['Content-Disposition'])
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.schema, PARQUET_SCHEMA)
+
+        cars = Car.objects.filter(user=self.user).select_related('mark', 'model', 'fuel', 'city', 'province').order_by('price', 'id')
+        expected = [
+            {
+                'id': car.id, 'external_id': car.external_id, 'mark': car.mark.name, 'model': car.model.name,
+                'generation_name': car.generation_name, 'year': car.year, 'mileage': car.mileage, 'vol_engine': car.vol_engine,
+                'fuel': car.fuel.name, 'city': car.city.name, 'province': car.province.name, 'price': car.price,
+                'created_at': car.created_at, 'updated_at': car.updated_at,
+            }
+            for car in cars
+        ]
+        self.assertEqual(table.to_pylist(), expected)
+        self.assertIsNone(table.to_pylist()[0]['generation_name'])
+
+    def test_streams_one_row_group_per_batch(self):
+        parts = list(stream_parquet(Car.objects.filter(user=self.user), batch_size=4))
+        # Grupy 4 + 4 + 2 wierszy, każda w osobnym fragmencie, a na końcu stopka
+        self.assertEqual(len(parts), 4)
+        self.assertTrue(all(parts))
+        parquet_file = pq.ParquetFile(io.BytesIO(b''.join(parts)))
+        self.assertEqual([parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)], [4, 4, 2])
+        self.assertEqual(parquet_file.read().column('id').to_pylist(), list(Car.objects.filter(user=self.user).values_list('id', flat=True)))
+
+    def test_empty_export_is_valid_file(self):
+        Car.objects.filter(user=self.user).delete()
+        table = pq.read_table(io.BytesIO(b''.join(self.client.get('/api/export-parquet/').streaming_content)))
+        self.assertEqual((table.num_rows, table.schema), (0, PARQUET_SCHEMA))
+
+
+class HealthTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def database_down(self):
+        return mock.patch.object(health.connection, 'cursor', side_effect=OperationalError('connection refused'))
+
+    def test_healthy_instance(self):
+        for url in ['/healthz/', '/readyz/']:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['status'], 'ok')
+        self.assertEqual(self.client.get('/readyz/').json()['checks'], {'database': 'ok', 'cache': 'ok', 'migrations': 'ok'})
+
+    def test_database_failure_makes_instance_unready(self):
+        with self.database_down():
+            response = self.client.get('/readyz/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(response.json()['checks']['database'], 'connection refused')
+        self.assertEqual(response.json()['checks']['cache'], 'ok')
+
+    def test_liveness_does_not_depend_on_database(self):
+        # Awaria bazy nie może restartować procesów - healthz nie dotyka połączenia
+        with self.database_down() as cursor:
+            response = self.client.get('/healthz/')
+        self.assertEqual(response.status_code, 200)
+        cursor.assert_not_called()
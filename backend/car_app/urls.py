@@ -1,20 +1,28 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CarViewSet, RegisterView, LoginView, upload_csv, export_csv, export_json, get_statistics, get_distinct_values, get_recent_cars, UserMeView, ChangePasswordView
+from . import async_views, views
+from .views import CarViewSet, RegisterView, LoginView, upload_csv, get_import_job, get_facets, UserMeView, ChangePasswordView
 
 router = DefaultRouter()
 router.register(r'cars', CarViewSet)
 
+# Pod ASGI eksporty i odczyty zbiorcze w wersji async - te same adresy i odpowiedzi
+io_views = async_views if settings.SERVE_ASGI else views
+
 urlpatterns = [
     path('', include(router.urls)),
-    path('export-csv/', export_csv, name='export-csv'),  
-    path('export-json/', export_json, name='export-json'), 
+    path('export-csv/', io_views.export_csv, name='export-csv'),  
+    path('export-json/', io_views.export_json, name='export-json'), 
+    path('export-parquet/', io_views.export_parquet, name='export-parquet'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('upload-csv/', upload_csv, name='upload-csv'),
-    path('statistics/', get_statistics, name='statistics'),
-    path('distinct/', get_distinct_values, name='distinct-values'),
-    path('recent-cars/', get_recent_cars, name='recent-cars'),
+    path('import-jobs/<int:pk>/', get_import_job, name='import-job'),
+    path('statistics/', io_views.get_statistics, name='statistics'),
+    path('distinct/', io_views.get_distinct_values, name='distinct-values'),
+    path('facets/', get_facets, name='facets'),
+    path('recent-cars/', io_views.get_recent_cars, name='recent-cars'),
     path('users/me/', UserMeView.as_view(), name='user-me'),
     path('users/change-password/', ChangePasswordView.as_view(), name='change-password'),
-]
\ No newline at end of file
+]
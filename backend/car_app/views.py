@@ -1,26 +1,38 @@
-import csv
-import json
-import pandas as pd
-from django.db import transaction
+import copy
+import logging
+import math
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication
 from django.contrib.auth import authenticate
-from django.db.models import Avg, Max, Min, Count, Q
-from datetime import datetime
-from .models import Car
-from .serializers import CarSerializer, UserSerializer
-from .pagination import CustomPageNumberPagination
-from rest_framework import filters
+from .models import Car, ImportJob
+from .serializers import CarSerializer, UserSerializer, ImportJobSerializer, EXTERNAL_ID_TAKEN_MESSAGE, car_values, is_external_id_conflict, represent_cars
+from .pagination import CustomPageNumberPagination, KeysetCursorPagination
+from .authentication import CachedTokenAuthentication
+from .jobs import enqueue_import_job, recover_if_stale
+from .cache import cache_per_user, etag_per_user, invalidate_user_data
+from .statistics import summary_statistics
+from .facets import compute_facets
+from .summary import record_changes
+from .bulk import bulk_create_cars, bulk_update_cars, bulk_delete_cars, delete_cars, parse_id
+from .search import apply_search, search_tokens, SearchRankOrderingFilter
+from .changes import DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT, cursor_expired, decode_cursor, start_car_write, get_changes
+from .dimensions import filter_by_name, dimension_model, dimension_names, name_condition, sort_lookup
+from .exports import stream_csv, stream_json, stream_ndjson, stream_parquet, export_filename
 from django.contrib.auth.models import User
 from rest_framework.permissions import IsAuthenticated
 
+logger = logging.getLogger(__name__)
+
 class RegisterView(APIView):
     permission_classes = (permissions.AllowAny,)
     def post(self, request):
@@ -54,42 +66,106 @@ class LoginView(APIView):
             })
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
+# Parametry filtrów listy samochodów (get_queryset / filter_cars)
+FILTER_PARAMS = ['search', 'mark', 'model', 'year_min', 'year_max', 'fuel', 'province', 'price_min', 'price_max']
+
+# Filtry liczbowe i typ ich wartości
+NUMERIC_FILTERS = {'year_min': int, 'year_max': int, 'price_min': float, 'price_max': float}
+
+def filter_errors(params):
+    """
+    Błędy wartości filtrów. get_queryset pomija wartości, których nie da się odczytać
+    (year_min=abc, search bez żadnego słowa) - przy usuwaniu według filtrów taki filtr
+    nie zawęziłby zakresu, więc musi zostać odrzucony zamiast pominięty.
+    """
+    errors = {}
+    for param, parse in NUMERIC_FILTERS.items():
+        value = params.get(param)
+        if not value:
+            continue
+        try:
+            valid = math.isfinite(parse(value))
+        except ValueError:
+            valid = False
+        if not valid:
+            errors[param] = ['Nieprawidłowa wartość liczbowa.']
+    term = params.get('search')
+    if term and not search_tokens(term):
+        errors['search'] = ['Wyszukiwany tekst nie zawiera żadnego słowa.']
+    return errors
+
+def raise_external_id_conflict(error):
+    """Równoległy zapis zajął external_id po walidacji - błąd pola (400) zamiast 500."""
+    if is_external_id_conflict(error):
+        raise ValidationError({'external_id': [EXTERNAL_ID_TAKEN_MESSAGE]})
+    raise error
+
+def bulk_response(results, success_status):
+    """Odpowiedź operacji zbiorczej: 207 gdy część elementów się nie powiodła, 400 gdy wszystkie."""
+    failed = sum(1 for result in results if 'errors' in result)
+    if not failed:
+        response_status = success_status
+    elif failed == len(results):
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+    return Response({'succeeded': len(results) - failed, 'failed': failed, 'results': results}, status=response_status)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class CarViewSet(viewsets.ModelViewSet):
     queryset = Car.objects.all()
     serializer_class = CarSerializer
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CustomPageNumberPagination
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [SearchRankOrderingFilter]
     ordering_fields = ['id', 'year', 'price', 'mileage', 'mark', 'model', 'fuel']
     ordering = ['-id']
 
+    @property
+    def paginator(self):
+        # ?pagination=cursor włącza paginację kursorową, domyślnie zostaje numeracja stron
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = KeysetCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        try:
+            with transaction.atomic():
+                start_car_write()
+                car = serializer.save(user=self.request.user)
+                record_changes(self.request.user.pk, added=[car])
+        except IntegrityError as error:
+            raise_external_id_conflict(error)
+        invalidate_user_data(self.request.user.pk)
+
+    def perform_update(self, serializer):
+        previous = copy.copy(serializer.instance)
+        try:
+            with transaction.atomic():
+                car = serializer.save(updated_at=start_car_write())
+                record_changes(self.request.user.pk, added=[car], removed=[previous])
+        except IntegrityError as error:
+            raise_external_id_conflict(error)
+        invalidate_user_data(self.request.user.pk)
     
     def get_queryset(self):
         queryset = Car.objects.filter(user=self.request.user)
         
-        # Ogólne wyszukiwanie
-        search = self.request.query_params.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(mark__icontains=search) |
-                Q(model__icontains=search) |
-                Q(generation_name__icontains=search) |
-                Q(city__icontains=search) |
-                Q(province__icontains=search)
-            )
+        # Ogólne wyszukiwanie (pełnotekstowe, z dopasowaniem prefiksów)
+        queryset = apply_search(queryset, self.request.query_params.get('search'))
         
         # Specyficzne filtry
         mark = self.request.query_params.get('mark')
         if mark:
-            queryset = queryset.filter(mark__icontains=mark)
+            queryset = filter_by_name(queryset, 'mark', mark)
             
         model = self.request.query_params.get('model')
         if model:
-            queryset = queryset.filter(model__icontains=model)
+            queryset = filter_by_name(queryset, 'model', model)
             
         year_min = self.request.query_params.get('year_min')
         if year_min:
@@ -107,11 +183,11 @@ class CarViewSet(viewsets.ModelViewSet):
                 
         fuel = self.request.query_params.get('fuel')
         if fuel:
-            queryset = queryset.filter(fuel__icontains=fuel)
+            queryset = filter_by_name(queryset, 'fuel', fuel)
             
         province = self.request.query_params.get('province')
         if province:
-            queryset = queryset.filter(province__icontains=province)
+            queryset = filter_by_name(queryset, 'province', province)
             
         price_min = self.request.query_params.get('price_min')
         if price_min:
@@ -130,16 +206,25 @@ class CarViewSet(viewsets.ModelViewSet):
         # Usuwamy własną obsługę sortowania, bo DRF obsłuży ordering
             
         # Optymalizacja zapytania dla dużych zbiorów danych
-        queryset = queryset.select_related().only(
-            'id', 'mark', 'model', 'generation_name', 'year', 'mileage', 
-            'vol_engine', 'fuel', 'city', 'province', 'price'
+        queryset = queryset.only(
+            'id', 'external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 
+            'vol_engine', 'fuel', 'city', 'province', 'price', 'created_at', 'updated_at'
         )
             
         return queryset
 
+    @method_decorator(etag_per_user('cars'))
+    def list(self, request, *args, **kwargs):
+        # Lista jest tylko do odczytu - wiersze values() zamiast obiektów modelu i CarSerializer
+        queryset = car_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(represent_cars(page))
+        return Response(represent_cars(queryset))
+
     def destroy(self, request, *args, **kwargs):
         car = self.get_object()
-        car.delete()
+        delete_cars(request.user, Car.objects.filter(pk=car.pk))
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     def update(self, request, *args, **kwargs):
@@ -156,142 +241,177 @@ class CarViewSet(viewsets.ModelViewSet):
         kwargs['partial'] = True
         return self.update(request, *args, **kwargs)
 
+    def get_bulk_items(self, data):
+        if not isinstance(data, list) or not data:
+            raise ValidationError({'non_field_errors': ['Oczekiwano niepustej listy.']})
+        if len(data) > settings.CAR_BULK_MAX_ITEMS:
+            raise ValidationError({'non_field_errors': [f'Maksymalnie {settings.CAR_BULK_MAX_ITEMS} elementów w jednym żądaniu.']})
+        return data
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Tworzy wiele samochodów jednym bulk_create; błędy walidacji zwracane dla każdego elementu."""
+        items = self.get_bulk_items(request.data)
+        return bulk_response(bulk_create_cars(request.user, items), status.HTTP_201_CREATED)
+
+    @bulk.mapping.put
+    def bulk_update(self, request):
+        """Aktualizuje wiele samochodów (elementy z polem id) jednym bulk_update."""
+        items = self.get_bulk_items(request.data)
+        return bulk_response(bulk_update_cars(request.user, items, partial=False), status.HTTP_200_OK)
+
+    @bulk.mapping.patch
+    def bulk_partial_update(self, request):
+        items = self.get_bulk_items(request.data)
+        return bulk_response(bulk_update_cars(request.user, items, partial=True), status.HTTP_200_OK)
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """
+        Usuwa samochody z listy {"ids": [...]} albo - bez listy - wszystkie
+        pasujące do filtrów z parametrów zapytania (jak lista samochodów).
+        """
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if ids is not None:
+            items = self.get_bulk_items(ids)
+            ids = [parse_id(pk) for pk in items]
+            if None in ids:
+                raise ValidationError({'ids': ['Identyfikatory muszą być liczbami.']})
+            return bulk_response(bulk_delete_cars(request.user, ids), status.HTTP_200_OK)
+
+        if not any(request.query_params.get(param) for param in FILTER_PARAMS):
+            raise ValidationError({'non_field_errors': ['Podaj listę ids albo co najmniej jeden filtr.']})
+        errors = filter_errors(request.query_params)
+        if errors:
+            raise ValidationError(errors)
+        deleted = delete_cars(request.user, self.get_queryset())
+        return Response({'deleted': len(deleted)}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Feed zmian do synchronizacji przyrostowej: samochody zmienione i usunięte
+        po kursorze ?since=. Pierwsze wywołanie bez kursora zwraca wszystko od początku;
+        klient pobiera kolejne porcje z since=next, dopóki has_more, i zapamiętuje next.
+        """
+        try:
+            position = decode_cursor(request.query_params.get('since'))
+        except ValueError as error:
+            raise ValidationError({'since': [str(error)]})
+        if cursor_expired(position):
+            return Response(
+                {'error': f'Kursor jest starszy niż {settings.CAR_DELETION_RETENTION_DAYS} dni - pobierz dane od nowa (bez since).'},
+                status=status.HTTP_410_GONE,
+            )
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_CHANGES_LIMIT)), 1), MAX_CHANGES_LIMIT)
+        except ValueError:
+            limit = DEFAULT_CHANGES_LIMIT
+        return Response(get_changes(request.user, position, limit))
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def upload_csv(request):
     if 'file' not in request.FILES:
         return Response({'error': 'No file uploaded'}, status=status.HTTP_400_BAD_REQUEST)
         
-    file = request.FILES['file']
-    try:
-        df = pd.read_csv(file)
-        df.columns = df.columns.str.strip()
-        
-        if df.shape[1] == 11: 
-            df.columns = ['external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price']
-
-        car_objects = []
-        total_rows = len(df)
-        progress_step = max(1, total_rows // 10)
+    mode = request.data.get('mode', ImportJob.MODE_UPSERT)
+    if mode not in dict(ImportJob.MODE_CHOICES):
+        return Response({'error': f'Nieznany tryb importu: {mode}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            for idx, row in df.iterrows():
-                car_data = {
-                    'mark': row['mark'],
-                    'model': row['model'],
-                    'year': row['year'],
-                    'mileage': row['mileage'],
-                    'vol_engine': row['vol_engine'],
-                    'fuel': row['fuel'],
-                    'city': row['city'],
-                    'province': row['province'],
-                    'price': row['price'],
-                    'user': request.user
-                }    
-
-                if 'external_id' in row and pd.notna(row['external_id']):
-                    car_data['external_id'] = row['external_id']
-            
-                if 'generation_name' in row and pd.notna(row['generation_name']):
-                    car_data['generation_name'] = row['generation_name']
-            
-                car_objects.append(Car(**car_data))
+    file = request.FILES['file']
+    # Plik jest zapisywany, a import wykonuje się w tle - odpowiedź wraca od razu
+    job = ImportJob.objects.create(
+        user=request.user,
+        mode=mode,
+        file=file,
+        original_name=file.name,
+        bytes_total=file.size
+    )
+    enqueue_import_job(job)
 
-                # Zapisuj co 1000 rekordów, aby oszczędzać pamięć przy dużych plikach
-                if len(car_objects) >= 1000:
-                    Car.objects.bulk_create(car_objects)
-                    car_objects = []
+    return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
 
-            if car_objects:
-                Car.objects.bulk_create(car_objects)
-        
-        return Response({
-            'success': f'Zaimportowano pomyślnie {total_rows} rekordów',
-            'total_rows': total_rows
-        }, status=status.HTTP_201_CREATED)
-    except Exception as e:        
-        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def get_import_job(request, pk):
+    """
+    Endpoint zwracający stan zadania importu CSV.
+    """
+    try:
+        job = ImportJob.objects.get(pk=pk, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response({'error': 'Nie znaleziono zadania importu.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(ImportJobSerializer(recover_if_stale(job)).data)
 
-def filter_cars(request):
-    """Helper function to apply filters on car queryset"""
+def base_cars(request):
+    """Samochody użytkownika po filtrach, które nie odpowiadają żadnej fasecie (wyszukiwanie, model)."""
     queryset = Car.objects.filter(user=request.user)
     
-    # Ogólne wyszukiwanie
-    search = request.query_params.get('search')
-    if search:
-        queryset = queryset.filter(
-            Q(mark__icontains=search) |
-            Q(model__icontains=search) |
-            Q(generation_name__icontains=search) |
-            Q(city__icontains=search) |
-            Q(province__icontains=search)
-        )
+    # Ogólne wyszukiwanie (pełnotekstowe, z dopasowaniem prefiksów)
+    queryset = apply_search(queryset, request.query_params.get('search'))
     
-    # Specyficzne filtry
-    mark = request.query_params.get('mark')
-    if mark:
-        queryset = queryset.filter(mark__icontains=mark)
-        
     model = request.query_params.get('model')
     if model:
-        queryset = queryset.filter(model__icontains=model)
-        
-    year_min = request.query_params.get('year_min')
-    if year_min:
-        try:
-            queryset = queryset.filter(year__gte=int(year_min))
-        except ValueError:
-            pass
-        
-    year_max = request.query_params.get('year_max')
-    if year_max:
-        try:
-            queryset = queryset.filter(year__lte=int(year_max))
-        except ValueError:
-            pass
-        
-    fuel = request.query_params.get('fuel')
-    if fuel:
-        queryset = queryset.filter(fuel__icontains=fuel)
-        
-    province = request.query_params.get('province')
-    if province:
-        queryset = queryset.filter(province__icontains=province)
+        queryset = filter_by_name(queryset, 'model', model)
+    return queryset
+
+def facet_conditions(request):
+    """
+    Warunki pozostałych filtrów jako Q, według fasety (compute_facets), którą zawężają -
+    liczności fasety są liczone bez jej własnego warunku. Nieczytelne wartości liczbowe są pomijane.
+    """
+    conditions = {}
+    for field in ['mark', 'fuel', 'province']:
+        value = request.query_params.get(field)
+        if value:
+            conditions[field] = name_condition(field, value)
+
+    for facet, parse in [('year', int), ('price', float)]:
+        condition = Q()
+        for suffix, lookup in [('min', 'gte'), ('max', 'lte')]:
+            value = request.query_params.get(f'{facet}_{suffix}')
+            if value:
+                try:
+                    condition &= Q(**{f'{facet}__{lookup}': parse(value)})
+                except ValueError:
+                    pass
+        if condition:
+            conditions[facet] = condition
+    return conditions
+
+def filter_cars(request):
+    """Helper function to apply filters on car queryset"""
+    queryset = base_cars(request)
     
-    price_min = request.query_params.get('price_min')
-    if price_min:
-        try:
-            queryset = queryset.filter(price__gte=float(price_min))
-        except ValueError:
-            pass
-        
-    price_max = request.query_params.get('price_max')
-    if price_max:
-        try:
-            queryset = queryset.filter(price__lte=float(price_max))
-        except ValueError:
-            pass
+    # Specyficzne filtry
+    for condition in facet_conditions(request).values():
+        queryset = queryset.filter(condition)
     
     # Dodajemy możliwość sortowania
     sort_by = request.query_params.get('sort_by', '-id')
     valid_sort_fields = ['id', 'year', 'price', 'mileage', 'mark', 'model', 'fuel']
     sort_field = sort_by.lstrip('-')
     
-    if sort_field in valid_sort_fields:
-        queryset = queryset.order_by(sort_by)
+    if 'sort_by' not in request.query_params and search_tokens(request.query_params.get('search')):
+        queryset = queryset.order_by('-search_rank', '-id')  # Wyniki wyszukiwania wg trafności
+    elif sort_field in valid_sort_fields:
+        queryset = queryset.order_by(('-' if sort_by.startswith('-') else '') + sort_lookup(sort_field))
     else:
         queryset = queryset.order_by('-id')  # Domyślne sortowanie od najnowszych
         
     # Optymalizacja zapytania dla dużych zbiorów danych
-    queryset = queryset.select_related().only(
-        'id', 'mark', 'model', 'generation_name', 'year', 'mileage', 
-        'vol_engine', 'fuel', 'city', 'province', 'price'
+    queryset = queryset.only(
+        'id', 'external_id', 'mark', 'model', 'generation_name', 'year', 'mileage', 
+        'vol_engine', 'fuel', 'city', 'province', 'price', 'created_at', 'updated_at'
     )
     
     return queryset
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@etag_per_user('export-csv')
 def export_csv(request):
     """
     Eksportuje dane samochodów do formatu CSV.
@@ -300,124 +420,82 @@ def export_csv(request):
     try:
         queryset = filter_cars(request)
         
-        response = HttpResponse(content_type='text/csv; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="car_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv"'
+        # Odpowiedź strumieniowa - pierwszy bajt trafia do klienta od razu, a pamięć nie rośnie z liczbą wierszy
+        response = StreamingHttpResponse(stream_csv(queryset), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{export_filename("csv")}"'
         
-        response.write('\ufeff')
-        
-        writer = csv.writer(response)
-        writer.writerow(['mark', 'model', 'generation_name', 'year', 'mileage', 'vol_engine', 'fuel', 'city', 'province', 'price'])
-        
-        batch_size = 1000
-        total = queryset.count()
+        return response
+    except Exception as e:
+        logger.exception('Error in export_csv')
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@etag_per_user('export-json')
+def export_json(request):
+    """
+    Eksportuje dane samochodów do formatu JSON (lub NDJSON dla ?layout=ndjson).
+    """
+    
+    try:
+        queryset = filter_cars(request)
         
-        for offset in range(0, total, batch_size):
-            batch = queryset[offset:offset + batch_size]
-            for car in batch:
-                writer.writerow([
-                    car.mark or '', 
-                    car.model or '', 
-                    car.generation_name or '', 
-                    car.year or '', 
-                    car.mileage or '',
-                    car.vol_engine or '', 
-                    car.fuel or '', 
-                    car.city or '', 
-                    car.province or '', 
-                    car.price or ''
-                ])
+        # layout=ndjson zwraca jeden obiekt na linię, domyślnie tablica JSON - oba bez limitu wierszy
+        if request.query_params.get('layout') == 'ndjson':
+            response = StreamingHttpResponse(stream_ndjson(queryset), content_type='application/x-ndjson; charset=utf-8')
+            extension = 'ndjson'
+        else:
+            response = StreamingHttpResponse(stream_json(queryset), content_type='application/json; charset=utf-8')
+            extension = 'json'
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(extension)}"'
         
         return response
     except Exception as e:
-        print(f"Error in export_csv: {str(e)}")
+        logger.exception('Error in export_json')
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def export_json(request):
+@etag_per_user('export-parquet')
+def export_parquet(request):
     """
-    Eksportuje dane samochodów do formatu JSON.
+    Eksportuje dane samochodów do kolumnowego formatu Parquet (z zachowaniem typów).
     """
     
     try:
         queryset = filter_cars(request)
         
-        max_export = 10000
-        if queryset.count() > max_export:
-            queryset = queryset[:max_export]
-            
-        serializer = CarSerializer(queryset, many=True)
-        json_data = json.dumps(serializer.data, indent=4, ensure_ascii=False)
-        response = HttpResponse(json_data, content_type='application/json; charset=utf-8')
-        response['Content-Disposition'] = f'attachment; filename="car_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json"'
+        response = StreamingHttpResponse(stream_parquet(queryset), content_type='application/vnd.apache.parquet')
+        response['Content-Disposition'] = f'attachment; filename="{export_filename("parquet")}"'
         
         return response
     except Exception as e:
-        print(f"Error in export_json: {str(e)}")
+        logger.exception('Error in export_parquet')
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@etag_per_user('statistics')
+@cache_per_user('statistics')
 def get_statistics(request):
-    current_year = datetime.now().year
-    start_year = current_year - 11
-
-    user_cars = Car.objects.filter(user=request.user)
-    
-    price_trends = (
-        user_cars
-        .filter(year__gte=start_year, year__lte=current_year)
-        .values('year')
-        .annotate(avg_price=Avg('price'))
-        .order_by('year')
-    )
-    
-    price_trends_data = []
-    for trend in price_trends:
-        price_trends_data.append({
-            'month': str(trend['year']),
-            'avg_price': round(trend['avg_price'], 2) if trend['avg_price'] else 0
-        })
-    
-    if len(price_trends_data) < 6:
-        avg_price = user_cars.aggregate(avg_price=Avg('price'))['avg_price'] or 50000
-        price_trends_data = []
-        for i in range(12):
-            year = current_year - 11 + i
-            variation = (-1 if i % 2 == 0 else 1) * (i * 2000)
-            price_trends_data.append({
-                'month': str(year),
-                'avg_price': round(max(10000, avg_price + variation), 2)
-            })
-    
-    stats = {
-        'total_cars': user_cars.count(),
-        'avg_price': round(user_cars.aggregate(avg_price=Avg('price'))['avg_price'] or 0, 2),
-        'max_price': user_cars.aggregate(max_price=Max('price'))['max_price'] or 0,
-        'min_price': user_cars.aggregate(min_price=Min('price'))['min_price'] or 0,
-        'avg_year': round(user_cars.aggregate(avg_year=Avg('year'))['avg_year'] or 0, 1),
-        'avg_mileage': round(user_cars.aggregate(avg_mileage=Avg('mileage'))['avg_mileage'] or 0, 0),
-        'cars_by_fuel': list(user_cars.values('fuel').annotate(count=Count('id')).order_by('-count')),
-        'cars_by_mark': list(user_cars.values('mark').annotate(count=Count('id')).order_by('-count')[:10]),
-        'cars_by_province': list(user_cars.values('province').annotate(count=Count('id')).order_by('-count')),
-        'price_trends': price_trends_data
-    }
-    
-    return Response(stats)
+    return Response(summary_statistics(request.user))
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@etag_per_user('distinct')
+@cache_per_user('distinct')
 def get_distinct_values(request):
     """
     Endpoint zwracający unikalne wartości marek i rodzajów paliwa samochodów.
     """
     user_cars = Car.objects.filter(user=request.user)
     try:
-        distinct_marks = user_cars.values_list('mark', flat=True).distinct()
-        distinct_marks = [mark for mark in distinct_marks if mark]
+        # Unikalne klucze z tabeli samochodów, nazwy ze słowników
+        mark_ids = user_cars.order_by().values_list('mark', flat=True).distinct()
+        distinct_marks = sorted(mark for mark in dimension_names(dimension_model('mark'), mark_ids).values() if mark)
         
-        distinct_fuels = user_cars.values_list('fuel', flat=True).distinct()
-        distinct_fuels = [fuel for fuel in distinct_fuels if fuel] 
+        fuel_ids = user_cars.order_by().values_list('fuel', flat=True).distinct()
+        distinct_fuels = sorted(fuel for fuel in dimension_names(dimension_model('fuel'), fuel_ids).values() if fuel)
         
         return Response({
             'marks': list(distinct_marks),
@@ -428,16 +506,33 @@ def get_distinct_values(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@etag_per_user('facets')
+@cache_per_user('facets')
+def get_facets(request):
+    """
+    Endpoint zwracający liczności (marka, paliwo, województwo, przedziały lat i cen)
+    dla samochodów spełniających bieżące filtry (te same parametry co eksport).
+    Liczności fasety pomijają jej własny filtr - przy wybranej marce widać też
+    liczby samochodów pozostałych marek.
+    """
+    try:
+        return Response(compute_facets(base_cars(request), facet_conditions(request)))
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+@etag_per_user('recent-cars')
+@cache_per_user('recent-cars')
 def get_recent_cars(request):
     """
     Endpoint zwracający ostatnie 5 dodanych samochodów.
     """
     user_cars = Car.objects.filter(user=request.user)
     try:
-        recent_cars = user_cars.all().order_by('-id')[:5]
-        serializer = CarSerializer(recent_cars, many=True)        
+        recent_cars = car_values(user_cars.order_by('-id')[:5])
         
-        return Response(serializer.data)
+        return Response(represent_cars(recent_cars))
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -484,6 +579,11 @@ class ChangePasswordView(APIView):
         if not new_password or len(new_password) < 6:
             return Response({'new_password': ['Nowe hasło musi mieć co najmniej 6 znaków.']}, status=status.HTTP_400_BAD_REQUEST)
 
-        user.set_password(new_password)
-        user.save()
-        return Response({'detail': 'Hasło zostało zmienione.'}, status=status.HTTP_200_OK)
\ No newline at end of file
+        # Nowy token zamiast starego - sesje z innych urządzeń tracą dostęp od razu
+        # (usunięcie tokenu unieważnia go też w pamięci procesów, authentication.py)
+        with transaction.atomic():
+            user.set_password(new_password)
+            user.save()
+            Token.objects.filter(user=user).delete()
+            token = Token.objects.create(user=user)
+        return Response({'detail': 'Hasło zostało zmienione.', 'token': token.key}, status=status.HTTP_200_OK)
\ No newline at end of file
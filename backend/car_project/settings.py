@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'django_prometheus',
@@ -25,6 +26,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django_prometheus.middleware.PrometheusBeforeMiddleware',
+    'car_app.instrumentation.QueryInstrumentationMiddleware',
+    'car_app.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -56,6 +59,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'car_project.wsgi.application'
 
+# Serwer ASGI (gunicorn z workerami uvicorn, gunicorn.conf.py) - eksporty i odczyty
+# zbiorcze działają wtedy jako widoki async (car_app/async_views.py)
+SERVE_ASGI = os.environ.get('SERVE_ASGI', 'False') == 'True'
+
 # Database
 DATABASES = {
     'default': {
@@ -65,9 +72,68 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.environ.get('POSTGRES_HOST', 'db'),
         'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # Trwałe połączenia - wątek gunicorn używa jednego połączenia przez wiele żądań
+        # zamiast łączyć się przy każdym; zerwane połączenie jest wykrywane przed użyciem.
+        # Pod ASGI każde żądanie dostaje nowy wątek, więc trwałe połączenie nie zostałoby
+        # ponownie użyte, a jedynie pozostało otwarte - domyślnie wyłączone.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0' if SERVE_ASGI else '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '5')),
+        },
     }
 }
 
+# Cache (wersje danych użytkowników, liczniki wyników, odpowiedzi API)
+# CACHE_BACKEND: locmem - jeden proces (gunicorn z kilkoma workerami domyślnie ustawia file
+# i odrzuca locmem), file - kilka procesów na jednym węźle,
+# redis - dowolny serwer zgodny z protokołem Redis; można też podać pełną ścieżkę klasy.
+# Backendy django_prometheus eksportują trafienia/chybienia cache na /metrics.
+CACHE_BACKENDS = {
+    'locmem': ('django_prometheus.cache.backends.locmem.LocMemCache', 'car-data'),
+    'file': ('django_prometheus.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'redis': ('django_prometheus.cache.backends.redis.RedisCache', 'redis://localhost:6379/1'),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS.get(
+    os.environ.get('CACHE_BACKEND', 'locmem'),
+    (os.environ.get('CACHE_BACKEND'), '')
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_DEFAULT_LOCATION),
+    }
+}
+
+# Czas życia odpowiedzi w cache; zmiana danych użytkownika unieważnia je wcześniej
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', '3600'))
+
+# Poziomy kompresji odpowiedzi GET (brotli 0-11, gzip 1-9) - kompresja przy każdym żądaniu, więc nie najwyższe
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+
+# Powyżej tej (szacowanej przez planer) liczby wierszy lista zwraca przybliżony count
+CAR_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get('CAR_COUNT_ESTIMATE_THRESHOLD', '1000000'))
+
+# Maksymalna liczba elementów w jednym żądaniu /api/cars/bulk/
+CAR_BULK_MAX_ITEMS = int(os.environ.get('CAR_BULK_MAX_ITEMS', '1000'))
+
+# Jak długo przechowywać ślady usuniętych samochodów (feed /api/cars/changes/);
+# starszy kursor dostaje 410 i klient pobiera dane od nowa
+CAR_DELETION_RETENTION_DAYS = int(os.environ.get('CAR_DELETION_RETENTION_DAYS', '30'))
+
+# Pamięć procesu dla uwierzytelnienia tokenem (CachedTokenAuthentication): liczba wpisów
+# i czas życia w sekundach; zmiana hasła lub tokenu unieważnia wpis natychmiast
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', '10000'))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.environ.get('AUTH_TOKEN_CACHE_TIMEOUT', '300'))
+
+# Instrumentacja zapytań SQL (car_app/instrumentation.py): zapytania dłuższe niż SLOW_QUERY_MS
+# są logowane w postaci znormalizowanej, z planem (EXPLAIN) przy SLOW_QUERY_EXPLAIN=True;
+# żądanie z więcej niż REQUEST_QUERY_WARNING zapytaniami (np. N+1) jest logowane osobno
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'False') == 'True'
+REQUEST_QUERY_WARNING = int(os.environ.get('REQUEST_QUERY_WARNING', '50'))
+
 # Auth settings
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -79,12 +145,17 @@ AUTH_PASSWORD_VALIDATORS = [
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'car_app.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON przez orjson - odpowiedzi identyczne jak z JSONRenderer DRF
+    'DEFAULT_RENDERER_CLASSES': [
+        'car_app.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
     'MAX_PAGE_SIZE': 250,
@@ -111,4 +182,15 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+# Media files (m.in. pliki oczekujące na import)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
+
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Import CSV
+CSV_IMPORT_CHUNK_SIZE = int(os.environ.get('CSV_IMPORT_CHUNK_SIZE', '50000'))
+IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', '2'))
+# Zadanie importu w stanie running bez postępu dłużej niż tyle sekund jest uznawane za porzucone
+# (restart lub awaria procesu) - musi przekraczać czas najdłuższej porcji i usuwania w trybie sync
+IMPORT_JOB_STALE_SECONDS = int(os.environ.get('IMPORT_JOB_STALE_SECONDS', '900'))
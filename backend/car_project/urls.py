@@ -1,8 +1,15 @@
 from django.contrib import admin
+from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 from django.urls import path, include
+from car_app.health import healthz, readyz
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('car_app.urls')),
+    path('healthz/', healthz, name='healthz'),
+    path('readyz/', readyz, name='readyz'),
     path('', include('django_prometheus.urls')),
-]
\ No newline at end of file
+]
+
+# Pliki statyczne panelu admina przy DEBUG także pod gunicorn (runserver serwuje je sam)
+urlpatterns += staticfiles_urlpatterns()
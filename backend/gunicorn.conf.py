@@ -0,0 +1,61 @@
+"""
+Konfiguracja gunicorn (tryb produkcyjny: Dockerfile, docker-compose).
+Każdą wartość można nadpisać zmienną środowiskową GUNICORN_*.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+
+# SERVE_ASGI=True: aplikacja ASGI w workerach uvicorn - eksporty i odczyty zbiorcze
+# jako widoki async, wolny klient nie zajmuje wątku (car_app/async_views.py). Domyślnie
+# WSGI: pod ASGI połączenia z bazą nie są trwałe dla całego ruchu (settings.CONN_MAX_AGE),
+# więc krótkie żądania (lista, szczegóły) obsługuje ok. 2,5x wolniej
+serve_asgi = os.environ.get('SERVE_ASGI', 'False') == 'True'
+wsgi_app = 'car_project.asgi:application' if serve_asgi else 'car_project.wsgi:application'
+
+# Widoki czekają głównie na bazę - proces na rdzeń (+1) i kilka wątków w każdym.
+# Każdy wątek trzyma własne trwałe połączenie z bazą (CONN_MAX_AGE), a każdy proces
+# dodatkowo IMPORT_JOB_WORKERS wątków importu: workers * (threads + 2) <= max_connections.
+# Pod ASGI liczba wątków nie jest ograniczona (wątek na żądanie synchroniczne),
+# a połączenia nie są trwałe - ich liczbę wyznacza liczba równoczesnych żądań.
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() + 1))
+worker_class = 'uvicorn_worker.UvicornWorker' if serve_asgi else 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Wersje danych i tokenów (unieważnianie cache odpowiedzi, ETag, uwierzytelnienia) muszą być
+# wspólne dla wszystkich procesów - locmem jest osobny w każdym z nich, więc przy kilku
+# workerach domyślnie cache plikowy (jeden węzeł), a jawne locmem jest odrzucane.
+# Zmienna jest ustawiana przed uruchomieniem workerów, więc settings.py ją odczyta.
+cache_backend = os.environ.setdefault('CACHE_BACKEND', 'file' if workers > 1 else 'locmem')
+if workers > 1 and 'locmem' in cache_backend.lower():
+    raise RuntimeError(
+        f'CACHE_BACKEND={cache_backend} jest osobny w każdym procesie - przy {workers} workerach '
+        'unieważnione tokeny i nieaktualne odpowiedzi byłyby nadal obsługiwane. '
+        'Użyj CACHE_BACKEND=file lub redis albo GUNICORN_WORKERS=1.'
+    )
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '60'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+reload = os.environ.get('GUNICORN_RELOAD', 'False') == 'True'
+accesslog = '-'
+errorlog = '-'
+# Bez preload_app - pula wątków importu i połączenia z bazą powstają osobno w każdym procesie
+
+# Metryki Prometheus ze wszystkich procesów - django_prometheus zbiera je z tego katalogu
+# przy /metrics. Zmienna musi być ustawiona przed pierwszym importem prometheus_client.
+prometheus_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'car-data-prometheus')
+)
+
+
+def on_starting(server):
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
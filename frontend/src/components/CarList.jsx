@@ -88,6 +88,7 @@ const CarList = () => {
 	});
 	const [distinctMarks, setDistinctMarks] = useState([]);
 	const [distinctFuels, setDistinctFuels] = useState([]);
+	const [facetCounts, setFacetCounts] = useState({ mark: {}, fuel: {} });
 	const [sortOption, setSortOption] = useState("");
 	const theme = useTheme();
 	const isMobile = useMediaQuery(theme.breakpoints.down("md"));
@@ -112,6 +113,37 @@ const CarList = () => {
 		fetchDistinctValues();
 	}, [getToken]);
 
+	useEffect(() => {
+		const fetchFacets = async () => {
+			try {
+				const queryParams = new URLSearchParams();
+				Object.entries(filters).forEach(([key, value]) => {
+					if (value !== "" && value !== null && value !== undefined) {
+						queryParams.append(key, value);
+					}
+				});
+				if (searchTerm.trim()) {
+					queryParams.append("search", searchTerm.trim());
+				}
+				const apiUrl =
+					process.env.REACT_APP_API_URL || "http://localhost:8000/api";
+				const response = await axios.get(
+					`${apiUrl}/facets/?${queryParams.toString()}`,
+					{ headers: { Authorization: `Token ${getToken()}` } }
+				);
+				const toCounts = (items) =>
+					Object.fromEntries((items || []).map((item) => [item.value, item.count]));
+				setFacetCounts({
+					mark: toCounts(response.data.mark),
+					fuel: toCounts(response.data.fuel)
+				});
+			} catch (err) {
+				console.error("Error fetching facets:", err);
+			}
+		};
+		fetchFacets();
+	}, [filters, searchTerm, getToken]);
+
 	useEffect(() => {
 		const fetchCars = async () => {
 			setError("");
@@ -475,7 +507,7 @@ const CarList = () => {
 											<MenuItem value=''>Wszystkie</MenuItem>
 											{memoizedMarks.map((mark) => (
 												<MenuItem key={mark} value={mark}>
-													{carBrandConverter(mark)}
+													{carBrandConverter(mark)} ({facetCounts.mark[mark] || 0})
 												</MenuItem>
 											))}
 										</Select>
@@ -526,7 +558,7 @@ const CarList = () => {
 											<MenuItem value=''>Wszystkie</MenuItem>
 											{memoizedFuels.map((fuel) => (
 												<MenuItem key={fuel} value={fuel}>
-													{fuelNameConverter(fuel)}
+													{fuelNameConverter(fuel)} ({facetCounts.fuel[fuel] || 0})
 												</MenuItem>
 											))}
 										</Select>
@@ -12,7 +12,9 @@ import {
 	ListItemIcon,
 	ListItemText,
 	Divider,
-	LinearProgress
+	LinearProgress,
+	Checkbox,
+	FormControlLabel
 } from "@mui/material";
 import CloudUploadIcon from "@mui/icons-material/CloudUpload";
 import CheckCircleIcon from "@mui/icons-material/CheckCircle";
@@ -22,17 +24,75 @@ import PageHeader from "../ui/PageHeader";
 import DataCard from "../ui/DataCard";
 import { useAuth } from "../hooks/useAuth";
 
+// Odstęp między zapytaniami o stan importu
+const POLL_INTERVAL_MS = 1000;
+// Limit czasu bez postępu - dłuższy niż IMPORT_JOB_STALE_SECONDS, po którym serwer sam
+// kończy porzucone zadanie, więc zwykle komunikat przychodzi z serwera
+const POLL_STALL_TIMEOUT_MS = 20 * 60 * 1000;
+// Kolejne nieudane zapytania (np. serwer niedostępny), po których przestajemy czekać
+const MAX_FAILED_POLLS = 30;
+
 const UploadCSV = ({ auth }) => {
 	const { getToken } = useAuth();
 	const [selectedFile, setSelectedFile] = useState(null);
 	const [isUploading, setIsUploading] = useState(false);
 	const [uploadProgress, setUploadProgress] = useState(0);
+	const [processing, setProcessing] = useState(false);
+	const [syncMode, setSyncMode] = useState(false);
 	const [uploadStatus, setUploadStatus] = useState({
 		success: false,
 		error: false,
 		message: ""
 	});
 
+	const pollImportJob = async (jobId) => {
+		// Import działa w tle na serwerze - odpytujemy o jego postęp
+		let lastProgress = null;
+		let lastChange = Date.now();
+		let failedPolls = 0;
+		while (true) {
+			let job;
+			try {
+				const response = await axios.get(
+					`http://localhost:8000/api/import-jobs/${jobId}/`,
+					{ headers: { Authorization: `Token ${getToken()}` } }
+				);
+				job = response.data;
+				failedPolls = 0;
+			} catch (error) {
+				// Zadanie nie istnieje lub brak dostępu - nie ma na co czekać
+				if (error.response && error.response.status < 500) {
+					throw error;
+				}
+				failedPolls += 1;
+				if (failedPolls >= MAX_FAILED_POLLS) {
+					return {
+						status: "failed",
+						error: "Utracono połączenie z serwerem podczas importu. Sprawdź listę samochodów i w razie potrzeby wgraj plik ponownie."
+					};
+				}
+				await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+				continue;
+			}
+			setUploadProgress(job.progress);
+			if (job.status === "done" || job.status === "failed") {
+				return job;
+			}
+			const progress = `${job.status}:${job.rows_processed}:${job.bytes_processed}`;
+			if (progress !== lastProgress) {
+				lastProgress = progress;
+				lastChange = Date.now();
+			} else if (Date.now() - lastChange > POLL_STALL_TIMEOUT_MS) {
+				return {
+					...job,
+					status: "failed",
+					error: "Import nie robi postępów - serwer mógł zostać zrestartowany. Sprawdź listę samochodów i w razie potrzeby wgraj plik ponownie."
+				};
+			}
+			await new Promise((resolve) => setTimeout(resolve, POLL_INTERVAL_MS));
+		}
+	};
+
 	const handleFileChange = (event) => {
 		setSelectedFile(event.target.files[0]);
 		setUploadStatus({
@@ -66,25 +126,50 @@ const UploadCSV = ({ auth }) => {
 		setUploadProgress(0);
 		const formData = new FormData();
 		formData.append("file", selectedFile);
+		if (syncMode) {
+			formData.append("mode", "sync");
+		}
 
 		try {
-			await axios.post("http://localhost:8000/api/upload-csv/", formData, {
-				headers: {
-					"Content-Type": "multipart/form-data",
-					Authorization: `Token ${getToken()}`
-				},
-				onUploadProgress: (progressEvent) => {
-					const percentCompleted = Math.round(
-						(progressEvent.loaded * 100) / progressEvent.total
-					);
-					setUploadProgress(percentCompleted);
+			const response = await axios.post(
+				"http://localhost:8000/api/upload-csv/",
+				formData,
+				{
+					headers: {
+						"Content-Type": "multipart/form-data",
+						Authorization: `Token ${getToken()}`
+					},
+					onUploadProgress: (progressEvent) => {
+						const percentCompleted = Math.round(
+							(progressEvent.loaded * 100) / progressEvent.total
+						);
+						setUploadProgress(percentCompleted);
+					}
 				}
-			});
+			);
+
+			setProcessing(true);
+			setUploadProgress(0);
+			const job = await pollImportJob(response.data.id);
+
+			if (job.status === "failed") {
+				setUploadStatus({
+					success: false,
+					error: true,
+					message: job.error || "Błąd przetwarzania pliku."
+				});
+				return;
+			}
 
+			const result = job.result || {};
 			setUploadStatus({
 				success: true,
 				error: false,
-				message: "Plik został pomyślnie przesłany i przetworzony!"
+				message: `Plik został pomyślnie przesłany i przetworzony! Zaimportowano ${job.rows_processed} rekordów (nowe: ${
+					result.inserted ?? 0
+				}, zmienione: ${result.updated ?? 0}, bez zmian: ${result.unchanged ?? 0})${
+					result.deleted_from_feed ? `, usunięto ${result.deleted_from_feed} nieobecnych w pliku` : ""
+				}${job.rows_rejected ? `, odrzucono ${job.rows_rejected}` : ""}.`
 			});
 			setSelectedFile(null);
 			document.getElementById("csv-file-input").value = "";
@@ -101,6 +186,7 @@ const UploadCSV = ({ auth }) => {
 			});
 		} finally {
 			setIsUploading(false);
+			setProcessing(false);
 		}
 	};
 
@@ -205,7 +291,9 @@ const UploadCSV = ({ auth }) => {
 										variant='body2'
 										color='text.secondary'
 										gutterBottom>
-										Przesyłanie i przetwarzanie pliku...
+										{processing
+											? "Przetwarzanie pliku..."
+											: "Przesyłanie pliku..."}
 									</Typography>
 									<LinearProgress
 										variant='determinate'
@@ -221,6 +309,17 @@ const UploadCSV = ({ auth }) => {
 								</Box>
 							)}
 
+							<FormControlLabel
+								control={
+									<Checkbox
+										checked={syncMode}
+										onChange={(event) => setSyncMode(event.target.checked)}
+										disabled={isUploading}
+									/>
+								}
+								label='Usuń samochody nieobecne w pliku (synchronizacja)'
+							/>
+
 							<Button
 								variant='contained'
 								color='primary'
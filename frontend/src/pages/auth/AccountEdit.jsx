@@ -52,7 +52,7 @@ export default function ProfilePage() {
 	const [deleteDialogOpen, setDeleteDialogOpen] = useState(false);
 	const [confirmDeleteText, setConfirmDeleteText] = useState("");
 	const [loading, setLoading] = useState(false);
-	const { getToken, refreshUser } = useAuth();
+	const { getToken, refreshUser, login } = useAuth();
 
 	useEffect(() => {
 		const fetchUserData = async () => {
@@ -232,7 +232,7 @@ export default function ProfilePage() {
 				Authorization: `Token ${getToken()}`
 			};
 
-			await axios.put(
+			const response = await axios.put(
 				"http://localhost:8000/api/users/change-password/",
 				{
 					current_password: passwordForm.currentPassword,
@@ -243,6 +243,9 @@ export default function ProfilePage() {
 				}
 			);
 
+			// Zmiana hasła unieważnia poprzedni token
+			login(response.data.token);
+
 			setPasswordForm({
 				currentPassword: "",
 				newPassword: "",